@@ -0,0 +1,10 @@
+import os
+import sys
+
+# `python -m ZOMBIManager ...` from the repo root: the modules here import
+# `utilities` as a top-level package, same as when running zombiManager.py
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from zombiCli import main
+
+sys.exit(main())
@@ -0,0 +1,58 @@
+import traceback
+from typing import Optional
+
+from PySide6.QtCore import QThread, Signal
+
+from utilities import bfz
+from utilities import contentHash
+from utilities import formats
+
+# ----------------- Background loading -----------------
+# Tables are decoded on this thread and handed to the GUI straight away, chunks
+# then keep decompressing on BFZArchive's fill workers. Entries the user clicks
+# in the meantime jump the queue (see BFZArchive.start_background_fill). Once
+# everything is in memory the entries get sniffed (formats) and hashed
+# (contentHash) before loaded.
+
+class ArchiveLoader(QThread):
+    tablesReady = Signal(object)   # BFZArchive, tree can be shown
+    progress = Signal(int, int)    # chunks done, total
+    loaded = Signal(object)        # BFZArchive, everything decompressed
+    failed = Signal(str)
+
+    def __init__(self, path: str, cache: Optional[bfz.ChunkCache] = None,
+                 workers: Optional[int] = None, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.archive = bfz.BFZArchive(path, cache=cache, workers=workers)
+        self._canceled = False
+
+    def run(self):
+        try:
+            self.archive.parse(lazy=True)
+            if self._canceled: return
+            self.tablesReady.emit(self.archive)
+            self.archive.start_background_fill(
+                progress=lambda done, total, _label: self.progress.emit(done, total)
+            )
+            if self._canceled:
+                self.archive.cancel_fill(); return
+            self.archive.wait_fill()
+            if self._canceled: return
+            formats.sniff_archive(self.archive)
+            # Content hashes (free when the index cache has them) mark variants identical/divergent
+            contentHash.hash_archive(self.archive, progress=self._check_canceled)
+            if not self._canceled:
+                self.loaded.emit(self.archive)
+        except Exception as e:
+            if not self._canceled:
+                self.failed.emit(f"{e}\n\n{traceback.format_exc()}")
+
+    def _check_canceled(self, *_args):
+        if self._canceled:
+            raise bfz.OperationCanceled()
+
+    def cancel(self):
+        self._canceled = True
+        self.archive.cancel_fill()
+        self.wait()
@@ -0,0 +1,460 @@
+import bisect
+import fnmatch
+import re
+from typing import Dict, Iterable, List, Optional, Set
+
+from PySide6.QtCore import (
+    QAbstractItemModel, QModelIndex, Qt
+)
+from PySide6.QtGui import QColor
+
+from utilities import archiveMount
+from utilities import bfz
+from utilities import contentHash
+from utilities import formats
+
+# ----------------- Archive tree model -----------------
+# The tree is never built up front: entry names are normalized and sorted once,
+# a folder's children are the contiguous run of paths under its prefix, and
+# nodes only get created when Qt asks to expand their parent. Filtering works
+# off the same sorted name list, so it never has to load the tree either.
+
+COLUMNS = ["Name", "Size", "Type"]
+COL_NAME, COL_SIZE, COL_TYPE = range(3)
+# Only shown for an ArchiveMount: the archive each path comes from
+COL_SOURCE = 3
+SOURCE_COLUMN = "Source"
+
+# Same-named entries, once content hashes are known
+IDENTICAL_COLOR = QColor(150, 150, 150)
+DIVERGENT_COLOR = QColor(230, 170, 80)
+
+def normalize_name(name: str) -> str:
+    return name.replace("\\", "/").strip("/")
+
+class NameIndex:
+    """Sorted unique normalized paths -> the entry indices (variants) behind each one."""
+    def __init__(self, archive: bfz.BFZArchive):
+        grouped: Dict[str, List[int]] = {}
+        for i, name in enumerate(archive.names):
+            path = normalize_name(name)
+            if path:
+                grouped.setdefault(path, []).append(i)
+        self.paths: List[str] = sorted(grouped)
+        self.entries: List[List[int]] = [grouped[p] for p in self.paths]
+        self.lower: List[str] = [p.lower() for p in self.paths]
+        self._path_of: Optional[List[int]] = None
+
+    def path_of(self, entry: int) -> int:
+        """Path index of an archive entry, -1 for unnamed ones."""
+        if self._path_of is None:
+            path_of = [-1] * sum(len(e) for e in self.entries)
+            for pi, entries in enumerate(self.entries):
+                for e in entries:
+                    path_of[e] = pi
+            self._path_of = path_of
+        return self._path_of[entry] if entry < len(self._path_of) else -1
+
+    def prefix_range(self, prefix: str, lo: int = 0, hi: Optional[int] = None):
+        """[lo, hi) of the paths starting with prefix ('' is everything)."""
+        if hi is None:
+            hi = len(self.paths)
+        if not prefix:
+            return lo, hi
+        start = bisect.bisect_left(self.paths, prefix, lo, hi)
+        # '/' + 1 == '0', so this is the first path past the "<prefix>" run
+        end = bisect.bisect_left(self.paths, prefix[:-1] + chr(ord(prefix[-1]) + 1), start, hi)
+        return start, end
+
+    def match(self, pattern: str) -> List[int]:
+        """Indices of the paths matching a case-insensitive substring, or a glob with * ? [."""
+        p = normalize_name(pattern).lower()
+        if any(c in p for c in "*?["):
+            if not p.startswith("*"):
+                p = "*" + p
+            rx = re.compile(fnmatch.translate(p))
+            return [i for i, n in enumerate(self.lower) if rx.match(n)]
+        return [i for i, n in enumerate(self.lower) if p in n]
+
+class _Node:
+    __slots__ = ("name", "prefix", "parent", "row", "lo", "hi", "path_index",
+                 "entry_index", "size", "kind", "children", "visible")
+
+    def __init__(self, name: str, parent: Optional["_Node"], prefix: str = "",
+                 lo: int = 0, hi: int = 0, path_index: int = -1, entry_index: int = -1):
+        self.name = name
+        self.prefix = prefix          # "a/b/" for folders
+        self.parent = parent
+        self.row = 0                  # row among the parent's visible children
+        self.lo, self.hi = lo, hi     # path range of a folder's contents
+        self.path_index = path_index  # leaf: row in NameIndex.paths
+        self.entry_index = entry_index  # variant or single-entry leaf: archive entry
+        self.size = -1
+        self.kind = ""                # Type column, see formats
+        self.children: Optional[List["_Node"]] = None  # all loaded children, sorted
+        self.visible: List["_Node"] = []               # the ones passing the filter
+
+    @property
+    def is_folder(self) -> bool:
+        return self.path_index < 0 and self.entry_index < 0
+
+    @property
+    def is_variant(self) -> bool:
+        return self.path_index < 0 and self.entry_index >= 0
+
+class ArchiveTreeModel(QAbstractItemModel):
+    """
+    Lazy tree over a NameIndex. Filtering happens here too, from the name index
+    rather than a QSortFilterProxyModel, which would have to walk (and load)
+    every node through Python calls.
+    """
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.archive: Optional[bfz.BFZArchive] = None
+        self.index_: Optional[NameIndex] = None
+        self.columns = list(COLUMNS)
+        self.root = _Node("", None)
+        self.root.children = []
+        self._sort_column = COL_NAME
+        self._sort_order = Qt.AscendingOrder
+        # Filter state: None means everything is shown
+        self.pattern = ""
+        # Paths of the entries a content search found (see contentSearch), None when not searching
+        self.content_paths: Optional[Set[int]] = None
+        self.matched_paths: Optional[Set[int]] = None
+        self.visible_folders: Set[str] = set()
+        # Payload group of each variant, per path index, filled as rows get shown
+        self._variant_groups: Dict[int, List[int]] = {}
+
+    # ----- setup -----
+    def set_archive(self, archive: Optional[bfz.BFZArchive]):
+        self.beginResetModel()
+        self.archive = archive
+        self.index_ = NameIndex(archive) if archive else None
+        self.columns = COLUMNS + [SOURCE_COLUMN] if isinstance(archive, archiveMount.ArchiveMount) else list(COLUMNS)
+        if self._sort_column >= len(self.columns):
+            # Was sorted by Source, which a single archive doesn't have
+            self._sort_column = COL_NAME
+        self.root = _Node("", None, "", 0, len(self.index_.paths) if self.index_ else 0)
+        self.root.children = []
+        self.matched_paths, self.visible_folders = None, set()
+        self.content_paths = None
+        self._variant_groups = {}
+        if archive:
+            self._load_children(self.root)
+            self._apply_pattern()
+        self.endResetModel()
+
+    def clear(self):
+        self.set_archive(None)
+
+    def refresh_hashes(self):
+        """The archive's hashes arrived (or changed): variants get marked identical/divergent."""
+        self._variant_groups = {}
+        if self.root.visible:
+            self.dataChanged.emit(self.index(0, 0), self.index(len(self.root.visible) - 1, len(self.columns) - 1))
+
+    def refresh_types(self):
+        """The archive's contents were sniffed (formats): relabel the loaded rows, resorting them if needed."""
+        if self.archive is None:
+            return
+        for node in self._loaded_nodes():
+            for child in node.children:
+                if child.is_variant:
+                    child.kind = self._kind(child.entry_index, node.name)
+                elif not child.is_folder:
+                    child.kind = self._kind(self.index_.entries[child.path_index][0], child.name)
+        self.sort(self._sort_column, self._sort_order)
+
+    def _kind(self, entry: int, name: str) -> str:
+        types = self.archive.types
+        fmt = formats.FORMATS[types[entry]] if types is not None else formats.by_extension(name)
+        return formats.type_label(fmt, name)
+
+    def _source_entry(self, node: _Node) -> int:
+        """Archive entry deciding a row's Source (all variants of a path come from one archive), -1 for folders."""
+        if node.entry_index >= 0:
+            return node.entry_index
+        return self.index_.entries[node.path_index][0] if node.path_index >= 0 else -1
+
+    def source_text(self, node: _Node) -> str:
+        entry = self._source_entry(node)
+        return self.archive.source(entry).name if entry >= 0 else ""
+
+    # ----- variants -----
+    def variant_groups(self, path_index: int) -> Optional[List[int]]:
+        """Payload group of each same-named entry (0 = same bytes as the first), None without hashes."""
+        if self.archive is None or self.archive.hashes is None:
+            return None
+        groups = self._variant_groups.get(path_index)
+        if groups is None:
+            groups = contentHash.variant_groups(self.archive.hashes, self.index_.entries[path_index])
+            self._variant_groups[path_index] = groups
+        return groups
+
+    # ----- lazy children -----
+    def _make_children(self, node: _Node) -> List[_Node]:
+        idx, arch = self.index_, self.archive
+        children: List[_Node] = []
+        if node.path_index >= 0:
+            # Leaf with several same-named entries: one child per variant
+            for n, e in enumerate(idx.entries[node.path_index]):
+                child = _Node(f"[Variant #{n+1}]", node, entry_index=e)
+                child.size = int(arch.sizes[e])
+                child.kind = self._kind(e, node.name)
+                children.append(child)
+            return children
+        plen = len(node.prefix)
+        i, hi = node.lo, node.hi
+        while i < hi:
+            rest = idx.paths[i][plen:]
+            seg, sep, _ = rest.partition("/")
+            if sep:
+                prefix = node.prefix + seg + "/"
+                lo, end = idx.prefix_range(prefix, i, hi)
+                children.append(_Node(seg, node, prefix, lo, end))
+                i = end
+            else:
+                entries = idx.entries[i]
+                child = _Node(seg, node, path_index=i,
+                              entry_index=entries[0] if len(entries) == 1 else -1)
+                child.size = int(arch.sizes[entries[0]])
+                child.kind = self._kind(entries[0], seg)
+                children.append(child)
+                i += 1
+        return children
+
+    def _load_children(self, node: _Node):
+        node.children = self._make_children(node)
+        self._sort_list(node.children)
+        self._update_visible(node)
+
+    def _has_children(self, node: _Node) -> bool:
+        if node.is_folder:
+            return node.hi > node.lo
+        return node.path_index >= 0 and len(self.index_.entries[node.path_index]) > 1
+
+    # ----- filtering -----
+    def _accepts(self, node: _Node) -> bool:
+        if self.matched_paths is None or node.is_variant:
+            return True
+        if node.is_folder:
+            return node.prefix in self.visible_folders
+        return node.path_index in self.matched_paths
+
+    def _update_visible(self, node: _Node):
+        if self.matched_paths is None:
+            node.visible = node.children
+        else:
+            node.visible = [c for c in node.children if self._accepts(c)]
+        for row, child in enumerate(node.visible):
+            child.row = row
+
+    def _apply_pattern(self):
+        if self.index_ is None or (not self.pattern and self.content_paths is None):
+            self.matched_paths, self.visible_folders = None, set()
+        else:
+            idx = self.index_
+            if self.content_paths is None:
+                hits = idx.match(self.pattern)
+            elif self.pattern:
+                hits = sorted(self.content_paths.intersection(idx.match(self.pattern)))
+            else:
+                hits = sorted(self.content_paths)
+            folders: Set[str] = set()
+            for i in hits:
+                path = idx.paths[i]
+                pos = path.find("/")
+                while pos != -1:
+                    folders.add(path[:pos+1])
+                    pos = path.find("/", pos + 1)
+            self.matched_paths, self.visible_folders = set(hits), folders
+        for node in self._loaded_nodes():
+            self._update_visible(node)
+
+    def set_pattern(self, pattern: str) -> int:
+        """Filter by substring/glob, returns the number of matching paths (-1 when cleared)."""
+        self.beginResetModel()
+        self.pattern = pattern.strip()
+        self._apply_pattern()
+        self.endResetModel()
+        return -1 if self.matched_paths is None else len(self.matched_paths)
+
+    def set_content_filter(self, entries: Optional[Iterable[int]]) -> int:
+        """Only show the paths of these entries (on top of the name filter), None to show everything again."""
+        self.beginResetModel()
+        if entries is None or self.index_ is None:
+            self.content_paths = None
+        else:
+            self.content_paths = {self.index_.path_of(e) for e in entries} - {-1}
+        self._apply_pattern()
+        self.endResetModel()
+        return -1 if self.matched_paths is None else len(self.matched_paths)
+
+    def _loaded_nodes(self):
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node.children is not None:
+                yield node
+                stack.extend(node.children)
+
+    # ----- sorting (model side, only touches loaded nodes) -----
+    def _sort_key(self, node: _Node):
+        if self._sort_column == COL_SIZE:
+            return (node.size, node.name.lower())
+        if self._sort_column == COL_TYPE:
+            return (node.kind, node.name.lower())
+        if self._sort_column == COL_SOURCE:
+            return (self.source_text(node), node.name.lower())
+        return (node.name.lower(), node.name)
+
+    def _sort_list(self, children: List[_Node]):
+        # Variants keep archive order
+        if children and not children[0].is_variant:
+            children.sort(key=self._sort_key, reverse=self._sort_order == Qt.DescendingOrder)
+
+    def sort(self, column: int, order=Qt.AscendingOrder):
+        self._sort_column, self._sort_order = column, order
+        self.layoutAboutToBeChanged.emit()
+        persistent = self.persistentIndexList()
+        nodes = [(p.internalPointer(), p.column()) for p in persistent]
+        for node in self._loaded_nodes():
+            self._sort_list(node.children)
+            self._update_visible(node)
+        self.changePersistentIndexList(
+            persistent, [self.createIndex(n.row, c, n) for n, c in nodes]
+        )
+        self.layoutChanged.emit()
+
+    # ----- QAbstractItemModel -----
+    def _node(self, index: QModelIndex) -> _Node:
+        return index.internalPointer() if index.isValid() else self.root
+
+    def index(self, row: int, column: int, parent: QModelIndex = QModelIndex()) -> QModelIndex:
+        node = self._node(parent)
+        if not (0 <= row < len(node.visible)):
+            return QModelIndex()
+        return self.createIndex(row, column, node.visible[row])
+
+    def parent(self, index: QModelIndex = QModelIndex()) -> QModelIndex:
+        if not index.isValid():
+            return QModelIndex()
+        parent = index.internalPointer().parent
+        if parent is None or parent is self.root:
+            return QModelIndex()
+        return self.createIndex(parent.row, 0, parent)
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        if parent.column() > 0:
+            return 0
+        return len(self._node(parent).visible)
+
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return len(self.columns)
+
+    def hasChildren(self, parent: QModelIndex = QModelIndex()) -> bool:
+        node = self._node(parent)
+        if node.children is not None:
+            return bool(node.visible)
+        return self.index_ is not None and self._has_children(node)
+
+    def canFetchMore(self, parent: QModelIndex) -> bool:
+        node = self._node(parent)
+        return node.children is None and self.index_ is not None and self._has_children(node)
+
+    def fetchMore(self, parent: QModelIndex):
+        node = self._node(parent)
+        if node.children is not None:
+            return
+        children = self._make_children(node)
+        self._sort_list(children)
+        visible = children if self.matched_paths is None else [c for c in children if self._accepts(c)]
+        if not visible:
+            node.children, node.visible = children, visible
+            return
+        self.beginInsertRows(parent, 0, len(visible) - 1)
+        node.children = children
+        self._update_visible(node)
+        self.endInsertRows()
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        node: _Node = index.internalPointer()
+        col = index.column()
+        if role == Qt.DisplayRole:
+            if col == COL_NAME:
+                if node.is_variant:
+                    groups = self.variant_groups(node.parent.path_index)
+                    if groups is not None:
+                        # Variants keep archive order, so row is the variant number
+                        return f"{node.name} identical" if max(groups) == 0 else f"{node.name} payload {groups[node.row] + 1}"
+                return node.name
+            if col == COL_SIZE:
+                return f"{node.size:,}" if node.size >= 0 else ""
+            if col == COL_TYPE:
+                return node.kind
+            if col == COL_SOURCE:
+                return self.source_text(node)
+        elif role == Qt.ToolTipRole and col == COL_SOURCE:
+            entry = self._source_entry(node)
+            if entry < 0:
+                return None
+            prov = self.archive.provenance(entry)
+            tip = prov[0][0].path
+            if len(prov) > 1:
+                tip += "\noverrides " + ", ".join(mp.name for mp, _ in prov[1:])
+            return tip
+        elif role == Qt.UserRole and col == COL_NAME:
+            return self.entry_for(index)
+        elif role in (Qt.ForegroundRole, Qt.ToolTipRole) and col == COL_NAME and node.path_index >= 0 \
+                and len(self.index_.entries[node.path_index]) > 1:
+            groups = self.variant_groups(node.path_index)
+            if groups is None:
+                return None
+            distinct = max(groups) + 1
+            if role == Qt.ForegroundRole:
+                return IDENTICAL_COLOR if distinct == 1 else DIVERGENT_COLOR
+            return (f"{len(groups)} variants, all identical" if distinct == 1
+                    else f"{len(groups)} variants, {distinct} different payloads")
+        elif role == Qt.TextAlignmentRole and col == COL_SIZE:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        return None
+
+    def headerData(self, section: int, orientation, role: int = Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.columns[section]
+        return None
+
+    # ----- helpers for the window -----
+    def entry_for(self, index: QModelIndex) -> Optional[bfz.BFZFileEntry]:
+        if not index.isValid() or self.archive is None:
+            return None
+        node: _Node = index.internalPointer()
+        return self.archive.entry(node.entry_index) if node.entry_index >= 0 else None
+
+    def index_for_path(self, name: str) -> QModelIndex:
+        """Index of a (visible) entry's leaf, loading the folders on the way."""
+        parts = [p for p in normalize_name(name).split("/") if p]
+        node, index = self.root, QModelIndex()
+        for n, part in enumerate(parts):
+            if node.children is None:
+                self.fetchMore(index)
+            want_folder = n < len(parts) - 1
+            match = next((c for c in node.visible if c.name == part and c.is_folder == want_folder), None)
+            if match is None:
+                return QModelIndex()
+            node, index = match, self.createIndex(match.row, 0, match)
+        return index
+
+    def index_for_entry(self, entry: int) -> QModelIndex:
+        """Index of one archive entry: its leaf, or its variant row when the name is shared."""
+        index = self.index_for_path(self.archive.names[entry]) if self.archive else QModelIndex()
+        node: Optional[_Node] = index.internalPointer() if index.isValid() else None
+        if node is None or node.entry_index == entry or not self._has_children(node):
+            return index
+        if node.children is None:
+            self.fetchMore(index)
+        match = next((c for c in node.visible if c.entry_index == entry), None)
+        return self.createIndex(match.row, 0, match) if match else index
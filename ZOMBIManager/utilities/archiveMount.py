@@ -0,0 +1,272 @@
+import bisect
+import os
+from dataclasses import dataclass, field
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from utilities import assetIndex
+from utilities import bfz
+from utilities import contentHash
+from utilities import formats
+
+# ----------------- Archive mount -----------------
+# Several .bfz opened at once as one namespace, the way a level's wor sits on
+# top of the _kit_ wors it uses. Each path comes from the highest priority
+# archive that has it, the others' copies stay reachable through provenance().
+# To the rest of the code the mount looks like a lazily parsed BFZArchive: the
+# archives' streams are laid out one after the other, so offsets, sizes and
+# read_range_view work unchanged. Nothing gets decompressed up front, every
+# read goes through one shared, byte-budgeted chunk cache, so mounting ten
+# archives doesn't cost ten caches (or ten unpacked copies) of RAM.
+
+def normalize_key(name: str) -> str:
+    """Paths override each other case-insensitively, whatever the slashes."""
+    return name.replace("\\", "/").strip("/").lower()
+
+def is_kit(path: str, wor_map: Optional[Dict[str, str]] = None) -> bool:
+    """A shared _kit_ wor (from Wor Descriptors.txt), the rest are levels and cinematics."""
+    wor = assetIndex.wor_id_for(path)
+    source = (wor_map or {}).get(wor, "") if wor else ""
+    return "/_kit" in source.replace("\\", "/").lower() or os.path.basename(path).lower().startswith("_kit")
+
+def kits_first(paths: Sequence[str], wor_map: Optional[Dict[str, str]] = None) -> List[str]:
+    """Default override order: kits at the bottom, everything else on top of them, otherwise as given."""
+    if wor_map is None:
+        wor_map = assetIndex.parse_wor_descriptors()
+    return sorted(paths, key=lambda p: not is_kit(p, wor_map))
+
+@dataclass
+class MountPoint:
+    path: str
+    archive: bfz.BFZArchive
+    priority: int                # higher overrides lower
+    seq: int = 0                 # mount order, breaks priority ties (later wins)
+    base: int = 0                # where its stream starts in the mount's
+    lookup: Dict[str, List[int]] = field(default_factory=dict)  # path key -> its entries
+
+    @property
+    def name(self) -> str:
+        return os.path.basename(self.path)
+
+    def entry(self, i: int) -> bfz.BFZFileEntry:
+        return self.archive.entry(i)
+
+class ArchiveMount:
+    """Several archives merged into one read-only, BFZArchive-like view."""
+    def __init__(self, cache: Optional[bfz.ChunkCache] = None, workers: Optional[int] = None,
+                 use_index_cache: bool = True):
+        self.cache = cache if cache is not None else bfz.shared_chunk_cache()
+        self.workers = workers
+        self.use_index_cache = use_index_cache
+        self.mounts: List[MountPoint] = []
+        self._seq = 0
+        # Same surface as a lazy BFZArchive
+        self.lazy = True
+        self.memory = None
+        self.fill_pending = False
+        self.index_cache_hit = False
+        self.file_entries = bfz.BFZEntryList(self)
+        self._merge()
+
+    # ----- mounting -----
+    @property
+    def path(self) -> str:
+        """The top archive, for window titles and default file names."""
+        return self.order[0].path if self.mounts else ""
+
+    @property
+    def order(self) -> List[MountPoint]:
+        """Mount points, the one that wins first."""
+        return sorted(self.mounts, key=lambda m: (m.priority, m.seq), reverse=True)
+
+    def _add(self, path: str, priority: Optional[int]) -> MountPoint:
+        if self.find(path) is not None:
+            raise ValueError(f"{os.path.basename(path)} is already mounted")
+        arch = bfz.BFZArchive(path, cache=self.cache, workers=self.workers, use_index_cache=self.use_index_cache)
+        # Tables only, chunks get decompressed when something reads them
+        arch.parse(lazy=True)
+        if priority is None:
+            priority = max((m.priority for m in self.mounts), default=-1) + 1
+        lookup: Dict[str, List[int]] = {}
+        for i, name in enumerate(arch.names):
+            key = normalize_key(name)
+            if key:
+                lookup.setdefault(key, []).append(i)
+        mp = MountPoint(path, arch, priority, self._seq, lookup=lookup)
+        self._seq += 1
+        self.mounts.append(mp)
+        return mp
+
+    def mount(self, path: str, priority: Optional[int] = None) -> MountPoint:
+        """Add an archive, by default on top of everything mounted so far."""
+        mp = self._add(path, priority)
+        self._merge()
+        return mp
+
+    def mount_all(self, paths: Sequence[str], progress: Optional[bfz.ProgressCallback] = None):
+        """Mount in order, each one overriding the ones before it."""
+        label = "Mounting archives…"
+        try:
+            for n, path in enumerate(paths):
+                if progress:
+                    progress(n, len(paths), label)
+                self._add(path, None)
+        finally:
+            self._merge()
+        if progress:
+            progress(len(paths), len(paths), label)
+
+    def unmount(self, path: str):
+        mp = self.find(path)
+        if mp is None:
+            raise ValueError(f"{os.path.basename(path)} is not mounted")
+        self.mounts.remove(mp)
+        mp.archive.close(); mp.archive.drop_cached_chunks()
+        self._merge()
+
+    def set_order(self, paths: Sequence[str]):
+        """Reprioritize the mounted archives, later ones override earlier ones."""
+        mps = [self.find(p) for p in paths]
+        if None in mps or len(set(map(id, mps))) != len(self.mounts):
+            raise ValueError("set_order needs every mounted archive exactly once")
+        for priority, mp in enumerate(mps):
+            mp.priority = priority
+        self._merge()
+
+    def set_priority(self, path: str, priority: int):
+        mp = self.find(path)
+        if mp is None:
+            raise ValueError(f"{os.path.basename(path)} is not mounted")
+        mp.priority = priority
+        self._merge()
+
+    def find(self, path: str) -> Optional[MountPoint]:
+        path = os.path.abspath(path)
+        return next((m for m in self.mounts if os.path.abspath(m.path) == path), None)
+
+    def close(self):
+        """Close every archive, their chunks stay in the shared cache until evicted."""
+        for mp in self.mounts:
+            mp.archive.close()
+
+    # ----- merged view -----
+    def _merge(self):
+        """Rebuild the merged tables: every path key from its winning archive, with all its variants."""
+        base = 0
+        for mp in self.mounts:
+            mp.base = base
+            base += mp.archive.data_size
+        self.data_size = base
+        self._bases = [mp.base for mp in self.mounts]
+
+        claimed = set()
+        picked: List[Tuple[int, List[int]]] = []
+        for mp in self.order:
+            rows = []
+            for key, entries in mp.lookup.items():
+                if key not in claimed:
+                    claimed.add(key)
+                    rows.extend(entries)
+            picked.append((self.mounts.index(mp), rows))
+
+        n = sum(len(rows) for _, rows in picked)
+        self.names: List[str] = []
+        self.sources = np.zeros(n, dtype=np.int32)   # index into self.mounts
+        self.local = np.zeros(n, dtype=np.int64)     # entry in that archive
+        self.offsets = np.zeros(n, dtype=np.uint64)
+        self.sizes = np.zeros(n, dtype=np.uint64)
+        self.types: Optional[np.ndarray] = np.zeros(n, dtype=np.uint8)
+        self.hashes: Optional[np.ndarray] = None
+        have_hashes = all(mp.archive.hashes is not None for mp in self.mounts)
+        hashes = np.zeros((n, contentHash.HASH_SIZE), dtype=np.uint8) if have_hashes else None
+        pos = 0
+        for m, rows in picked:
+            mp, sel = self.mounts[m], np.asarray(rows, dtype=np.int64)
+            arch, end = mp.archive, pos + len(rows)
+            names = arch.names
+            self.names.extend(names[i] for i in rows)
+            self.sources[pos:end] = m
+            self.local[pos:end] = sel
+            self.offsets[pos:end] = arch.offsets[sel] + np.uint64(mp.base)
+            self.sizes[pos:end] = arch.sizes[sel]
+            # Sniffed codes where the archive's been looked at before (index cache), extensions elsewhere
+            types = arch.types if arch.types is not None else formats.extension_codes(names)
+            self.types[pos:end] = types[sel]
+            if hashes is not None:
+                hashes[pos:end] = arch.hashes[sel]
+            pos = end
+        self.hashes = hashes
+
+    def entry(self, i: int) -> bfz.BFZFileEntry:
+        return bfz.BFZFileEntry(self.names[i], int(self.offsets[i]), int(self.sizes[i]), i)
+
+    def source(self, i: int) -> MountPoint:
+        """The archive entry i comes from."""
+        return self.mounts[self.sources[i]]
+
+    def local_entry(self, i: int) -> bfz.BFZFileEntry:
+        """Entry i as its own archive knows it."""
+        return self.source(i).entry(int(self.local[i]))
+
+    def provenance(self, i: int) -> List[Tuple[MountPoint, List[int]]]:
+        """Every mounted archive holding entry i's path with its entries there, the winning one first."""
+        key = normalize_key(self.names[i])
+        return [(mp, mp.lookup[key]) for mp in self.order if key in mp.lookup]
+
+    def resolve(self, name: str) -> Optional[int]:
+        """Merged entry index of a path (the first variant), None when no archive has it."""
+        key = normalize_key(name)
+        mp = next((m for m in self.order if key in m.lookup), None)
+        if mp is None:
+            return None
+        m, local = self.mounts.index(mp), mp.lookup[key][0]
+        hit = np.flatnonzero((self.sources == m) & (self.local == local))
+        return int(hit[0]) if len(hit) else None
+
+    def overridden(self) -> np.ndarray:
+        """Per merged entry: how many lower priority archives also have its path."""
+        counts = np.zeros(len(self.names), dtype=np.int32)
+        for i, name in enumerate(self.names):
+            key = normalize_key(name)
+            counts[i] = sum(key in mp.lookup for mp in self.mounts) - 1
+        return counts
+
+    # ----- reading -----
+    def entry_key(self, entry: bfz.BFZFileEntry) -> Hashable:
+        # The source archive's key, so previews are shared with opening it on its own
+        return self.source(entry.index).archive.entry_key(self.local_entry(entry.index))
+
+    def read_range_view(self, start: int, end: int) -> memoryview:
+        """Read-only view of [start, end) of the merged stream, which can't span two archives."""
+        k = bisect.bisect_right(self._bases, start) - 1
+        if k < 0:
+            raise RuntimeError("Archive not mounted.")
+        mp = self.mounts[k]
+        if end > mp.base + mp.archive.data_size:
+            raise RuntimeError("Range crosses mounted archives.")
+        return mp.archive.read_range_view(start - mp.base, end - mp.base)
+
+    def read_file_view(self, entry: bfz.BFZFileEntry) -> memoryview:
+        mp = self.source(entry.index)
+        return mp.archive.read_range_view(entry.offset - mp.base, entry.offset - mp.base + entry.size)
+
+    def read_file_bytes(self, entry: bfz.BFZFileEntry) -> bytes:
+        return bytes(self.read_file_view(entry))
+
+    def set_hashes(self, hashes: np.ndarray):
+        # Only the winners got hashed, the archives' own tables stay as they are
+        self.hashes = hashes
+
+    def set_types(self, types: np.ndarray):
+        self.types = types
+
+    def hash_rows(self, hashes: np.ndarray) -> List[contentHash.HashRow]:
+        """contentHash rows of the merged entries, under the archive and offset they really live at."""
+        hexes = hashes.tobytes().hex()
+        step = 2 * contentHash.HASH_SIZE
+        rows = []
+        for i, name in enumerate(self.names):
+            mp = self.mounts[self.sources[i]]
+            rows.append((mp.path, name, int(self.offsets[i]) - mp.base, int(self.sizes[i]), hexes[i * step:(i + 1) * step]))
+        return rows
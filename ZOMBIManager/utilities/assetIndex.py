@@ -0,0 +1,272 @@
+import os
+import re
+import sqlite3
+from concurrent.futures import as_completed
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from utilities import bfz
+from utilities import contentHash
+from utilities import indexCache
+from utilities import parallelDecompress
+
+# ----------------- Global asset index -----------------
+# One SQLite database for a whole Data folder: one row per archive and per entry,
+# so "which archive contains X" doesn't need to open every .bfz.
+
+SCHEMA_VERSION = 1
+
+DEFAULT_DESCRIPTORS = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    "Wor Descriptors.txt",
+)
+
+def default_db_path() -> str:
+    return os.path.join(indexCache.cache_root(), "assets.sqlite")
+
+@dataclass
+class SearchHit:
+    archive: str
+    name: str
+    size: int
+    offset: int
+    ext: str
+    hash: Optional[str]
+    wor_id: Optional[str]
+    source_path: Optional[str]
+
+# ----------------- Wor descriptors -----------------
+
+_WOR_LINE = re.compile(r"Binarizing wor ([0-9A-Fa-f]{8}) \((.*?)\)\.\.\.")
+
+def parse_wor_descriptors(path: str = DEFAULT_DESCRIPTORS) -> Dict[str, str]:
+    """Map wor hex ID (upper case) -> original source path, from the game's debug log."""
+    mapping: Dict[str, str] = {}
+    try:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            for line in f:
+                m = _WOR_LINE.search(line)
+                if m:
+                    mapping[m.group(1).upper()] = m.group(2)
+    except OSError:
+        pass
+    return mapping
+
+def wor_id_for(archive_path: str) -> Optional[str]:
+    stem = os.path.splitext(os.path.basename(archive_path))[0].upper()
+    return stem if re.fullmatch(r"[0-9A-F]{8}", stem) else None
+
+# ----------------- Database -----------------
+
+def connect(db_path: Optional[str] = None) -> sqlite3.Connection:
+    db_path = db_path or default_db_path()
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    con = sqlite3.connect(db_path)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    _create_schema(con)
+    return con
+
+def _has_trigram(con: sqlite3.Connection) -> bool:
+    row = con.execute("SELECT name FROM sqlite_master WHERE name='entries_fts'").fetchone()
+    return row is not None
+
+def _create_schema(con: sqlite3.Connection):
+    version = con.execute("PRAGMA user_version").fetchone()[0]
+    if version not in (0, SCHEMA_VERSION):
+        con.executescript("DROP TABLE IF EXISTS entries_fts; DROP TABLE IF EXISTS entries; DROP TABLE IF EXISTS archives;")
+    con.executescript("""
+        CREATE TABLE IF NOT EXISTS archives (
+            id INTEGER PRIMARY KEY,
+            path TEXT UNIQUE NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            wor_id TEXT,
+            source_path TEXT,
+            files INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS entries (
+            id INTEGER PRIMARY KEY,
+            archive_id INTEGER NOT NULL REFERENCES archives(id) ON DELETE CASCADE,
+            name TEXT NOT NULL,
+            name_lower TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            offset INTEGER NOT NULL,
+            ext TEXT NOT NULL,
+            hash TEXT
+        );
+        CREATE INDEX IF NOT EXISTS entries_name ON entries(name_lower);
+        CREATE INDEX IF NOT EXISTS entries_ext ON entries(ext);
+        CREATE INDEX IF NOT EXISTS entries_hash ON entries(hash);
+        CREATE INDEX IF NOT EXISTS entries_archive ON entries(archive_id);
+    """)
+    # Substring search in milliseconds needs the FTS5 trigram tokenizer (SQLite 3.34+)
+    try:
+        con.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+            name_lower, content='entries', content_rowid='id', tokenize='trigram')""")
+    except sqlite3.OperationalError:
+        pass
+    else:
+        # Kept in step row by row, in the same transaction as the entries (cascaded deletes included)
+        upgrade = con.execute("SELECT 1 FROM sqlite_master WHERE type='trigger' AND name='entries_fts_ai'").fetchone() is None
+        con.executescript("""
+            CREATE TRIGGER IF NOT EXISTS entries_fts_ai AFTER INSERT ON entries BEGIN
+                INSERT INTO entries_fts(rowid, name_lower) VALUES (new.id, new.name_lower);
+            END;
+            CREATE TRIGGER IF NOT EXISTS entries_fts_ad AFTER DELETE ON entries BEGIN
+                INSERT INTO entries_fts(entries_fts, rowid, name_lower) VALUES ('delete', old.id, old.name_lower);
+            END;
+        """)
+        if upgrade:
+            # Databases from before the triggers: index what's there once
+            con.execute("INSERT INTO entries_fts(entries_fts) VALUES('rebuild')")
+    con.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+    con.commit()
+
+# ----------------- Scanning -----------------
+
+def _scan_archive(path: str, hash_contents: bool) -> List[Tuple]:
+    """Runs in a worker process: (name, size, offset, ext, hash) for every entry."""
+    arch = bfz.BFZArchive(path, workers=1)
+    arch.parse(lazy=True)
+    hashes = None
+    if hash_contents:
+        # Hashes stored with the index cache skip decompression entirely
+        if arch.hashes is None:
+            arch.parse()
+        hashes = contentHash.hash_archive(arch, workers=1)
+    rows = []
+    for entry in arch.file_entries:
+        digest = hashes[entry.index].tobytes().hex() if hashes is not None else None
+        ext = os.path.splitext(entry.name)[1].lower()
+        rows.append((entry.name, entry.size, entry.offset, ext, digest))
+    arch.close()
+    return rows
+
+def find_archives(data_dir: str) -> List[str]:
+    found = []
+    for root, _dirs, files in os.walk(data_dir):
+        found.extend(os.path.abspath(os.path.join(root, n)) for n in files if n.lower().endswith(".bfz"))
+    return sorted(found)
+
+def build_index(
+    data_dir: str,
+    db_path: Optional[str] = None,
+    descriptors: Optional[str] = DEFAULT_DESCRIPTORS,
+    hash_contents: bool = True,
+    jobs: Optional[int] = None,
+    progress: Optional[bfz.ProgressCallback] = None,
+) -> Dict[str, int]:
+    """
+    (Re)index every .bfz under data_dir. Archives whose size/mtime didn't change
+    since the last run are skipped, ones that disappeared are dropped.
+    """
+    wor_map = parse_wor_descriptors(descriptors) if descriptors else {}
+    con = connect(db_path)
+    con.execute("PRAGMA foreign_keys=ON")
+    known = {row[0]: (row[1], row[2]) for row in con.execute("SELECT path, size, mtime_ns FROM archives")}
+
+    archives = find_archives(data_dir)
+    stale = []
+    for path in archives:
+        st = os.stat(path)
+        if known.get(path) != (st.st_size, st.st_mtime_ns):
+            stale.append((path, st))
+
+    root = os.path.abspath(data_dir) + os.sep
+    present = set(archives)
+    removed = [p for p in known if p.startswith(root) and p not in present]
+    for path in removed:
+        con.execute("DELETE FROM archives WHERE path=?", (path,))
+
+    label = "Indexing archives…"
+    total = len(stale)
+    if progress:
+        progress(0, total, label)
+    errors = 0
+    try:
+        with parallelDecompress.process_pool(jobs) as pool:
+            futures = {pool.submit(_scan_archive, path, hash_contents): (path, st) for path, st in stale}
+            try:
+                for done, fut in enumerate(as_completed(futures), 1):
+                    path, st = futures[fut]
+                    try:
+                        rows = fut.result()
+                    except Exception:
+                        errors += 1
+                        rows = None
+                    if rows is not None:
+                        _store_archive(con, path, st, rows, wor_map)
+                    if progress:
+                        progress(done, total, label)
+            except BaseException:
+                for fut in futures: fut.cancel()
+                raise
+    finally:
+        con.commit()
+        con.close()
+    return dict(archives=len(archives), updated=len(stale) - errors, removed=len(removed), errors=errors)
+
+def _store_archive(con: sqlite3.Connection, path: str, st: os.stat_result, rows: List[Tuple], wor_map: Dict[str, str]):
+    wor_id = wor_id_for(path)
+    con.execute("DELETE FROM archives WHERE path=?", (path,))
+    cur = con.execute(
+        "INSERT INTO archives(path, size, mtime_ns, wor_id, source_path, files) VALUES (?,?,?,?,?,?)",
+        (path, st.st_size, st.st_mtime_ns, wor_id, wor_map.get(wor_id) if wor_id else None, len(rows)),
+    )
+    archive_id = cur.lastrowid
+    con.executemany(
+        "INSERT INTO entries(archive_id, name, name_lower, size, offset, ext, hash) VALUES (?,?,?,?,?,?,?)",
+        ((archive_id, name, name.replace("\\", "/").lower(), size, offset, ext, digest)
+         for name, size, offset, ext, digest in rows),
+    )
+    con.commit()
+
+# ----------------- Duplicates -----------------
+
+def duplicate_rows(db_path: Optional[str] = None) -> List[contentHash.HashRow]:
+    """(archive, name, offset, size, hash) of every indexed entry whose hash occurs more than once."""
+    con = connect(db_path)
+    try:
+        return con.execute("""
+            SELECT a.path, e.name, e.offset, e.size, e.hash FROM entries e JOIN archives a ON a.id=e.archive_id
+            WHERE e.hash IN (SELECT hash FROM entries WHERE hash IS NOT NULL GROUP BY hash HAVING COUNT(*) > 1)
+        """).fetchall()
+    finally:
+        con.close()
+
+# ----------------- Searching -----------------
+
+_HIT_COLUMNS = "a.path, e.name, e.size, e.offset, e.ext, e.hash, a.wor_id, a.source_path"
+
+def search(query: str, db_path: Optional[str] = None, limit: int = 1000,
+           con: Optional[sqlite3.Connection] = None) -> List[SearchHit]:
+    """
+    Find entries by name across every indexed archive. Plain text is a
+    case-insensitive substring match, * and ? make it a glob (matching the
+    end of the path, same as the archive tree filter).
+    """
+    own = con is None
+    if own:
+        con = connect(db_path)
+    try:
+        q = query.strip().replace("\\", "/").lower()
+        if not q:
+            return []
+        if any(c in q for c in "*?["):
+            if not q.startswith("*"):
+                q = "*" + q
+            sql = f"SELECT {_HIT_COLUMNS} FROM entries e JOIN archives a ON a.id=e.archive_id WHERE e.name_lower GLOB ? LIMIT ?"
+            args = (q, limit)
+        elif len(q) >= 3 and _has_trigram(con):
+            sql = (f"SELECT {_HIT_COLUMNS} FROM entries_fts f JOIN entries e ON e.id=f.rowid "
+                   f"JOIN archives a ON a.id=e.archive_id WHERE entries_fts MATCH ? LIMIT ?")
+            args = ('"' + q.replace('"', '""') + '"', limit)
+        else:
+            pattern = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            sql = f"SELECT {_HIT_COLUMNS} FROM entries e JOIN archives a ON a.id=e.archive_id WHERE e.name_lower LIKE ? ESCAPE '\\' LIMIT ?"
+            args = (f"%{pattern}%", limit)
+        return [SearchHit(*row) for row in con.execute(sql, args)]
+    finally:
+        if own:
+            con.close()
@@ -1,28 +1,162 @@
+import mmap
+import os
+import struct
+import threading
+from collections import OrderedDict
+from collections.abc import Sequence
 from dataclasses import dataclass
 from utilities import binaryHelpers
-from typing import List, Optional
-from PySide6.QtWidgets import (
-    QApplication, QProgressDialog
-)
+from utilities import formats
+from utilities import indexCache
+from utilities import parallelDecompress
+from utilities import tracing
+from typing import Callable, Hashable, List, Optional
+import numpy as np
 
 try: 
     import lzo 
 except Exception: 
     lzo = None
 
+# ----------------- Progress -----------------
+# progress(done, total, label) is called from the thread running the work,
+# raise OperationCanceled from it to stop. Keeps this module free of Qt.
+ProgressCallback = Callable[[int, int, str], None]
+
+class OperationCanceled(RuntimeError):
+    def __init__(self, msg: str = "Operation canceled"):
+        super().__init__(msg)
+
 # ----------------- Data classes -----------------
 @dataclass
 class BFZFileEntry:
     name: str
     offset: int
     size: int
+    index: int = -1  # row in the archive's tables
+
+@dataclass
+class BFZChunk:
+    new_offset: int  # offset in the decompressed stream
+    offset: int      # offset of the compressed data in the .bfz
+    size: int
+    zsize: int
+
+# ----------------- Chunk cache -----------------
+# Default byte budget for decompressed chunks kept around in lazy mode
+DEFAULT_CHUNK_CACHE_BYTES = 64 * 1024 * 1024
+# Budget of the process-wide cache, shared by every archive open at once (see archiveMount)
+SHARED_CHUNK_CACHE_BYTES = 256 * 1024 * 1024
+
+class ChunkCache:
+    """Bounded LRU of decompressed chunks, evicted by total byte size."""
+    def __init__(self, max_bytes: int = DEFAULT_CHUNK_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = self.misses = 0
+        self._items: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return data
+
+    def put(self, key: Hashable, data: bytes):
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.current_bytes -= len(old)
+            self._items[key] = data
+            self.current_bytes += len(data)
+            # Always keep the newest chunk, even if it alone is over budget
+            while self.current_bytes > self.max_bytes and len(self._items) > 1:
+                _, evicted = self._items.popitem(last=False)
+                self.current_bytes -= len(evicted)
+
+    def discard(self, tag: Hashable):
+        """Drop the chunks of one archive, keys are (archive tag, chunk)."""
+        with self._lock:
+            for key in [k for k in self._items if k[0] == tag]:
+                self.current_bytes -= len(self._items.pop(key))
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.current_bytes = 0
+
+_shared_cache: Optional[ChunkCache] = None
+_shared_lock = threading.Lock()
+
+def shared_chunk_cache() -> ChunkCache:
+    """The process-wide chunk cache, ZOMBI_CHUNK_CACHE_MB overrides its budget."""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            mb = os.environ.get("ZOMBI_CHUNK_CACHE_MB")
+            _shared_cache = ChunkCache(int(mb) * 1024 * 1024 if mb else SHARED_CHUNK_CACHE_BYTES)
+        return _shared_cache
+
 # ----------------- BFZ Archive -----------------
+HEADER_SIZE = 0x58
+TABLE_PREFIX_SIZE = 0x10  # u32 count, u32, u64 before each table
+
+class BFZEntryList(Sequence):
+    """Read-only view over the archive's columns, building BFZFileEntry on access."""
+    def __init__(self, archive: "BFZArchive"):
+        self._archive = archive
+
+    def __len__(self) -> int:
+        return len(self._archive.names)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._archive.entry(j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        return self._archive.entry(i)
 
 class BFZArchive:
-    def __init__(self, path: str):
+    def __init__(self, path: str, cache: Optional[ChunkCache] = None,
+                 workers: Optional[int] = None, use_processes: bool = False,
+                 use_index_cache: bool = True):
         self.path = path
-        self.file_entries: List[BFZFileEntry] = []
+        # Keep decoded tables in the on-disk index cache (see indexCache)
+        self.use_index_cache = use_index_cache
+        self.index_cache_hit = False
+        # Decompression pool settings, workers=None uses every core
+        self.workers = workers
+        self.use_processes = use_processes
+        # Columnar tables: one entry per file / per chunk
+        self.names: List[str] = []
+        self.offsets = np.zeros(0, dtype=np.uint64)
+        self.sizes = np.zeros(0, dtype=np.uint64)
+        self.chunks = np.zeros(0, dtype=binaryHelpers.CHUNK_ENTRY_DTYPE)
+        # Per-entry content digests, when known (see contentHash)
+        self.hashes: Optional[np.ndarray] = None
+        # Per-entry format codes, when sniffed (see formats)
+        self.types: Optional[np.ndarray] = None
+        self.file_entries = BFZEntryList(self)
         self.memory: Optional[bytearray] = None
+        self.data_size = 0
+        self.lazy = False
+        self.cache = cache if cache is not None else ChunkCache()
+        # Interval index: chunk indices sorted by NEW_OFFSET, and their starts
+        self._chunk_order = np.zeros(0, dtype=np.intp)
+        self._chunk_starts = np.zeros(0, dtype=np.uint64)
+        self._fh = None
+        self._mm: Optional[mmap.mmap] = None
+        self._fill: Optional[parallelDecompress.BackgroundDecompressor] = None
+        self._fh_lock = threading.Lock()
+        # Cache keys include size/mtime so a rewritten archive never hits stale chunks
+        self._cache_tag: tuple = (path,)
+        # (stat, header hash) the index cache entry was stored under
+        self._index_stamp: Optional[tuple] = None
 
     def _ensure_lzo(self):
         if lzo is None:
@@ -30,116 +164,257 @@ class BFZArchive:
                 "Please install python-lzo to parse BFZ files"
             )
 
-    def parse(self, progress: Optional[QProgressDialog] = None):
+    def entry(self, i: int) -> BFZFileEntry:
+        return BFZFileEntry(self.names[i], int(self.offsets[i]), int(self.sizes[i]), i)
+
+    def entry_key(self, entry: BFZFileEntry) -> Hashable:
+        """Identifies an entry's bytes across reopens, for caches of things derived from them."""
+        return (self._cache_tag, entry.offset, entry.size)
+
+    def drop_cached_chunks(self):
+        """Free this archive's chunks from its (maybe shared) chunk cache."""
+        self.cache.discard(self._cache_tag)
+
+    def set_hashes(self, hashes: np.ndarray):
+        """Keep per-entry digests, and store them with the cached tables for the next open."""
+        self.hashes = hashes
+        self._save_index()
+
+    def set_types(self, types: np.ndarray):
+        """Keep per-entry format codes, cached the same way as the hashes."""
+        self.types = types
+        self._save_index()
+
+    def _save_index(self):
+        if self.use_index_cache and self._index_stamp is not None:
+            st, hhash = self._index_stamp
+            indexCache.save(self.path, st, hhash, indexCache.ArchiveIndex(
+                self.names, self.offsets, self.sizes, self.chunks, self.hashes,
+                self.types, formats.SNIFF_VERSION))
+
+    def chunk(self, i: int) -> BFZChunk:
+        c = self.chunks[i]
+        return BFZChunk(int(c["new_offset"]), int(c["offset"]), int(c["size"]), int(c["zsize"]))
+
+    def parse(self, progress: Optional[ProgressCallback] = None, lazy: bool = False):
+        with tracing.span("parse", "bfz", archive=os.path.basename(self.path), lazy=lazy):
+            self._parse(progress, lazy)
+
+    def _parse(self, progress: Optional[ProgressCallback], lazy: bool):
         self._ensure_lzo()
+        st = os.stat(self.path)
+        self._cache_tag = (self.path, st.st_size, st.st_mtime_ns)
         with open(self.path, "rb") as f:
-            magic = f.read(3)
-            if magic != b"ABE":
+            header = f.read(HEADER_SIZE)
+            if header[:3] != b"ABE":
                 raise ValueError("Invalid BFZ magic (expected 'ABE')")
+            if len(header) != HEADER_SIZE:
+                raise ValueError("Truncated BFZ header")
+
+            index = None
+            hhash = indexCache.header_hash(header)
+            if self.use_index_cache:
+                with tracing.span("load index cache", "bfz"):
+                    index = indexCache.load(self.path, st, hhash)
+            self.index_cache_hit = index is not None
+            if index is None:
+                with tracing.span("read tables", "bfz"):
+                    index = self._read_tables(f, header)
+                if self.use_index_cache:
+                    with tracing.span("save index cache", "bfz"):
+                        indexCache.save(self.path, st, hhash, index)
+
+            self._index_stamp = (st, hhash)
+            self.names = index.names
+            self.hashes = index.hashes
+            self.types = index.types if index.types_version == formats.SNIFF_VERSION else None
+            self.offsets = index.offsets
+            self.sizes = index.sizes
+            self.chunks = chunks = index.chunks
+            ends = chunks["new_offset"] + chunks["size"]
+            MAX_OFF = int(ends.max()) if len(chunks) else 0
+            self.data_size = MAX_OFF
+            self._build_chunk_index()
 
-            f.seek(0x28)
-            FILES_OFF   = binaryHelpers.read_u64_le(f)
-            FOLDERS_OFF = binaryHelpers.read_u64_le(f)
-            CHUNKS_OFF  = binaryHelpers.read_u64_le(f)
-
-            FILES  = binaryHelpers.read_u32_le(f)
-            FOLDERS = binaryHelpers.read_u32_le(f)
-            CHUNKS = binaryHelpers.read_u32_le(f)
-            _FILES_again = binaryHelpers.read_u32_le(f)
-            _DUMMY_1 = binaryHelpers.read_u32_le(f)
-            REAL_CHUNKS = binaryHelpers.read_u32_le(f)
-
-            # FILES_OFF table
-            f.seek(FILES_OFF)
-            files_count = binaryHelpers.read_u32_le(f)
-            _ = binaryHelpers.read_u32_le(f)
-            _ = binaryHelpers.read_u64_le(f)
-
-            offsets, sizes, names = [], [], []
-            for _i in range(files_count):
-                OFFSET = binaryHelpers.read_u64_le(f)
-                SIZE   = binaryHelpers.read_u64_le(f)
-                _d1 = binaryHelpers.read_u32_le(f)
-                _d2 = binaryHelpers.read_u32_le(f)
-                offsets.append(OFFSET)
-                sizes.append(SIZE)
-
-            for _i in range(files_count):
-                NAME  = binaryHelpers.read_fixed_string(f, 0x40)
-                _size = binaryHelpers.read_u64_le(f)
-                _zero = binaryHelpers.read_u64_le(f)
-                _d3   = binaryHelpers.read_u64_le(f)
-                _id   = binaryHelpers.read_u32_le(f)
-                _d4   = binaryHelpers.read_u32_le(f)
-                names.append(NAME)
-
-            # CHUNKS
-            f.seek(CHUNKS_OFF)
-            chunks_count = binaryHelpers.read_u32_le(f)
-            _ = binaryHelpers.read_u32_le(f)
-            _ = binaryHelpers.read_u64_le(f)
-            CHUNKS_TABLE_START = f.tell()
-
-            MAX_OFF = 0
-            f.seek(CHUNKS_TABLE_START)
-            for _i in range(REAL_CHUNKS):
-                NEW_OFFSET = binaryHelpers.read_u64_le(f)
-                OFFSET     = binaryHelpers.read_u64_le(f)
-                _d64       = binaryHelpers.read_u64_le(f)
-                SIZE       = binaryHelpers.read_u32_le(f)
-                ZSIZE      = binaryHelpers.read_u32_le(f)
-                new_end = NEW_OFFSET + SIZE
-                MAX_OFF = max(MAX_OFF, new_end)
+            # Lazy mode stops here, chunks get decompressed on demand
+            self.lazy = lazy
+            if lazy:
+                self.memory = None
+                return
 
             self.memory = bytearray(MAX_OFF)
 
+            label = "Decompressing chunks…"
             if progress:
-                progress.setLabelText("Decompressing chunks…")
-                progress.setRange(0, REAL_CHUNKS)
-                progress.setValue(0)
-                QApplication.processEvents()
-
-            f.seek(CHUNKS_TABLE_START)
-            for i in range(REAL_CHUNKS):
-                NEW_OFFSET = binaryHelpers.read_u64_le(f)
-                OFFSET     = binaryHelpers.read_u64_le(f)
-                _d64       = binaryHelpers.read_u64_le(f)
-                SIZE       = binaryHelpers.read_u32_le(f)
-                ZSIZE      = binaryHelpers.read_u32_le(f)
-
-                cur = f.tell()
-                f.seek(OFFSET)
-                comp = f.read(ZSIZE)
-                f.seek(cur)
-
-                decomp = lzo.decompress(comp, False, SIZE)
-                if len(decomp) != SIZE:
-                    raise RuntimeError(f"Chunk {i} decompressed size mismatch")
-
-                self.memory[NEW_OFFSET:NEW_OFFSET+SIZE] = decomp
-
-                if progress:
-                    progress.setValue(i+1)
-                    QApplication.processEvents()
-                    if progress.wasCanceled():
-                        raise RuntimeError("Operation canceled")
-
-            self.file_entries = [
-                BFZFileEntry(names[i], offsets[i], sizes[i])
-                for i in range(files_count)
-            ]
+                progress(0, len(chunks), label)
+
+            def on_progress(done: int, total: int):
+                progress(done, total, label)
+
+            with tracing.span("decompress", "bfz", chunks=len(chunks), bytes=MAX_OFF):
+                parallelDecompress.decompress_chunks(
+                    self._map(), chunks, self.memory,
+                    workers=self.workers,
+                    use_processes=self.use_processes,
+                    progress=on_progress if progress else None,
+                )
+            # Everything is in self.memory now, drop the mapping
+            self.close()
+
+    def _read_tables(self, f, header: bytes) -> indexCache.ArchiveIndex:
+        (FILES_OFF, FOLDERS_OFF, CHUNKS_OFF,
+         FILES, FOLDERS, CHUNKS, _FILES_again, _DUMMY_1, REAL_CHUNKS,
+         ) = struct.unpack_from("<QQQIIIIII", header, 0x28)
+
+        # FILES_OFF table, names follow right after it
+        f.seek(FILES_OFF)
+        files_count = struct.unpack("<I", f.read(TABLE_PREFIX_SIZE)[:4])[0]
+        file_table = binaryHelpers.read_table(f, binaryHelpers.FILE_ENTRY_DTYPE, files_count)
+        name_table = binaryHelpers.read_table(f, binaryHelpers.NAME_ENTRY_DTYPE, files_count)
+
+        # CHUNKS
+        f.seek(CHUNKS_OFF + TABLE_PREFIX_SIZE)
+        chunks = binaryHelpers.read_table(f, binaryHelpers.CHUNK_ENTRY_DTYPE, REAL_CHUNKS)
+
+        return indexCache.ArchiveIndex(
+            names=binaryHelpers.decode_fixed_strings(name_table["name"]),
+            offsets=file_table["offset"].copy(),
+            sizes=file_table["size"].copy(),
+            chunks=chunks,
+        )
+
+    def _build_chunk_index(self):
+        self._chunk_order = np.argsort(self.chunks["new_offset"], kind="stable")
+        self._chunk_starts = self.chunks["new_offset"][self._chunk_order]
+
+    def chunks_for_range(self, start: int, end: int) -> List[int]:
+        """Indices of the chunks overlapping [start, end), in stream order."""
+        lo = max(int(np.searchsorted(self._chunk_starts, start, side="right")) - 1, 0)
+        hi = int(np.searchsorted(self._chunk_starts, end, side="left"))
+        found = []
+        for i in self._chunk_order[lo:hi].tolist():
+            c = self.chunks[i]
+            if int(c["new_offset"]) + int(c["size"]) > start:
+                found.append(i)
+        return found
+
+    def read_chunk(self, i: int) -> bytes:
+        """Decompressed bytes of chunk i, through the chunk cache."""
+        key = (self._cache_tag, i)
+        data = self.cache.get(key)
+        if data is not None:
+            return data
+        self._ensure_lzo()
+        chunk = self.chunk(i)
+        comp = memoryview(self._map())[chunk.offset:chunk.offset+chunk.zsize]
+        with tracing.span("lzo chunk", "lzo", chunk=i, zsize=chunk.zsize, size=chunk.size):
+            data = lzo.decompress(comp, False, chunk.size)
+        comp.release()
+        tracing.count("lzo in", chunk.zsize); tracing.count("lzo out", chunk.size)
+        if len(data) != chunk.size:
+            raise RuntimeError(f"Chunk {i} decompressed size mismatch")
+        self.cache.put(key, data)
+        return data
+
+    def _read_range(self, start: int, end: int):
+        if end > self.data_size:
+            raise RuntimeError("File references bytes beyond memory buffer.")
+        ids = self.chunks_for_range(start, end)
+        if len(ids) == 1:
+            c = self.chunk(ids[0])
+            if c.new_offset <= start and end <= c.new_offset + c.size:
+                data = self.read_chunk(ids[0])
+                return memoryview(data)[start - c.new_offset:end - c.new_offset]
+        # Gaps between chunks read as zeroes, same as the eager buffer
+        out = bytearray(end - start)
+        for i in ids:
+            c = self.chunk(i)
+            data = self.read_chunk(i)
+            lo, hi = max(start, c.new_offset), min(end, c.new_offset + c.size)
+            out[lo - start:hi - start] = memoryview(data)[lo - c.new_offset:hi - c.new_offset]
+        return out
+
+    def _map(self) -> mmap.mmap:
+        """Read-only mapping of the whole .bfz, compressed chunks are sliced straight out of it."""
+        with self._fh_lock:
+            if self._mm is None:
+                self._fh = open(self.path, "rb")
+                self._mm = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+            return self._mm
+
+    # ----- background fill -----
+    def start_background_fill(self, progress: Optional[ProgressCallback] = None):
+        """
+        After parse(lazy=True): decompress everything into self.memory on worker
+        threads. Entries stay readable meanwhile, reading one moves its chunks to
+        the front of the queue. progress is called from the worker threads.
+        """
+        self._ensure_lzo()
+        label = "Decompressing chunks…"
+        memory = bytearray(self.data_size)
+        fill = parallelDecompress.BackgroundDecompressor(
+            self._map(), self.chunks, memory,
+            workers=self.workers,
+            progress=(lambda done, total: progress(done, total, label)) if progress else None,
+        )
+        fill.start()
+        # Readers on other threads go by self.memory: until it's set they read
+        # lazily, once it is _fill has to be there to wait on. Publish it last.
+        self._fill = fill
+        self.memory = memory
+        self.lazy = False
+
+    @property
+    def fill_pending(self) -> bool:
+        return self._fill is not None and not self._fill.finished
+
+    def wait_fill(self):
+        """Block until the background fill is done, then drop the mapping."""
+        if self._fill is None:
+            return
+        fill = self._fill
+        fill.join()
+        self._fill = None
+        self.close()
+
+    def cancel_fill(self):
+        if self._fill is not None:
+            self._fill.cancel()
+
+    def close(self):
+        self.cancel_fill()
+        with self._fh_lock:
+            if self._mm is not None:
+                try:
+                    self._mm.close()
+                except BufferError:
+                    # Someone still holds a view into the mapping, let GC unmap it
+                    pass
+                self._mm = None
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
 
     def read_file_bytes(self, entry: BFZFileEntry) -> bytes:
+        return bytes(self.read_file_view(entry))
+
+    def read_file_view(self, entry: BFZFileEntry) -> memoryview:
+        """Read-only view of an entry's bytes, without copying out of the decompressed buffer."""
+        return self.read_range_view(entry.offset, entry.offset + entry.size)
+
+    def read_range_view(self, start: int, end: int) -> memoryview:
+        """Read-only view of [start, end) of the decompressed stream."""
+        tracing.count("read", end - start)
         if self.memory is None:
+            if self.lazy:
+                return memoryview(self._read_range(start, end)).toreadonly()
             raise RuntimeError("Archive not parsed.")
-        start, end = entry.offset, entry.offset + entry.size
         if end > len(self.memory):
             raise RuntimeError("File references bytes beyond memory buffer.")
-        return bytes(self.memory[start:end])
+        fill = self._fill
+        if fill is not None and not fill.finished:
+            fill.wait_for(self.chunks_for_range(start, end))
+        return memoryview(self.memory)[start:end].toreadonly()
 
 # ----------------- BFZ Import ----------------------
-# TODO: Allow importing of folders as BFZ's
-# I cannot just do what we do with exporting the BFZ but in kind of a reverse way
-# Because we lose too much data with it
-# We can probably do what some game tools do, and have us pick a "base" bfz to build off of, and
-# then transplant the data that way
+# Folders are imported on top of a "base" bfz, see bfzWriter
@@ -0,0 +1,555 @@
+import itertools
+import os
+import shutil
+import struct
+from collections import deque
+from concurrent.futures import Future
+from contextlib import closing
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from utilities import bfz
+from utilities import binaryHelpers
+from utilities import exporter
+from utilities import parallelDecompress
+
+try:
+    import lzo
+except Exception:
+    lzo = None
+
+# ----------------- BFZ writer -----------------
+# A folder can't become a .bfz on its own, the tables carry fields nobody has
+# decoded yet. So a "base" archive provides everything, files from a folder
+# laid out like Export All writes it override its entries, and the writer
+# rebuilds the decompressed stream, the file/name tables and the chunk table.
+# Chunks are compressed on a process pool and streamed to disk in order, only
+# the tables are ever held in memory.
+
+DEFAULT_LEVEL = 1  # lzo level: 1 is LZO1X-1, 9 is LZO1X-999 (slow, smaller)
+
+@dataclass
+class WriteResult:
+    replaced: int = 0          # entries that got new data
+    chunks: int = 0            # chunks compressed
+    chunks_copied: int = 0     # chunks carried over untouched (incremental only)
+    bytes_written: int = 0     # size of the new archive
+    skipped: List[str] = field(default_factory=list)  # folder files matching no entry
+
+@dataclass
+class _Piece:
+    start: int                 # offset in the new stream
+    size: int
+    base_offset: int = -1      # copied from the base stream...
+    path: Optional[str] = None  # ...or read from a file
+
+def _align(value: int, alignment: int) -> int:
+    return (value + alignment - 1) // alignment * alignment
+
+def _alignment_of(values: np.ndarray, limit: int) -> int:
+    """Largest power of two <= limit dividing every value."""
+    a = limit
+    while a > 1 and len(values) and np.any(values % np.uint64(a)):
+        a //= 2
+    return a
+
+def _compress(data: bytes, level: int) -> bytes:
+    """Runs in a worker process."""
+    return lzo.compress(data, level, False)
+
+def compress_in_order(blocks: Iterable[bytes], level: int, workers: Optional[int] = None) -> Iterator[bytes]:
+    """Compress blocks on a process pool, yielding results in order with a bounded queue."""
+    workers = workers or exporter.default_workers()
+    pool = parallelDecompress.process_pool(workers)
+    pending: Deque[Future] = deque()
+    try:
+        for block in blocks:
+            pending.append(pool.submit(_compress, block, level))
+            if len(pending) > workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+# ----------------- Overrides -----------------
+
+def collect_overrides(
+    base: bfz.BFZArchive,
+    folder: str,
+    progress: Optional[bfz.ProgressCallback] = None,
+) -> Tuple[Dict[int, str], List[str]]:
+    """
+    Entry index -> file replacing it. Paths follow exporter.plan_export (variants
+    are name~2.ext and so on). Files identical to the entry are left out.
+    """
+    items = exporter.plan_export(base, folder, dedupe=None)
+    overrides: Dict[int, str] = {}
+    known = set()
+    label = "Comparing files…"
+    for n, item in enumerate(items):
+        known.add(os.path.normcase(os.path.abspath(item.out_path)))
+        if progress and n % 256 == 0:
+            progress(n, len(items), label)
+        try:
+            size = os.path.getsize(item.out_path)
+        except OSError:
+            continue
+        if size == item.entry.size:
+            with open(item.out_path, "rb") as f:
+                if base.read_file_view(item.entry) == f.read():
+                    continue
+        overrides[item.entry.index] = item.out_path
+    if progress:
+        progress(len(items), len(items), label)
+
+    skipped = []
+    for root, _dirs, files in os.walk(folder):
+        for name in files:
+            path = os.path.join(root, name)
+            if name != exporter.MANIFEST_NAME and os.path.normcase(os.path.abspath(path)) not in known:
+                skipped.append(os.path.relpath(path, folder))
+    return overrides, sorted(skipped)
+
+# ----------------- Stream layout -----------------
+
+def layout_stream(
+    base: bfz.BFZArchive, overrides: Dict[int, str]
+) -> Tuple[List[_Piece], np.ndarray, np.ndarray, int]:
+    """
+    Lay out the new decompressed stream: untouched entries are copied in runs
+    (entries sharing bytes keep sharing them), overridden ones take the place of
+    their old data. Returns pieces, new offsets, new sizes and the stream size.
+    """
+    offsets, sizes = base.offsets, base.sizes
+    new_offsets, new_sizes = offsets.copy(), sizes.copy()
+    live = sizes > 0
+    alignment = _alignment_of(offsets[live], 0x1000)
+
+    keep = live.copy()
+    if overrides:
+        keep[list(overrides)] = False
+    idx = np.nonzero(keep)[0]
+    idx = idx[np.argsort(offsets[idx], kind="stable")]
+
+    # Runs of overlapping (or padding-separated) untouched entries: [start, end, members]
+    runs: List[list] = []
+    for i, o, s in zip(idx.tolist(), offsets[idx].tolist(), sizes[idx].tolist()):
+        if runs and o < _align(runs[-1][1], alignment):
+            runs[-1][1] = max(runs[-1][1], o + s)
+            runs[-1][2].append(i)
+        else:
+            runs.append([o, o + s, [i]])
+    # Overridden entries go where their old data was, after a run starting at the same place
+    order = [(run[0], 0, run) for run in runs]
+    order += [(int(offsets[i]), 1, (i, path)) for i, path in overrides.items()]
+    order.sort(key=lambda r: (r[0], r[1]))
+
+    pieces: List[_Piece] = []
+    pos = 0
+    for _, kind, item in order:
+        if kind == 1:
+            i, path = item
+            size = os.path.getsize(path)
+            pos = _align(pos, alignment)
+            new_offsets[i], new_sizes[i] = pos, size
+            if size:
+                pieces.append(_Piece(pos, size, path=path))
+            pos += size
+        else:
+            start, end, members = item
+            pos = _align(pos, alignment)
+            pieces.append(_Piece(pos, end - start, base_offset=start))
+            for i in members:
+                new_offsets[i] = pos + int(offsets[i]) - start
+            pos += end - start
+    return pieces, new_offsets, new_sizes, _align(pos, alignment)
+
+class _StreamReader:
+    """Assembles [start, end) of the new stream from pieces, which are read in order."""
+    def __init__(self, base: bfz.BFZArchive, pieces: List[_Piece]):
+        self.base = base
+        self.pieces = pieces
+        self.first = 0
+        self._path: Optional[str] = None
+        self._fh = None
+
+    def read(self, start: int, end: int) -> bytes:
+        out = bytearray(end - start)
+        pieces = self.pieces
+        while self.first < len(pieces) and pieces[self.first].start + pieces[self.first].size <= start:
+            self.first += 1
+        k = self.first
+        while k < len(pieces) and pieces[k].start < end:
+            p = pieces[k]
+            lo, hi = max(start, p.start), min(end, p.start + p.size)
+            if p.path is None:
+                src = p.base_offset + lo - p.start
+                out[lo - start:hi - start] = self.base.read_range_view(src, src + hi - lo)
+            else:
+                if self._path != p.path:
+                    self.close()
+                    self._fh, self._path = open(p.path, "rb"), p.path
+                self._fh.seek(lo - p.start)
+                data = self._fh.read(hi - lo)
+                if len(data) != hi - lo:
+                    raise RuntimeError(f"{p.path} changed while writing")
+                out[lo - start:hi - start] = data
+            k += 1
+        return bytes(out)
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh, self._path = None, None
+
+# ----------------- Writing -----------------
+
+class _Layout:
+    """
+    Everything outside the compressed data, as two buffers (before and after the
+    data) that can be patched by their offset in the base file.
+    """
+    def __init__(self, base: bfz.BFZArchive):
+        chunks = base.chunks
+        file_size = os.path.getsize(base.path)
+        if len(chunks):
+            self.data_start = int(chunks["offset"].min())
+            self.data_end = int((chunks["offset"] + chunks["zsize"]).max())
+        else:
+            self.data_start = self.data_end = file_size
+        self.chunk_alignment = _alignment_of(chunks["offset"], 0x800)
+        with open(base.path, "rb") as f:
+            self.before = bytearray(f.read(self.data_start))
+            f.seek(self.data_end)
+            self.after = bytearray(f.read())
+        (self.files_off, self.folders_off, self.chunks_off,
+         _files, _folders, self.header_chunks, _files_again, _dummy, self.real_chunks,
+         ) = struct.unpack_from("<QQQIIIIII", self.before, 0x28)
+        if self.data_start <= self.chunks_off < self.data_end:
+            raise RuntimeError("Chunk table inside the compressed data, can't rewrite this archive")
+        self.table_size = bfz.TABLE_PREFIX_SIZE + self.real_chunks * binaryHelpers.CHUNK_ENTRY_DTYPE.itemsize
+        self.new_data_end = self.data_end
+
+    def locate(self, pos: int) -> Tuple[bytearray, int]:
+        if pos < self.data_start:
+            return self.before, pos
+        return self.after, pos - self.data_end
+
+    def table(self, dtype: np.dtype, pos: int, count: int) -> np.ndarray:
+        """Writable structured view of a table at pos in the base file."""
+        buf, rel = self.locate(pos)
+        return np.frombuffer(buf, dtype=dtype, count=count, offset=rel)
+
+    def resize_chunk_table(self, count: int):
+        """Splice in a chunk table with room for count rows, moving what follows it."""
+        buf, rel = self.locate(self.chunks_off)
+        prefix = bytearray(buf[rel:rel + bfz.TABLE_PREFIX_SIZE])
+        old_count = struct.unpack_from("<I", prefix)[0]
+        struct.pack_into("<I", prefix, 0, old_count - self.real_chunks + count)
+        new_size = bfz.TABLE_PREFIX_SIZE + count * binaryHelpers.CHUNK_ENTRY_DTYPE.itemsize
+        buf[rel:rel + self.table_size] = prefix + bytes(new_size - bfz.TABLE_PREFIX_SIZE)
+        self.delta = new_size - self.table_size
+        self.new_count = count
+        # Keep the compressed data where the base archive's alignment wants it
+        if buf is self.before:
+            self.before += bytes(_align(len(self.before), self.chunk_alignment) - len(self.before))
+
+    def relocate(self, pos: int) -> int:
+        """New file offset of something at pos in the base file."""
+        moved = self.delta if pos > self.chunks_off else 0
+        if pos < self.data_start:
+            return pos + (moved if self.chunks_off < self.data_start else 0)
+        return self.new_data_end + pos - self.data_end + (moved if self.chunks_off >= self.data_end else 0)
+
+    def chunk_rows(self) -> np.ndarray:
+        buf, rel = self.locate(self.chunks_off)
+        return np.frombuffer(buf, dtype=binaryHelpers.CHUNK_ENTRY_DTYPE,
+                             count=self.new_count, offset=rel + bfz.TABLE_PREFIX_SIZE)
+
+    def finish_header(self):
+        files_off, folders_off, chunks_off = (self.relocate(p) for p in
+                                              (self.files_off, self.folders_off, self.chunks_off))
+        struct.pack_into("<QQQ", self.before, 0x28, files_off, folders_off, chunks_off)
+        struct.pack_into("<I", self.before, 0x48, self.header_chunks - self.real_chunks + self.new_count)
+        struct.pack_into("<I", self.before, 0x54, self.new_count)
+
+def write_bfz(
+    base: bfz.BFZArchive,
+    overrides: Dict[int, str],
+    out_path: str,
+    level: int = DEFAULT_LEVEL,
+    chunk_size: Optional[int] = None,
+    workers: Optional[int] = None,
+    progress: Optional[bfz.ProgressCallback] = None,
+) -> WriteResult:
+    """
+    Write base with the entries in overrides replaced, as a new archive at
+    out_path. base must be parsed (lazy is fine, and keeps memory flat).
+    Header fields and table columns other than offsets/sizes are copied as is.
+    """
+    if lzo is None:
+        raise RuntimeError("Please install python-lzo to write BFZ files")
+    pieces, new_offsets, new_sizes, stream_size = layout_stream(base, overrides)
+    if chunk_size is None:
+        chunk_size = int(base.chunks["size"].max()) if len(base.chunks) else 0x20000
+    count = (stream_size + chunk_size - 1) // chunk_size
+
+    layout = _Layout(base)
+    n = len(base.names)
+    files_at = layout.files_off + bfz.TABLE_PREFIX_SIZE
+    file_table = layout.table(binaryHelpers.FILE_ENTRY_DTYPE, files_at, n)
+    name_table = layout.table(binaryHelpers.NAME_ENTRY_DTYPE, files_at + n * binaryHelpers.FILE_ENTRY_DTYPE.itemsize, n)
+    # The name table repeats the size, where it agreed with the file table keep it agreeing
+    same = name_table["size"] == file_table["size"]
+    file_table["offset"], file_table["size"] = new_offsets, new_sizes
+    name_table["size"][same] = new_sizes[same]
+    del file_table, name_table  # views pin the buffers, which get resized next
+    old_d64 = base.chunks["d64"][np.argsort(base.chunks["new_offset"], kind="stable")]
+    layout.resize_chunk_table(count)
+
+    label = "Compressing chunks…"
+    if progress:
+        progress(0, count, label)
+    reader = _StreamReader(base, pieces)
+    rows = np.zeros(count, dtype=binaryHelpers.CHUNK_ENTRY_DTYPE)
+    blocks = (reader.read(k * chunk_size, min((k + 1) * chunk_size, stream_size)) for k in range(count))
+    tmp = out_path + ".tmp"
+    try:
+        with open(tmp, "wb") as w, closing(compress_in_order(blocks, level, workers)) as compressed:
+            w.write(layout.before)
+            for k, comp in enumerate(compressed):
+                w.write(bytes(_align(w.tell(), layout.chunk_alignment) - w.tell()))
+                size = min(chunk_size, stream_size - k * chunk_size)
+                rows[k] = (k * chunk_size, w.tell(), old_d64[min(k, len(old_d64) - 1)] if len(old_d64) else 0,
+                           size, len(comp))
+                w.write(comp)
+                if progress:
+                    progress(k + 1, count, label)
+
+            layout.new_data_end = w.tell()
+            layout.chunk_rows()[:] = rows
+            layout.finish_header()
+            w.write(layout.after)
+            w.seek(0)
+            w.write(layout.before)
+            w.seek(0, os.SEEK_END)
+            result = WriteResult(replaced=len(overrides), chunks=count, bytes_written=w.tell())
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    finally:
+        reader.close()
+    base.close()
+    os.replace(tmp, out_path)
+    return result
+
+# ----------------- Incremental patching -----------------
+# For a handful of changed entries in a big archive: the base file is copied
+# as is (in the kernel where possible), only the decompressed chunks that the
+# changes touch are recompressed, and entries that grew move to new chunks
+# after the old data. Everything that didn't change stays bit-identical.
+
+def _copy_file(src: str, dst: str):
+    """Copy with os.copy_file_range (reflinks on CoW filesystems), else shutil (sendfile and co)."""
+    if hasattr(os, "copy_file_range"):
+        with open(src, "rb") as r, open(dst, "wb") as w:
+            size, done = os.fstat(r.fileno()).st_size, 0
+            try:
+                while done < size:
+                    n = os.copy_file_range(r.fileno(), w.fileno(), size - done, done, done)
+                    if n == 0:
+                        break
+                    done += n
+            except OSError:
+                pass
+            if done == size:
+                return
+    shutil.copyfile(src, dst)
+
+def _overlaps_others(i: int, start: int, end: int, starts: np.ndarray, max_ends: np.ndarray,
+                     overrides: Dict[int, str], offsets: np.ndarray, sizes: np.ndarray) -> bool:
+    # Untouched entries: sorted starts + running max of their ends
+    j = int(np.searchsorted(starts, end, side="left"))
+    if j and max_ends[j - 1] > start:
+        return True
+    return any(k != i and offsets[k] < end and start < offsets[k] + sizes[k] for k in overrides)
+
+def patch_bfz(
+    base: bfz.BFZArchive,
+    overrides: Dict[int, str],
+    out_path: str,
+    level: int = DEFAULT_LEVEL,
+    chunk_size: Optional[int] = None,
+    workers: Optional[int] = None,
+    progress: Optional[bfz.ProgressCallback] = None,
+) -> WriteResult:
+    """
+    Like write_bfz, but rewrites only what the overrides touch. Entries that
+    still fit (and share no bytes with another entry) are written over their
+    old data, the rest go after the end of the stream. Recompressed chunks
+    reuse their old slot in the file when they fit and are appended otherwise,
+    the chunk table moves to the end of the file if it needs more rows.
+    """
+    if lzo is None:
+        raise RuntimeError("Please install python-lzo to write BFZ files")
+    offsets, sizes = base.offsets, base.sizes
+    chunks = base.chunks
+    if chunk_size is None:
+        chunk_size = int(chunks["size"].max()) if len(chunks) else 0x20000
+    alignment = _alignment_of(offsets[sizes > 0], 0x1000)
+
+    keep = sizes > 0
+    if overrides:
+        keep[list(overrides)] = False
+    kept = np.nonzero(keep)[0]
+    kept = kept[np.argsort(offsets[kept], kind="stable")]
+    starts = offsets[kept]
+    max_ends = np.maximum.accumulate(starts + sizes[kept]) if len(kept) else starts
+
+    # Decide in place vs moved
+    in_place: List[Tuple[int, int, str]] = []  # (stream offset, size, path)
+    moved: Dict[int, str] = {}
+    new_offsets, new_sizes = {}, {}
+    for i, path in sorted(overrides.items()):
+        size, start = os.path.getsize(path), int(offsets[i])
+        if size <= int(sizes[i]) and not _overlaps_others(
+                i, start, start + int(sizes[i]), starts, max_ends, overrides, offsets, sizes):
+            in_place.append((start, size, path))
+            new_offsets[i], new_sizes[i] = start, size
+        else:
+            moved[i] = path
+
+    # Moved entries form a new tail of the stream
+    pieces: List[_Piece] = []
+    tail_start = pos = _align(base.data_size, alignment)
+    for i, path in moved.items():
+        size = os.path.getsize(path)
+        new_offsets[i], new_sizes[i] = pos, size
+        if size:
+            pieces.append(_Piece(pos, size, path=path))
+        pos = _align(pos + size, alignment)
+    tail_end = pos if moved else tail_start
+    tail_count = (tail_end - tail_start + chunk_size - 1) // chunk_size
+
+    # Old chunks whose decompressed bytes change
+    changed = sorted({c for start, size, _ in in_place if size
+                      for c in base.chunks_for_range(start, start + size)},
+                     key=lambda c: int(chunks[c]["offset"]))
+
+    def old_chunk_blocks():
+        for c in changed:
+            ch = base.chunk(c)
+            data = bytearray(base.read_chunk(c))
+            for start, size, path in in_place:
+                lo, hi = max(start, ch.new_offset), min(start + size, ch.new_offset + ch.size)
+                if lo < hi:
+                    with open(path, "rb") as f:
+                        f.seek(lo - start)
+                        data[lo - ch.new_offset:hi - ch.new_offset] = f.read(hi - lo)
+            yield bytes(data)
+
+    reader = _StreamReader(base, pieces)
+    tail_blocks = (reader.read(tail_start + k * chunk_size, min(tail_start + (k + 1) * chunk_size, tail_end))
+                   for k in range(tail_count))
+
+    total = len(changed) + tail_count
+    label = "Compressing chunks…"
+    if progress:
+        progress(0, total, label)
+    layout = _Layout(base)
+    rows = chunks.copy()
+    new_rows = np.zeros(tail_count, dtype=binaryHelpers.CHUNK_ENTRY_DTYPE)
+    d64 = chunks["d64"][np.argmax(chunks["new_offset"])] if len(chunks) else 0
+    tmp = out_path + ".tmp"
+    try:
+        _copy_file(base.path, tmp)
+        with open(tmp, "r+b") as w, closing(compress_in_order(
+                itertools.chain(old_chunk_blocks(), tail_blocks), level, workers)) as compressed:
+            def append(data: bytes) -> int:
+                end = w.seek(0, os.SEEK_END)
+                at = _align(end, layout.chunk_alignment)
+                w.write(bytes(at - end)); w.write(data)
+                return at
+
+            for n, comp in enumerate(compressed):
+                if n < len(changed):
+                    c = changed[n]
+                    if len(comp) <= int(rows[c]["zsize"]):
+                        w.seek(int(rows[c]["offset"])); w.write(comp)
+                    else:
+                        rows[c]["offset"] = append(comp)
+                    rows[c]["zsize"] = len(comp)
+                else:
+                    k = n - len(changed)
+                    lo = tail_start + k * chunk_size
+                    new_rows[k] = (lo, append(comp), d64, min(chunk_size, tail_end - lo), len(comp))
+                if progress:
+                    progress(n + 1, total, label)
+
+            # File and name table rows of the replaced entries
+            files_at = layout.files_off + bfz.TABLE_PREFIX_SIZE
+            names_at = files_at + len(base.names) * binaryHelpers.FILE_ENTRY_DTYPE.itemsize
+            name_size_at = binaryHelpers.NAME_ENTRY_DTYPE.fields["size"][1]
+            for i in new_offsets:
+                row = files_at + i * binaryHelpers.FILE_ENTRY_DTYPE.itemsize
+                w.seek(row); w.write(struct.pack("<QQ", new_offsets[i], new_sizes[i]))
+                name_row = names_at + i * binaryHelpers.NAME_ENTRY_DTYPE.itemsize + name_size_at
+                w.seek(name_row)
+                if struct.unpack("<Q", w.read(8))[0] == int(sizes[i]):
+                    w.seek(name_row); w.write(struct.pack("<Q", new_sizes[i]))
+
+            # Chunk table: in place if the row count didn't change, else a bigger copy at the end
+            buf, rel = layout.locate(layout.chunks_off)
+            prefix = bytearray(buf[rel:rel + bfz.TABLE_PREFIX_SIZE])
+            if tail_count == 0:
+                w.seek(layout.chunks_off + bfz.TABLE_PREFIX_SIZE); w.write(rows.tobytes())
+            else:
+                struct.pack_into("<I", prefix, 0, struct.unpack_from("<I", prefix)[0] + tail_count)
+                end = w.seek(0, os.SEEK_END)
+                table_at = _align(end, 16)
+                w.write(bytes(table_at - end))
+                w.write(prefix + rows.tobytes() + new_rows.tobytes())
+                w.seek(0x38); w.write(struct.pack("<Q", table_at))
+                w.seek(0x48); w.write(struct.pack("<I", layout.header_chunks + tail_count))
+                w.seek(0x54); w.write(struct.pack("<I", layout.real_chunks + tail_count))
+            result = WriteResult(replaced=len(overrides), chunks=total,
+                                 chunks_copied=len(chunks) - len(changed),
+                                 bytes_written=w.seek(0, os.SEEK_END))
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    finally:
+        reader.close()
+    base.close()
+    os.replace(tmp, out_path)
+    return result
+
+def build_bfz_from_folder(
+    base_path: str,
+    folder: str,
+    out_path: str,
+    level: int = DEFAULT_LEVEL,
+    workers: Optional[int] = None,
+    incremental: bool = False,
+    progress: Optional[bfz.ProgressCallback] = None,
+) -> WriteResult:
+    """
+    Import a folder on top of the base archive, writing the result to out_path.
+    incremental patches only the changed chunks (fast, but the archive can only
+    grow), otherwise the whole archive is rebuilt and compacted.
+    """
+    base = bfz.BFZArchive(base_path, workers=workers)
+    try:
+        base.parse(lazy=True)
+        overrides, skipped = collect_overrides(base, folder, progress)
+        write = patch_bfz if incremental else write_bfz
+        result = write(base, overrides, out_path, level=level, workers=workers, progress=progress)
+        result.skipped = skipped
+        return result
+    finally:
+        base.close()
@@ -1,5 +1,8 @@
 import io
 import struct
+from typing import List
+
+import numpy as np
 
 def read_u32_le(f: io.BufferedReader) -> int:
     return struct.unpack("<I", f.read(4))[0]
@@ -16,3 +19,37 @@ def _pack_u64(v: int) -> bytes:
 def read_fixed_string(f: io.BufferedReader, size: int) -> str:
     raw = f.read(size)
     return raw.split(b"\x00", 1)[0].decode("utf-8", errors="ignore")
+
+# ----------------- Bulk tables -----------------
+# Each table is read with one f.read and decoded as a NumPy structured array
+
+FILE_ENTRY_DTYPE = np.dtype([
+    ("offset", "<u8"), ("size", "<u8"), ("d1", "<u4"), ("d2", "<u4"),
+])
+
+NAME_ENTRY_DTYPE = np.dtype([
+    ("name", "S64"), ("size", "<u8"), ("zero", "<u8"),
+    ("d3", "<u8"), ("id", "<u4"), ("d4", "<u4"),
+])
+
+CHUNK_ENTRY_DTYPE = np.dtype([
+    ("new_offset", "<u8"), ("offset", "<u8"), ("d64", "<u8"),
+    ("size", "<u4"), ("zsize", "<u4"),
+])
+
+def read_table(f: io.BufferedReader, dtype: np.dtype, count: int) -> np.ndarray:
+    raw = f.read(dtype.itemsize * count)
+    if len(raw) != dtype.itemsize * count:
+        raise ValueError(f"Truncated table (wanted {count} x {dtype.itemsize} bytes)")
+    return np.frombuffer(raw, dtype=dtype, count=count)
+
+def decode_fixed_strings(raw: np.ndarray) -> List[str]:
+    """Decode an 'S<n>' array like read_fixed_string would, with a single decode call."""
+    if len(raw) == 0:
+        return []
+    size = raw.dtype.itemsize
+    buf = np.ascontiguousarray(raw).view(np.uint8).reshape(len(raw), size).copy()
+    # Blank everything from the first NUL on, numpy then strips the padding for us
+    buf[np.cumsum(buf == 0, axis=1) > 0] = 0
+    strings = buf.view(f"S{size}").ravel().tolist()
+    return b"\x00".join(strings).decode("utf-8", errors="ignore").split("\x00")
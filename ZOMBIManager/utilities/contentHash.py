@@ -0,0 +1,136 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from utilities import bfz
+from utilities import parallelDecompress
+
+# ----------------- Content hashing -----------------
+# BLAKE2b-128 of every entry, the same digest assetIndex and the exporter use,
+# so hashes compare across archives and tools. Each distinct (offset, size)
+# payload is hashed once, in stream order, on a thread pool (hashlib drops the
+# GIL on big buffers), and the result goes into the archive's index cache.
+
+HASH_SIZE = 16
+# Entries per task are grouped up to about this many bytes
+BATCH_BYTES = 8 * 1024 * 1024
+
+def digest(data) -> bytes:
+    return hashlib.blake2b(data, digest_size=HASH_SIZE).digest()
+
+def hash_archive(
+    arch: bfz.BFZArchive,
+    workers: Optional[int] = None,
+    progress: Optional[bfz.ProgressCallback] = None,
+) -> np.ndarray:
+    """(files, 16) uint8 digests, one row per entry. Comes from the index cache when it has them."""
+    if arch.hashes is not None:
+        return arch.hashes
+    keys = np.stack([arch.offsets.astype(np.uint64), arch.sizes.astype(np.uint64)], axis=1)
+    unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+    digests = np.zeros((len(unique), HASH_SIZE), dtype=np.uint8)
+
+    # Sorted by offset already, so batches read the stream front to back
+    batches: List[Tuple[int, int]] = []
+    start, acc = 0, 0
+    for i, size in enumerate(unique[:, 1].tolist()):
+        acc += size
+        if acc >= BATCH_BYTES:
+            batches.append((start, i + 1)); start, acc = i + 1, 0
+    if start < len(unique):
+        batches.append((start, len(unique)))
+
+    def run(batch: Tuple[int, int]) -> int:
+        for i in range(*batch):
+            off, size = int(unique[i, 0]), int(unique[i, 1])
+            digests[i] = np.frombuffer(digest(arch.read_range_view(off, off + size)), dtype=np.uint8)
+        return batch[1] - batch[0]
+
+    label = "Hashing entries…"
+    total, done = len(unique), 0
+    if progress:
+        progress(0, total, label)
+    with ThreadPoolExecutor(max_workers=workers or parallelDecompress.default_workers()) as pool:
+        for n in pool.map(run, batches):
+            done += n
+            if progress:
+                progress(done, total, label)
+    hashes = digests[inverse.reshape(-1)]
+    arch.set_hashes(hashes)
+    return hashes
+
+def variant_groups(hashes: np.ndarray, entries: List[int]) -> List[int]:
+    """For same-named entries: payload group of each, numbered by first appearance."""
+    seen: Dict[bytes, int] = {}
+    return [seen.setdefault(hashes[e].tobytes(), len(seen)) for e in entries]
+
+# ----------------- Duplicate report -----------------
+
+@dataclass
+class DuplicateGroup:
+    digest: str
+    size: int
+    # Distinct stored copies: (archive, offset) pairs, same-offset aliases count once
+    copies: int
+    members: List[Tuple[str, str]] = field(default_factory=list)  # (archive, entry name)
+
+    @property
+    def wasted(self) -> int:
+        return self.size * (self.copies - 1)
+
+    @property
+    def archives(self) -> int:
+        return len({a for a, _ in self.members})
+
+# (archive, entry name, offset, size, hex digest)
+HashRow = Tuple[str, str, int, int, str]
+
+def archive_rows(path: str, arch: bfz.BFZArchive, hashes: np.ndarray) -> List[HashRow]:
+    hexes = hashes.tobytes().hex()
+    step = 2 * HASH_SIZE
+    return [(path, name, off, size, hexes[i * step:(i + 1) * step])
+            for i, (name, off, size) in enumerate(zip(arch.names, arch.offsets.tolist(), arch.sizes.tolist()))]
+
+def duplicate_groups(rows: Iterable[HashRow], min_size: int = 1) -> List[DuplicateGroup]:
+    """Payloads stored more than once, within or across archives, biggest waste first."""
+    groups: Dict[Tuple[str, int], DuplicateGroup] = {}
+    locations: Dict[Tuple[str, int], set] = {}
+    for archive, name, offset, size, hexdigest in rows:
+        if size < min_size or not hexdigest:
+            continue
+        key = (hexdigest, size)
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = DuplicateGroup(hexdigest, size, 0)
+            locations[key] = set()
+        group.members.append((archive, name))
+        locations[key].add((archive, offset))
+    found = []
+    for key, group in groups.items():
+        group.copies = len(locations[key])
+        if group.copies > 1:
+            found.append(group)
+    found.sort(key=lambda g: (-g.wasted, g.digest))
+    return found
+
+def summarize(groups: List[DuplicateGroup]) -> Dict[str, int]:
+    return dict(
+        groups=len(groups),
+        wasted_bytes=sum(g.wasted for g in groups),
+        within_archive=sum(1 for g in groups if g.archives == 1),
+        across_archives=sum(1 for g in groups if g.archives > 1),
+    )
+
+def format_report(groups: List[DuplicateGroup], top: int = 50) -> str:
+    s = summarize(groups)
+    lines = [f"{s['groups']:,} duplicated payloads ({s['within_archive']:,} within one archive, "
+             f"{s['across_archives']:,} across archives), {s['wasted_bytes']:,} bytes wasted"]
+    for g in groups[:top]:
+        lines.append(f"\n{g.wasted:,} bytes wasted: {g.copies} copies of {g.size:,} bytes ({g.digest})")
+        lines.extend(f"  {archive}: {name}" for archive, name in g.members)
+    if len(groups) > top:
+        lines.append(f"\n… {len(groups) - top:,} more")
+    return "\n".join(lines)
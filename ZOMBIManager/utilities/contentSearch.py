@@ -0,0 +1,282 @@
+import re
+from concurrent.futures import FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from utilities import assetIndex
+from utilities import bfz
+from utilities import parallelDecompress
+from utilities import tracing
+
+try:
+    import lzo
+except Exception:
+    lzo = None
+
+# ----------------- Content search -----------------
+# Finds byte patterns in the decompressed stream and maps the hits back to
+# entries. The stream is cut into ranges along chunk boundaries: with the
+# archive fully in memory they're scanned in place, otherwise (lazy mode,
+# background fill still running, or a CPU-bound regex) worker processes each
+# read and decompress their own chunks straight from the .bfz and search them.
+
+# Stream bytes per task
+RANGE_BYTES = 8 * 1024 * 1024
+# Regex hits longer than this can be missed where two ranges meet
+MAX_MATCH = 4096
+# Below this, starting processes costs more than it saves
+PARALLEL_MIN_BYTES = 32 * 1024 * 1024
+DEFAULT_MAX_HITS = 100_000
+# More alternatives than this go through one regex instead of a find() pass each
+MAX_LITERAL_PASSES = 4
+
+MODES = ("text", "hex", "regex", "wor")
+
+@dataclass
+class Query:
+    label: str
+    literals: List[bytes] = field(default_factory=list)
+    regex: Optional["re.Pattern[bytes]"] = None
+
+    def __post_init__(self):
+        if self.regex is None and len(self.literals) > MAX_LITERAL_PASSES:
+            self.regex = re.compile(b"|".join(re.escape(lit) for lit in self.literals))
+
+    @property
+    def overlap(self) -> int:
+        """Bytes a match can reach past the end of its range."""
+        return MAX_MATCH if self.regex is not None else max(len(lit) for lit in self.literals) - 1
+
+@dataclass
+class ContentHit:
+    entry: int    # row in the archive's tables
+    offset: int   # inside the entry
+    length: int
+
+# ----------------- Queries -----------------
+
+def parse_hex(text: str) -> bytes:
+    """Hex bytes: "DE AD be ef", "0xDEADBEEF", "de,ad"."""
+    digits = re.sub(r"0x|[\s,]", "", text.strip(), flags=re.I)
+    if not digits or len(digits) % 2 or not re.fullmatch(r"[0-9a-fA-F]+", digits):
+        raise ValueError(f"Not a hex byte pattern: {text}")
+    return bytes.fromhex(digits)
+
+def _unique(items: List[bytes]) -> List[bytes]:
+    return list(dict.fromkeys(items))
+
+def text_query(text: str, ignore_case: bool = False) -> Query:
+    """The string as UTF-8 and UTF-16 (both byte orders), ASCII case folded when ignore_case."""
+    if not text:
+        raise ValueError("Empty search text")
+    literals = _unique([text.encode("utf-8"), text.encode("utf-16-le"), text.encode("utf-16-be")])
+    regex = re.compile(b"|".join(re.escape(lit) for lit in literals), re.I) if ignore_case else None
+    return Query(f'"{text}"', literals, regex)
+
+def regex_query(text: str, ignore_case: bool = False) -> Query:
+    """Python regex over the raw bytes, the pattern itself is taken as UTF-8."""
+    try:
+        regex = re.compile(text.encode("utf-8"), re.DOTALL | (re.I if ignore_case else 0))
+    except re.error as e:
+        raise ValueError(f"Bad regex: {e}") from e
+    return Query(f"/{text}/", regex=regex)
+
+def wor_ids(text: str, descriptors: Optional[str] = assetIndex.DEFAULT_DESCRIPTORS) -> List[str]:
+    """An 8 digit wor ID as is, anything else looked up in the source paths of 'Wor Descriptors.txt'."""
+    text = text.strip()
+    if re.fullmatch(r"(0x)?[0-9A-Fa-f]{8}", text):
+        return [text[-8:].upper()]
+    needle = text.lower()
+    ids = [wid for wid, src in assetIndex.parse_wor_descriptors(descriptors).items() if needle in src.lower()]
+    if not ids:
+        raise ValueError(f"No wor ID or descriptor path matching {text}")
+    return ids
+
+def wor_query(text: str, descriptors: Optional[str] = assetIndex.DEFAULT_DESCRIPTORS) -> Query:
+    """References to a wor: its ID as text (ASCII/UTF-16) or as a 32-bit integer (either endianness)."""
+    ids = wor_ids(text, descriptors)
+    literals: List[bytes] = []
+    for wid in ids:
+        value = int(wid, 16)
+        literals += [wid.encode(), wid.lower().encode(), wid.encode("utf-16-le"),
+                     value.to_bytes(4, "little"), value.to_bytes(4, "big")]
+    label = f"wor {ids[0]}" if len(ids) == 1 else f"{len(ids)} wors matching {text}"
+    return Query(label, _unique(literals))
+
+def build_query(text: str, mode: str = "text", ignore_case: bool = False,
+                descriptors: Optional[str] = assetIndex.DEFAULT_DESCRIPTORS) -> Query:
+    if mode == "text":
+        return text_query(text, ignore_case)
+    if mode == "hex":
+        data = parse_hex(text)
+        return Query(data.hex(" ").upper(), [data])
+    if mode == "regex":
+        return regex_query(text, ignore_case)
+    if mode == "wor":
+        return wor_query(text, descriptors)
+    raise ValueError(f"Unknown search mode: {mode}")
+
+# ----------------- Scanning -----------------
+
+def _find(data, base: int, start: int, end: int, query: Query) -> List[Tuple[int, int]]:
+    """(stream position, length) of the matches starting in [start, end). data holds the stream from base on."""
+    lo, hi = start - base, min(len(data), end - base + query.overlap)
+    stop = end - base
+    hits: List[Tuple[int, int]] = []
+    if query.regex is not None:
+        for m in query.regex.finditer(data, lo, hi):
+            if m.start() >= stop:
+                break
+            if m.end() > m.start():
+                hits.append((base + m.start(), m.end() - m.start()))
+        return hits
+    for lit in query.literals:
+        i = data.find(lit, lo, hi)
+        while 0 <= i < stop:
+            hits.append((base + i, len(lit)))
+            i = data.find(lit, i + 1, hi)
+    return hits
+
+# (new_offset, offset, size, zsize) of each chunk a task decompresses
+ChunkRow = Tuple[int, int, int, int]
+
+def _scan_chunks(path: str, rows: Sequence[ChunkRow], start: int, end: int, query: Query) -> List[Tuple[int, int]]:
+    """Worker: decompress rows (covering [start, end) plus the overlap) out of the .bfz and search them."""
+    base = rows[0][0]
+    buf = bytearray(max(r[0] + r[2] for r in rows) - base)
+    with open(path, "rb") as f:
+        for new_offset, offset, size, zsize in rows:
+            f.seek(offset)
+            buf[new_offset - base:new_offset - base + size] = lzo.decompress(f.read(zsize), False, size)
+    return _find(buf, base, start, end, query)
+
+def _ranges(arch: bfz.BFZArchive, overlap: int) -> List[Tuple[int, int, List[ChunkRow]]]:
+    """[start, end) pieces of the stream, cut at chunk boundaries, each with the chunks it needs."""
+    chunks = arch.chunks[np.argsort(arch.chunks["new_offset"], kind="stable")]
+    rows: List[ChunkRow] = list(zip(chunks["new_offset"].tolist(), chunks["offset"].tolist(),
+                                    chunks["size"].tolist(), chunks["zsize"].tolist()))
+    ranges = []
+    i = 0
+    while i < len(rows):
+        start, j = rows[i][0], i + 1
+        while j < len(rows) and rows[j][0] + rows[j][2] - start <= RANGE_BYTES:
+            j += 1
+        end = rows[j - 1][0] + rows[j - 1][2]
+        # The next chunks too, as far as a match starting before end can reach
+        k = j
+        while k < len(rows) and rows[k][0] < end + overlap:
+            k += 1
+        ranges.append((start, end, rows[i:k]))
+        i = j
+    return ranges
+
+# ----------------- Mapping hits to entries -----------------
+
+class EntryLocator:
+    """Sorted offset index: stream position -> entries containing it (aliases share an offset)."""
+    def __init__(self, offsets: np.ndarray, sizes: np.ndarray):
+        offsets, sizes = offsets.astype(np.int64), sizes.astype(np.int64)
+        self.order = np.argsort(offsets, kind="stable")
+        self.starts = offsets[self.order]
+        self.ends = self.starts + sizes[self.order]
+        # Furthest end among the entries up to each one, bounds the walk back for overlaps
+        self.reach = np.maximum.accumulate(self.ends) if len(self.ends) else self.ends
+
+    def locate(self, hits: Sequence[Tuple[int, int]]) -> List[ContentHit]:
+        """Entries fully containing each match, matches in the padding between entries are dropped."""
+        if not hits or not len(self.starts):
+            return []
+        pos = np.fromiter((h[0] for h in hits), dtype=np.int64, count=len(hits))
+        found: List[ContentHit] = []
+        for p, (_, length), j in zip(pos.tolist(), hits, (np.searchsorted(self.starts, pos, "right") - 1).tolist()):
+            while j >= 0 and self.reach[j] > p:
+                if self.starts[j] <= p and p + length <= self.ends[j]:
+                    found.append(ContentHit(int(self.order[j]), p - int(self.starts[j]), length))
+                j -= 1
+        return found
+
+# ----------------- Engine -----------------
+
+def search_archive(
+    arch: bfz.BFZArchive,
+    query: Query,
+    workers: Optional[int] = None,
+    use_processes: Optional[bool] = None,
+    max_hits: int = DEFAULT_MAX_HITS,
+    progress: Optional[bfz.ProgressCallback] = None,
+) -> Iterator[List[ContentHit]]:
+    """
+    Yield the hits range by range as they come in (not in stream order when
+    parallel), stopping after max_hits. Needs a parsed archive, lazy or not.
+    Raise from progress, or stop iterating, to cancel.
+    """
+    workers = workers or parallelDecompress.default_workers()
+    in_memory = arch.memory is not None and not arch.fill_pending
+    if use_processes is None:
+        # Scanning memory in place beats decompressing again, unless a regex makes the scan the slow part
+        use_processes = workers > 1 and arch.data_size >= PARALLEL_MIN_BYTES and (not in_memory or query.regex is not None)
+    if (use_processes or not in_memory) and lzo is None:
+        raise RuntimeError("Please install python-lzo to parse BFZ files")
+    locator = EntryLocator(arch.offsets, arch.sizes)
+    ranges = _ranges(arch, query.overlap)
+    label = f"Searching for {query.label}…"
+    total, done, found = len(ranges), 0, 0
+    if progress:
+        progress(0, total, label)
+
+    def scan(r) -> List[Tuple[int, int]]:
+        start, end, rows = r
+        if in_memory:
+            return _find(arch.memory, 0, start, end, query)
+        return _scan_chunks(arch.path, rows, start, end, query)
+
+    with tracing.span("search", "search", query=query.label, processes=bool(use_processes)):
+        if not use_processes:
+            for r in ranges:
+                hits = locator.locate(scan(r))[:max_hits - found]
+                found += len(hits); done += 1
+                if progress:
+                    progress(done, total, label)
+                if hits:
+                    yield hits
+                if found >= max_hits:
+                    return
+            return
+
+        pool = parallelDecompress.process_pool(workers)
+        pending = {}
+        todo = iter(ranges)
+        try:
+            while True:
+                # Keep a few ranges per worker in flight
+                for r in todo:
+                    pending[pool.submit(_scan_chunks, arch.path, r[2], r[0], r[1], query)] = r
+                    if len(pending) >= workers * 2:
+                        break
+                if not pending:
+                    return
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    pending.pop(fut)
+                    hits = locator.locate(fut.result())[:max_hits - found]
+                    found += len(hits); done += 1
+                    if hits:
+                        yield hits
+                    if found >= max_hits:
+                        return
+                if progress:
+                    progress(done, total, label)
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+def search_entries(arch: bfz.BFZArchive, query: Query, **kwargs) -> Dict[int, List[ContentHit]]:
+    """All hits, grouped by entry (offset order within each)."""
+    by_entry: Dict[int, List[ContentHit]] = {}
+    for batch in search_archive(arch, query, **kwargs):
+        for hit in batch:
+            by_entry.setdefault(hit.entry, []).append(hit)
+    for hits in by_entry.values():
+        hits.sort(key=lambda h: h.offset)
+    return by_entry
@@ -0,0 +1,187 @@
+import traceback
+from typing import Dict, List, Optional
+
+from PySide6.QtCore import QThread, QTimer, Qt, Signal
+from PySide6.QtWidgets import (
+    QCheckBox, QComboBox, QDialog, QHBoxLayout, QLabel, QLineEdit, QProgressBar,
+    QPushButton, QTreeWidget, QTreeWidgetItem, QVBoxLayout,
+)
+
+from utilities import bfz
+from utilities import contentSearch
+
+# ----------------- Content search -----------------
+# Front end for contentSearch: hits stream in from a thread, get listed per
+# entry here and narrow the main tree down to the matching files as they come.
+
+# Offsets listed under each entry, the count column still has them all
+MAX_LISTED_HITS = 100
+
+class ContentSearchThread(QThread):
+    hitsFound = Signal(object)   # List[ContentHit]
+    progress = Signal(int, int)  # ranges done, total
+    failed = Signal(str)
+
+    def __init__(self, archive: bfz.BFZArchive, query: contentSearch.Query, parent=None):
+        super().__init__(parent)
+        self.archive, self.query = archive, query
+        self._canceled = False
+
+    def run(self):
+        try:
+            for hits in contentSearch.search_archive(self.archive, self.query, progress=self._progress):
+                if self._canceled: return
+                self.hitsFound.emit(hits)
+        except bfz.OperationCanceled:
+            pass
+        except Exception as e:
+            if not self._canceled:
+                self.failed.emit(f"{e}\n\n{traceback.format_exc()}")
+
+    def _progress(self, done: int, total: int, _label: str):
+        if self._canceled:
+            raise bfz.OperationCanceled()
+        self.progress.emit(done, total)
+
+    def cancel(self):
+        self._canceled = True
+        self.wait()
+
+class ContentSearchDialog(QDialog):
+    # Entry indices to show in the tree, None to show everything
+    matchesChanged = Signal(object)
+    # entry index, offset in the entry, length
+    hitActivated = Signal(int, int, int)
+
+    MODES = [("Text (UTF-8/UTF-16)", "text"), ("Hex bytes", "hex"), ("Regex", "regex"),
+             ("Wor ID or path", "wor")]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Search Contents")
+        self.resize(700, 500)
+        self.archive: Optional[bfz.BFZArchive] = None
+        self.thread_: Optional[ContentSearchThread] = None
+        self.hits: Dict[int, List[contentSearch.ContentHit]] = {}
+        self.items: Dict[int, QTreeWidgetItem] = {}
+
+        v = QVBoxLayout(self)
+        h = QHBoxLayout()
+        self.query_edit = QLineEdit(); self.query_edit.setPlaceholderText("Asset name, bytes, regex or wor ID")
+        self.query_edit.returnPressed.connect(self.on_search)
+        self.mode_combo = QComboBox()
+        for label, _mode in self.MODES: self.mode_combo.addItem(label)
+        self.case_check = QCheckBox("Ignore case")
+        self.search_btn = QPushButton("Search"); self.search_btn.clicked.connect(self.on_search)
+        h.addWidget(self.query_edit, 1); h.addWidget(self.mode_combo); h.addWidget(self.case_check); h.addWidget(self.search_btn)
+        v.addLayout(h)
+
+        self.results = QTreeWidget()
+        self.results.setColumnCount(3)
+        self.results.setHeaderLabels(["Entry", "Hits", "Offset"])
+        self.results.setColumnWidth(0, 440); self.results.setColumnWidth(1, 70)
+        self.results.itemDoubleClicked.connect(self.on_item_activated)
+        v.addWidget(self.results, 1)
+
+        h = QHBoxLayout()
+        self.bar = QProgressBar(); self.bar.setMaximumWidth(200); self.bar.hide()
+        self.status = QLabel("")
+        self.clear_btn = QPushButton("Show All Files"); self.clear_btn.clicked.connect(self.clear_results)
+        h.addWidget(self.status, 1); h.addWidget(self.bar); h.addWidget(self.clear_btn)
+        v.addLayout(h)
+
+        # The tree gets rebuilt on every update, don't do it per batch
+        self._emit_timer = QTimer(self); self._emit_timer.setSingleShot(True); self._emit_timer.setInterval(300)
+        self._emit_timer.timeout.connect(lambda: self.matchesChanged.emit(set(self.hits)))
+
+    # ----- state -----
+    def set_archive(self, archive: Optional[bfz.BFZArchive]):
+        """New archive in the window: drop the old results (the tree has already been reset)."""
+        self.stop()
+        self.archive = archive
+        self.hits.clear(); self.items.clear(); self.results.clear()
+        self.status.setText("")
+
+    def stop(self):
+        if self.thread_ is not None:
+            self.thread_.cancel(); self.thread_ = None
+        self._emit_timer.stop()
+        self.bar.hide(); self.search_btn.setText("Search")
+
+    def clear_results(self):
+        self.set_archive(self.archive)
+        self.matchesChanged.emit(None)
+
+    # ----- searching -----
+    def on_search(self):
+        if self.thread_ is not None:
+            self.stop(); self.status.setText(f"Stopped, {self._summary()}")
+            self.matchesChanged.emit(set(self.hits)); return
+        if self.archive is None:
+            self.status.setText("Open an archive first"); return
+        try:
+            query = contentSearch.build_query(self.query_edit.text(), self.MODES[self.mode_combo.currentIndex()][1],
+                                              self.case_check.isChecked())
+        except ValueError as e:
+            self.status.setText(str(e)); return
+        self.set_archive(self.archive)
+        self.matchesChanged.emit(set())
+        self.thread_ = ContentSearchThread(self.archive, query, self)
+        self.thread_.hitsFound.connect(self.on_hits)
+        self.thread_.progress.connect(lambda done, total: (self.bar.setRange(0, total), self.bar.setValue(done)))
+        self.thread_.failed.connect(lambda msg: self.status.setText(f"Search failed: {msg.splitlines()[0]}"))
+        self.thread_.finished.connect(self.on_finished)
+        self.search_btn.setText("Stop"); self.bar.setValue(0); self.bar.show()
+        self.status.setText(f"Searching for {query.label}…")
+        self.thread_.start()
+
+    def on_hits(self, hits: List[contentSearch.ContentHit]):
+        if self.sender() is not self.thread_:
+            return  # queued from a search that was stopped since
+        self.results.setUpdatesEnabled(False)
+        for hit in hits:
+            entry_hits = self.hits.setdefault(hit.entry, [])
+            entry_hits.append(hit)
+            item = self.items.get(hit.entry)
+            if item is None:
+                item = self.items[hit.entry] = QTreeWidgetItem([self.archive.names[hit.entry], "", ""])
+                item.setData(0, Qt.UserRole, (hit.entry, hit.offset, hit.length))
+                self.results.addTopLevelItem(item)
+            if len(entry_hits) <= MAX_LISTED_HITS:
+                child = QTreeWidgetItem(["", "", f"0x{hit.offset:X}"])
+                child.setData(0, Qt.UserRole, (hit.entry, hit.offset, hit.length))
+                item.addChild(child)
+            item.setText(1, f"{len(entry_hits):,}")
+            # Parallel ranges finish out of order, keep the first hit on the entry row
+            if hit.offset < item.data(0, Qt.UserRole)[1]:
+                item.setData(0, Qt.UserRole, (hit.entry, hit.offset, hit.length))
+            item.setText(2, f"0x{item.data(0, Qt.UserRole)[1]:X}")
+        self.results.setUpdatesEnabled(True)
+        self.status.setText(f"Searching… {self._summary()}")
+        if not self._emit_timer.isActive():
+            self._emit_timer.start()
+
+    def on_finished(self):
+        if self.sender() is not self.thread_:
+            return
+        self.thread_ = None
+        self._emit_timer.stop()
+        self.bar.hide(); self.search_btn.setText("Search")
+        if not self.status.text().startswith("Search failed"):
+            self.status.setText(self._summary())
+        self.results.sortItems(0, Qt.AscendingOrder)
+        self.matchesChanged.emit(set(self.hits))
+
+    def _summary(self) -> str:
+        total = sum(len(h) for h in self.hits.values())
+        return f"{total:,} hits in {len(self.hits):,} files"
+
+    def on_item_activated(self, item: QTreeWidgetItem, _column: int):
+        entry, offset, length = item.data(0, Qt.UserRole)
+        self.hitActivated.emit(entry, offset, length)
+
+    def done(self, result: int):
+        # Closed (Esc or the title bar): the filter goes away with the dialog
+        self.stop()
+        self.matchesChanged.emit(None)
+        super().done(result)
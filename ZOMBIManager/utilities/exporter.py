@@ -0,0 +1,243 @@
+import hashlib
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from utilities import bfz
+from utilities import formats
+from utilities import parallelDecompress
+from utilities import previewers
+from utilities import tracing
+
+# ----------------- Export engine -----------------
+# Plans the whole export up front (paths, directories, duplicates), then writes
+# raw payloads on a thread pool straight from the archive's memoryviews and runs
+# format conversion (formats.FileFormat.convert) on a process pool.
+
+MANIFEST_NAME = "_duplicates.json"
+
+@dataclass
+class ExportItem:
+    entry: bfz.BFZFileEntry
+    out_path: str
+    convert: bool = False
+    # Format sniffed when converting (see formats)
+    fmt: formats.FileFormat = formats.UNKNOWN
+    # Output path of the identical payload this one duplicates, if any
+    duplicate_of: Optional[str] = None
+
+@dataclass
+class ExportResult:
+    written: int = 0
+    linked: int = 0
+    manifest: int = 0
+    converted: int = 0
+    bytes_written: int = 0
+    errors: List[str] = field(default_factory=list)
+    # Streaming export (streamExport): most decompressed bytes held at once
+    peak_buffered: int = 0
+
+def default_workers() -> int:
+    return os.cpu_count() or 1
+
+def normalize_name(name: str) -> str:
+    return name.replace("\\", "/").strip("/")
+
+# ----------------- Converters (run in worker processes) -----------------
+
+def convert_son(data: bytes) -> Optional[bytes]:
+    wav = previewers.extract_wav_from_son(data)
+    return bytes(wav) if wav is not None else None
+
+def convert_tdt(data: bytes) -> Optional[bytes]:
+    from io import BytesIO
+    from utilities import textureFile
+    img = textureFile.decode_tdt(data)
+    if img is None:
+        return None
+    out = BytesIO()
+    img.save(out, "PNG")
+    return out.getvalue()
+
+def _convert_and_write(key: str, data: bytes, out_path: str, raw_path: str) -> Tuple[bool, int]:
+    """Convert and write; falls back to the raw payload at raw_path if conversion fails."""
+    try:
+        converted = formats.convert(formats.by_key(key), data)
+    except Exception:
+        converted = None
+    if converted is None:
+        with open(raw_path, "wb") as w: w.write(data)
+        return False, len(data)
+    with open(out_path, "wb") as w: w.write(converted)
+    return True, len(converted)
+
+def _write_raw(view: memoryview, out_path: str) -> int:
+    with open(out_path, "wb") as w: w.write(view)
+    return len(view)
+
+# ----------------- Planning -----------------
+
+def plan_export(
+    arch: bfz.BFZArchive,
+    out_dir: str,
+    entries: Optional[Sequence[bfz.BFZFileEntry]] = None,
+    convert: bool = False,
+    dedupe: Optional[str] = "offset",
+) -> List[ExportItem]:
+    """
+    Work out every output path. Same-named variants get a ~N suffix instead of
+    overwriting each other. dedupe is "offset" (same offset/size), "hash"
+    (same content) or None. What gets converted goes by formats.sniff_archive.
+    """
+    if entries is None:
+        entries = list(arch.file_entries)
+    types = formats.sniff_archive(arch) if convert else None
+    items: List[ExportItem] = []
+    seen_paths: Dict[str, int] = {}
+    for entry in entries:
+        rel = normalize_name(entry.name) or f"entry_{entry.index}.bin"
+        ext = os.path.splitext(rel)[1].lower()
+        fmt = formats.FORMATS[types[entry.index]] if convert else formats.UNKNOWN
+        do_convert = bool(fmt.convert) and ext != fmt.convert_ext
+        if do_convert:
+            rel = os.path.splitext(rel)[0] + fmt.convert_ext
+        key = rel.lower()
+        if key in seen_paths:
+            seen_paths[key] += 1
+            stem, e = os.path.splitext(rel)
+            rel = f"{stem}~{seen_paths[key]}{e}"
+        else:
+            seen_paths[key] = 1
+        items.append(ExportItem(entry, os.path.join(out_dir, rel), do_convert, fmt))
+
+    if dedupe:
+        if dedupe == "hash":
+            keys = _content_keys(arch, items)
+        else:
+            keys = [(it.entry.offset, it.entry.size, it.convert) for it in items]
+        primary: Dict[tuple, str] = {}
+        for item, key in zip(items, keys):
+            if item.entry.size == 0:
+                continue
+            if key in primary:
+                item.duplicate_of = primary[key]
+            else:
+                primary[key] = item.out_path
+    return items
+
+def _content_keys(arch: bfz.BFZArchive, items: List[ExportItem]) -> List[tuple]:
+    # hashlib drops the GIL on large buffers, so threads are enough here
+    def digest(item: ExportItem) -> tuple:
+        h = hashlib.blake2b(arch.read_file_view(item.entry), digest_size=16).digest()
+        return (h, item.entry.size, item.convert)
+    with ThreadPoolExecutor(max_workers=default_workers()) as pool:
+        return list(pool.map(digest, items))
+
+# ----------------- Running -----------------
+
+@tracing.traced("export_entries", "export")
+def export_entries(
+    arch: bfz.BFZArchive,
+    out_dir: str,
+    entries: Optional[Sequence[bfz.BFZFileEntry]] = None,
+    convert: bool = False,
+    dedupe: Optional[str] = "offset",
+    hardlink: bool = True,
+    workers: Optional[int] = None,
+    progress: Optional[bfz.ProgressCallback] = None,
+) -> ExportResult:
+    """
+    Export entries (default: all) under out_dir. Duplicates are hardlinked to
+    the first copy, or listed in _duplicates.json when links aren't possible.
+    """
+    items = plan_export(arch, out_dir, entries, convert, dedupe)
+    result = ExportResult()
+    total = len(items)
+    label = "Exporting files…"
+    if progress:
+        progress(0, total, label)
+
+    # Directories once, up front
+    for d in sorted({os.path.dirname(it.out_path) for it in items}):
+        os.makedirs(d, exist_ok=True)
+
+    workers = workers or default_workers()
+    primaries = [it for it in items if it.duplicate_of is None]
+    duplicates = [it for it in items if it.duplicate_of is not None]
+    done = 0
+
+    io_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bfz-export")
+    cpu_pool = parallelDecompress.process_pool(workers) if any(it.convert for it in primaries) else None
+    pending: Dict[Future, ExportItem] = {}
+
+    def collect(block_until: int):
+        nonlocal done
+        while len(pending) > block_until:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                item = pending.pop(fut)
+                try:
+                    if item.convert:
+                        ok, n = fut.result()
+                        result.converted += int(ok)
+                    else:
+                        n = fut.result()
+                    result.written += 1
+                    result.bytes_written += n
+                    tracing.count("export", n)
+                except Exception as e:
+                    result.errors.append(f"{item.entry.name}: {e}")
+                done += 1
+            if progress:
+                progress(done, total, label)
+
+    try:
+        for item in primaries:
+            if item.convert:
+                ext = os.path.splitext(item.entry.name)[1].lower()
+                raw_path = os.path.splitext(item.out_path)[0] + ext
+                data = bytes(arch.read_file_view(item.entry))
+                fut = cpu_pool.submit(_convert_and_write, item.fmt.key, data, item.out_path, raw_path)
+            else:
+                fut = io_pool.submit(_write_raw, arch.read_file_view(item.entry), item.out_path)
+            pending[fut] = item
+            collect(workers * 4)
+        collect(0)
+    finally:
+        io_pool.shutdown(wait=True, cancel_futures=True)
+        if cpu_pool:
+            cpu_pool.shutdown(wait=True, cancel_futures=True)
+
+    # Duplicates point at a primary that is on disk by now
+    manifest: Dict[str, str] = {}
+    for item in duplicates:
+        src, dst = item.duplicate_of, item.out_path
+        if item.convert and not os.path.exists(src):
+            # Conversion failed, the primary was written raw instead
+            ext = os.path.splitext(item.entry.name)[1].lower()
+            src, dst = os.path.splitext(src)[0] + ext, os.path.splitext(dst)[0] + ext
+        if hardlink and _try_link(src, dst):
+            result.linked += 1
+        else:
+            manifest[os.path.relpath(dst, out_dir)] = os.path.relpath(src, out_dir)
+            result.manifest += 1
+        done += 1
+        if progress and done % 256 == 0:
+            progress(done, total, label)
+    if manifest:
+        with open(os.path.join(out_dir, MANIFEST_NAME), "w", encoding="utf-8") as w:
+            json.dump(manifest, w, indent=1, sort_keys=True)
+    if progress:
+        progress(total, total, label)
+    return result
+
+def _try_link(src: str, dst: str) -> bool:
+    try:
+        if os.path.lexists(dst):
+            os.unlink(dst)
+        os.link(src, dst)
+        return True
+    except OSError:
+        return False
@@ -0,0 +1,178 @@
+import importlib
+import os
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from utilities import bfz
+
+# ----------------- File formats -----------------
+# What an entry is gets decided from its first bytes, the extension is only the
+# fallback. The whole archive is sniffed in one numpy pass over a (files,
+# SNIFF_BYTES) matrix of entry headers once it's in memory, and the codes are
+# kept with the index cache like the content hashes. Handlers (preview,
+# conversion) are "module:function" names, imported the first time an entry of
+# that format needs them, so nothing heavy (PIL, the texture decoders) gets
+# loaded at startup.
+
+# Bytes of each entry looked at
+SNIFF_BYTES = 256
+# Entries per numpy pass, bounds the (rows, SNIFF_BYTES) index matrix
+SNIFF_BATCH = 8192
+# Bump when codes or rules change, cached codes from older versions are dropped
+SNIFF_VERSION = 1
+
+@dataclass(frozen=True)
+class FileFormat:
+    key: str
+    label: str                       # Type column
+    extensions: Tuple[str, ...] = ()
+    preview: Optional[str] = None    # "module:function", data -> previewCache.Preview
+    convert: Optional[str] = None    # "module:function", data -> bytes or None
+    convert_ext: str = ""            # extension of the converted output
+
+# The index is the code stored per entry, only ever append
+FORMATS: List[FileFormat] = [
+    FileFormat("", ""),
+    FileFormat("empty", "Empty"),
+    FileFormat("tdt", "TDT texture", (".tdt",), "utilities.previewCache:preview_tdt",
+               "utilities.exporter:convert_tdt", ".png"),
+    FileFormat("son", "SON sound", (".son",), "utilities.previewCache:preview_sound",
+               "utilities.exporter:convert_son", ".wav"),
+    FileFormat("wav", "WAV audio", (".wav",), "utilities.previewCache:preview_sound",
+               "utilities.exporter:convert_son", ".wav"),
+    FileFormat("dds", "DDS texture", (".dds",), "utilities.previewCache:preview_image"),
+    FileFormat("png", "PNG image", (".png",), "utilities.previewCache:preview_image"),
+    FileFormat("jpeg", "JPEG image", (".jpg", ".jpeg"), "utilities.previewCache:preview_image"),
+    FileFormat("ogg", "Ogg audio", (".ogg",)),
+    FileFormat("xml", "XML", (".xml",), "utilities.previewCache:preview_text"),
+    FileFormat("text", "Text", (".txt", ".ini", ".cfg", ".csv", ".json", ".lua"), "utilities.previewCache:preview_text"),
+]
+UNKNOWN = FORMATS[0]
+CODES: Dict[str, int] = {f.key: i for i, f in enumerate(FORMATS)}
+_EXT_CODES: Dict[str, int] = {ext: i for i, f in enumerate(FORMATS) for ext in f.extensions}
+
+# (format, ((offset, magic), ...)): every magic has to match, earlier rules win
+MAGIC: List[Tuple[str, Tuple[Tuple[int, bytes], ...]]] = [
+    ("tdt", ((0x10, b"TDT_"),)),
+    ("wav", ((0, b"RIFF"), (8, b"WAVE"))),
+    ("dds", ((0, b"DDS "),)),
+    ("png", ((0, b"\x89PNG\r\n\x1a\n"),)),
+    ("jpeg", ((0, b"\xff\xd8\xff"),)),
+    ("ogg", ((0, b"OggS"),)),
+    ("xml", ((0, b"<?xml"),)),
+    ("xml", ((0, b"\xef\xbb\xbf<?xml"),)),
+]
+_COLS = np.arange(SNIFF_BYTES)
+
+def by_key(key: str) -> FileFormat:
+    return FORMATS[CODES[key]]
+
+def by_extension(name: str) -> FileFormat:
+    return FORMATS[_EXT_CODES.get(os.path.splitext(name)[1].lower(), 0)]
+
+def type_label(fmt: FileFormat, name: str) -> str:
+    """Type column text: the format, or the bare extension when nothing matched."""
+    return fmt.label or os.path.splitext(name)[1].lower() or "-"
+
+# ----------------- Sniffing -----------------
+
+def extension_codes(names: Sequence[str]) -> np.ndarray:
+    # Cheaper than splitext, matters at 100k names. Without a dot it looks up the
+    # last character, which is never a key.
+    return np.array([_EXT_CODES.get(n[n.rfind("."):].lower(), 0) for n in names], dtype=np.uint8)
+
+def _matches(headers: np.ndarray, offset: int, magic: bytes) -> np.ndarray:
+    return np.all(headers[:, offset:offset + len(magic)] == np.frombuffer(magic, dtype=np.uint8), axis=1)
+
+def sniff_headers(headers: np.ndarray, sizes: np.ndarray, names: Sequence[str]) -> np.ndarray:
+    """
+    Format code per row. headers is (n, SNIFF_BYTES) uint8 holding each entry's
+    first bytes, zeroes past its end; sizes are the full entry sizes.
+    """
+    codes = extension_codes(names)
+    sizes = np.asarray(sizes, dtype=np.int64)
+    valid = _COLS[:headers.shape[1]] < np.minimum(sizes, headers.shape[1])[:, None]
+    # Lowest priority first, each rule overwrites the ones before it
+    text = (headers >= 0x20) & (headers != 0x7F)
+    text |= (headers == 0x09) | (headers == 0x0A) | (headers == 0x0D)
+    codes[(codes == 0) & (sizes > 0) & np.all(text | ~valid, axis=1)] = CODES["text"]
+    # SONs are a header with a RIFF/WAVE somewhere after it
+    riff = headers[:, :-3] == ord("R")
+    for k, c in enumerate(b"IFF", 1):
+        riff &= headers[:, k:headers.shape[1] - 3 + k] == c
+    codes[np.any(riff[:, 1:], axis=1)] = CODES["son"]
+    for key, magics in reversed(MAGIC):
+        hit = np.ones(len(codes), dtype=bool)
+        for offset, magic in magics:
+            hit &= _matches(headers, offset, magic)
+        codes[hit] = CODES[key]
+    codes[sizes == 0] = CODES["empty"]
+    return codes
+
+def sniff(name: str, data) -> FileFormat:
+    """Format of one entry from its bytes (the first SNIFF_BYTES are enough)."""
+    head = np.frombuffer(data, dtype=np.uint8, count=min(len(data), SNIFF_BYTES))
+    headers = np.zeros((1, SNIFF_BYTES), dtype=np.uint8)
+    headers[0, :len(head)] = head
+    return FORMATS[sniff_headers(headers, [len(data)], [name])[0]]
+
+def sniff_archive(arch: "bfz.BFZArchive") -> np.ndarray:
+    """
+    Format code of every entry. Sniffed when the archive is fully in memory
+    (and cached with its index from then on), by extension until then.
+    """
+    if arch.types is not None:
+        return arch.types
+    if arch.memory is None or arch.fill_pending:
+        return extension_codes(arch.names)
+    n = len(arch.names)
+    codes = np.zeros(n, dtype=np.uint8)
+    if n:
+        buf = np.frombuffer(arch.memory, dtype=np.uint8)
+        if len(buf) < SNIFF_BYTES:
+            buf = np.concatenate([buf, np.zeros(SNIFF_BYTES - len(buf), dtype=np.uint8)])
+        # Row i is buf[i:i + SNIFF_BYTES], indexing it copies out just the headers
+        windows = np.lib.stride_tricks.sliding_window_view(buf, SNIFF_BYTES)
+        last = len(buf) - SNIFF_BYTES
+        offsets, sizes = arch.offsets.astype(np.int64), arch.sizes.astype(np.int64)
+        for lo in range(0, n, SNIFF_BATCH):
+            hi = min(n, lo + SNIFF_BATCH)
+            headers = windows[np.minimum(offsets[lo:hi], last)]
+            # Entries starting in the last window's span
+            for r in np.flatnonzero(offsets[lo:hi] > last).tolist():
+                tail = buf[offsets[lo + r]:]
+                headers[r] = 0
+                headers[r, :len(tail)] = tail
+            headers[_COLS >= sizes[lo:hi, None]] = 0
+            codes[lo:hi] = sniff_headers(headers, sizes[lo:hi], arch.names[lo:hi])
+        del windows, buf
+    arch.set_types(codes)
+    return codes
+
+def entry_format(arch: "bfz.BFZArchive", i: int) -> FileFormat:
+    """One entry's format: the sniffed code when known, else sniffed from its first bytes."""
+    if arch.types is not None:
+        return FORMATS[arch.types[i]]
+    offset, size = int(arch.offsets[i]), int(arch.sizes[i])
+    return sniff(arch.names[i], arch.read_range_view(offset, offset + min(size, SNIFF_BYTES)))
+
+# ----------------- Handlers -----------------
+
+_handlers: Dict[str, Callable] = {}
+
+def handler(spec: str) -> Callable:
+    """Resolve a "module:function" handler, importing its module on first use."""
+    fn = _handlers.get(spec)
+    if fn is None:
+        module, _, name = spec.partition(":")
+        fn = _handlers[spec] = getattr(importlib.import_module(module), name)
+    return fn
+
+def convert(fmt: FileFormat, data) -> Optional[bytes]:
+    """Converted bytes (fmt.convert_ext), None when the format has no converter or it fails."""
+    if not fmt.convert:
+        return None
+    return handler(fmt.convert)(data)
@@ -0,0 +1,100 @@
+import os
+import traceback
+from typing import Optional
+
+from PySide6.QtCore import Qt, QTimer, Signal
+from PySide6.QtWidgets import (
+    QApplication, QDialog, QFileDialog, QHBoxLayout, QLabel, QLineEdit,
+    QMessageBox, QProgressDialog, QPushButton, QTreeWidget, QTreeWidgetItem,
+    QVBoxLayout,
+)
+
+from utilities import assetIndex
+from utilities import bfz
+
+# ----------------- Global search -----------------
+# Searches the asset database (assetIndex) for the whole Data folder
+
+class GlobalSearchDialog(QDialog):
+    # archive path, entry name
+    openRequested = Signal(str, str)
+
+    def __init__(self, parent=None, data_dir: str = "", db_path: Optional[str] = None):
+        super().__init__(parent)
+        self.setWindowTitle("Search Data Folder")
+        self.resize(900, 500)
+        self.db_path = db_path or assetIndex.default_db_path()
+        self.con = assetIndex.connect(self.db_path)
+
+        v = QVBoxLayout(self)
+        h = QHBoxLayout()
+        self.dir_edit = QLineEdit(data_dir); self.dir_edit.setPlaceholderText("ZOMBI Data folder")
+        browse = QPushButton("Browse…"); browse.clicked.connect(self.on_browse)
+        self.index_btn = QPushButton("Update Index"); self.index_btn.clicked.connect(self.on_index)
+        h.addWidget(QLabel("Data:")); h.addWidget(self.dir_edit, 1); h.addWidget(browse); h.addWidget(self.index_btn)
+        v.addLayout(h)
+
+        self.query = QLineEdit(); self.query.setPlaceholderText("Search by name (substring, or glob with * and ?)")
+        v.addWidget(self.query)
+
+        self.results = QTreeWidget()
+        self.results.setColumnCount(4)
+        self.results.setHeaderLabels(["Name", "Archive", "Size", "Source"])
+        self.results.setColumnWidth(0, 380); self.results.setColumnWidth(1, 160); self.results.setColumnWidth(2, 90)
+        self.results.itemDoubleClicked.connect(self.on_result_activated)
+        v.addWidget(self.results, 1)
+        self.status = QLabel(""); v.addWidget(self.status)
+
+        # Don't query on every keystroke
+        self._timer = QTimer(self); self._timer.setSingleShot(True); self._timer.setInterval(150)
+        self._timer.timeout.connect(self.run_search)
+        self.query.textChanged.connect(lambda _t: self._timer.start())
+
+    def on_browse(self):
+        d = QFileDialog.getExistingDirectory(self, "Select ZOMBI Data folder", self.dir_edit.text())
+        if d: self.dir_edit.setText(d)
+
+    def on_index(self):
+        data_dir = self.dir_edit.text().strip()
+        if not data_dir or not os.path.isdir(data_dir):
+            QMessageBox.warning(self, "Index", "Pick the game's Data folder first"); return
+        progress = QProgressDialog("Indexing archives…", "Cancel", 0, 0, self)
+        progress.setWindowModality(Qt.WindowModal); progress.show()
+        QApplication.processEvents()
+
+        def on_progress(done: int, total: int, label: str):
+            progress.setLabelText(label); progress.setRange(0, total); progress.setValue(done)
+            QApplication.processEvents()
+            if progress.wasCanceled():
+                raise bfz.OperationCanceled()
+
+        try:
+            stats = assetIndex.build_index(data_dir, self.db_path, progress=on_progress)
+            self.status.setText(f"{stats['archives']} archives, {stats['updated']} (re)indexed, "
+                                f"{stats['removed']} removed, {stats['errors']} errors")
+        except bfz.OperationCanceled:
+            self.status.setText("Indexing canceled")
+        except Exception as e:
+            QMessageBox.critical(self, "Index error", f"Failed to index:\n{e}\n\n{traceback.format_exc()}")
+        finally:
+            progress.close()
+        self.run_search()
+
+    def run_search(self):
+        self.results.clear()
+        q = self.query.text()
+        if not q.strip():
+            self.status.setText(""); return
+        hits = assetIndex.search(q, con=self.con)
+        items = []
+        for h in hits:
+            item = QTreeWidgetItem([h.name, os.path.basename(h.archive), f"{h.size:,}", h.source_path or ""])
+            item.setData(0, Qt.UserRole, (h.archive, h.name))
+            item.setToolTip(1, h.archive)
+            items.append(item)
+        self.results.addTopLevelItems(items)
+        self.status.setText(f"{len(hits)} matches" + (" (limit reached)" if len(hits) >= 1000 else ""))
+
+    def on_result_activated(self, item: QTreeWidgetItem, _col: int):
+        data = item.data(0, Qt.UserRole)
+        if data: self.openRequested.emit(*data)
@@ -0,0 +1,168 @@
+from typing import List, Optional
+
+import numpy as np
+from PySide6.QtCore import QRect, Signal
+from PySide6.QtGui import QColor, QFontDatabase, QPainter
+from PySide6.QtWidgets import QAbstractScrollArea
+
+from utilities import contentSearch
+from utilities import previewers
+
+# ----------------- Hex view -----------------
+# Only the rows on screen are ever formatted, straight from the entry's
+# memoryview: offsets, hex and ASCII columns come out of NumPy lookup tables
+# as one char array per paint, so a 100 MB+ entry scrolls like a 1 KB one.
+
+BYTES_PER_ROW = 16
+SEARCH_WINDOW = 4 * 1024 * 1024
+
+_HEX_DIGITS = np.frombuffer(b"0123456789ABCDEF", dtype=np.uint8)
+# byte -> "XX "
+_HEX3 = np.stack([_HEX_DIGITS[np.arange(256) >> 4], _HEX_DIGITS[np.arange(256) & 0xF],
+                  np.full(256, ord(" "), dtype=np.uint8)], axis=1)
+# byte -> itself if printable, "." otherwise
+_ASCII = np.where((np.arange(256) >= 32) & (np.arange(256) < 127), np.arange(256), ord(".")).astype(np.uint8)
+
+def offset_digits(size: int) -> int:
+    return max(8, len(f"{max(size - 1, 0):X}"))
+
+def format_rows(data: np.ndarray, first_row: int, rows: int, digits: int = 8) -> List[str]:
+    """'OFFSET  XX XX ..  ascii' lines for rows [first_row, first_row + rows) of a uint8 array."""
+    start = first_row * BYTES_PER_ROW
+    block = data[start:start + rows * BYTES_PER_ROW]
+    rows = -(-len(block) // BYTES_PER_ROW)
+    if rows <= 0:
+        return []
+    pad = rows * BYTES_PER_ROW - len(block)
+    grid = np.concatenate([block, np.zeros(pad, np.uint8)]).reshape(rows, BYTES_PER_ROW)
+
+    offsets = start + np.arange(rows, dtype=np.int64) * BYTES_PER_ROW
+    shifts = 4 * np.arange(digits - 1, -1, -1, dtype=np.int64)
+    off_cols = _HEX_DIGITS[(offsets[:, None] >> shifts) & 0xF]
+    hex_cols = _HEX3[grid].reshape(rows, 3 * BYTES_PER_ROW)
+    ascii_cols = _ASCII[grid]
+    if pad:
+        # Blank out the bytes past the end on the last row
+        hex_cols[-1, 3 * (BYTES_PER_ROW - pad):] = ord(" ")
+        ascii_cols[-1, BYTES_PER_ROW - pad:] = ord(" ")
+    gap = np.full((rows, 2), ord(" "), np.uint8)
+    lines = np.concatenate([off_cols, gap, hex_cols, gap[:, :1], ascii_cols], axis=1)
+    width = lines.shape[1]
+    text = lines.tobytes().decode("latin-1")
+    return [text[i:i + width] for i in range(0, len(text), width)]
+
+def parse_pattern(text: str) -> bytes:
+    """Hex bytes ("DE AD be ef", "0xDEADBEEF"), or a quoted string for ASCII ("\\"TDT_\\"")."""
+    text = text.strip()
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in "\"'":
+        return text[1:-1].encode("latin-1")
+    return contentSearch.parse_hex(text)
+
+def find_pattern(data: np.ndarray, pattern: bytes, start: int = 0) -> int:
+    """First offset >= start where pattern occurs, -1 if none. Scans in windows, never copies the whole entry."""
+    if not pattern:
+        return -1
+    overlap = len(pattern) - 1
+    pos = max(start, 0)
+    while pos < len(data):
+        window = data[pos:pos + SEARCH_WINDOW + overlap].tobytes()
+        hit = window.find(pattern)
+        if hit >= 0:
+            return pos + hit
+        pos += SEARCH_WINDOW
+    return -1
+
+class HexView(QAbstractScrollArea):
+    # offset of the highlighted bytes
+    offsetChanged = Signal(int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        self.data = np.zeros(0, np.uint8)
+        self.digits = 8
+        self.highlight_start, self.highlight_len = -1, 0
+        self.verticalScrollBar().setSingleStep(1)
+
+    # ----- data -----
+    def set_data(self, data: Optional[previewers.BytesLike]):
+        self.data = np.frombuffer(data, dtype=np.uint8) if data is not None and len(data) else np.zeros(0, np.uint8)
+        self.digits = offset_digits(len(self.data))
+        self.highlight_start, self.highlight_len = -1, 0
+        self._update_scrollbar()
+        self.verticalScrollBar().setValue(0)
+        self.viewport().update()
+
+    def clear(self):
+        # Drops the reference to the archive's buffer as well
+        self.set_data(None)
+
+    @property
+    def row_count(self) -> int:
+        return -(-len(self.data) // BYTES_PER_ROW)
+
+    def _visible_rows(self) -> int:
+        return max(1, self.viewport().height() // self.fontMetrics().height())
+
+    def _update_scrollbar(self):
+        bar, visible = self.verticalScrollBar(), self._visible_rows()
+        bar.setRange(0, max(0, self.row_count - visible)); bar.setPageStep(visible)
+
+    # ----- navigation -----
+    def goto(self, offset: int, length: int = 1):
+        """Highlight [offset, offset + length) and scroll it into view."""
+        if not (0 <= offset < len(self.data)):
+            raise ValueError(f"Offset 0x{offset:X} is outside the entry (0x{len(self.data):X} bytes)")
+        self.highlight_start, self.highlight_len = offset, max(1, length)
+        row, bar = offset // BYTES_PER_ROW, self.verticalScrollBar()
+        if not (bar.value() <= row < bar.value() + self._visible_rows()):
+            bar.setValue(max(0, row - self._visible_rows() // 3))
+        self.viewport().update()
+        self.offsetChanged.emit(offset)
+
+    def find_next(self, pattern: bytes) -> int:
+        """Search after the current highlight, wrapping around once. Returns the hit or -1."""
+        start = self.highlight_start + 1 if self.highlight_start >= 0 else 0
+        hit = find_pattern(self.data, pattern, start)
+        if hit < 0 and start:
+            hit = find_pattern(self.data[:start + len(pattern) - 1], pattern)
+        if hit >= 0:
+            self.goto(hit, len(pattern))
+        return hit
+
+    # ----- Qt -----
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self._update_scrollbar()
+
+    def scrollContentsBy(self, dx: int, dy: int):
+        self.viewport().update()
+
+    def paintEvent(self, event):
+        p = QPainter(self.viewport())
+        p.fillRect(self.viewport().rect(), self.palette().base())
+        fm = self.fontMetrics()
+        line_h, char_w = fm.height(), fm.horizontalAdvance("0")
+        first = self.verticalScrollBar().value()
+        lines = format_rows(self.data, first, self._visible_rows() + 1, self.digits)
+
+        # Highlighted bytes, in both the hex and the ASCII column
+        if self.highlight_len:
+            hex_x, ascii_x = self.digits + 2, self.digits + 2 + 3 * BYTES_PER_ROW + 1
+            color = QColor(90, 120, 180)
+            first_byte = first * BYTES_PER_ROW
+            lo = max(self.highlight_start, first_byte)
+            hi = min(self.highlight_start + self.highlight_len, first_byte + len(lines) * BYTES_PER_ROW)
+            pos = lo
+            while pos < hi:
+                row, col = divmod(pos - first_byte, BYTES_PER_ROW)
+                n = min(hi - pos, BYTES_PER_ROW - col)
+                y = row * line_h
+                p.fillRect(QRect((hex_x + 3 * col) * char_w, y, (3 * n - 1) * char_w, line_h), color)
+                p.fillRect(QRect((ascii_x + col) * char_w, y, n * char_w, line_h), color)
+                pos += n
+
+        p.setPen(self.palette().text().color())
+        for row, line in enumerate(lines):
+            p.drawText(0, row * line_h + fm.ascent(), line)
+        p.end()
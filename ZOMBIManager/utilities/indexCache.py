@@ -0,0 +1,78 @@
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import List, Optional
+
+import numpy as np
+
+# Decoded BFZ tables are saved here so re-opening an archive skips table decoding
+# Bump when the layout of the cached arrays changes
+INDEX_CACHE_VERSION = 1
+
+def cache_root() -> str:
+    """Base folder for everything ZOMBI Manager caches, ZOMBI_CACHE_DIR overrides it."""
+    base = os.environ.get("ZOMBI_CACHE_DIR")
+    if not base:
+        base = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "ZOMBIManager")
+    return base
+
+def default_cache_dir() -> str:
+    return os.path.join(cache_root(), "index")
+
+@dataclass
+class ArchiveIndex:
+    names: List[str]
+    offsets: np.ndarray
+    sizes: np.ndarray
+    chunks: np.ndarray
+    # (files, 16) BLAKE2b digests once something has hashed the contents (contentHash)
+    hashes: Optional[np.ndarray] = None
+    # (files,) uint8 format codes once the contents were sniffed (formats), and the rules' version
+    types: Optional[np.ndarray] = None
+    types_version: int = 0
+
+def header_hash(header: bytes) -> str:
+    return hashlib.blake2b(header, digest_size=16).hexdigest()
+
+def _cache_file(path: str, cache_dir: str) -> str:
+    key = hashlib.blake2b(os.path.abspath(path).encode("utf-8"), digest_size=16).hexdigest()
+    return os.path.join(cache_dir, key + ".npz")
+
+def _stamp(path: str, st: os.stat_result, hhash: str) -> np.ndarray:
+    return np.array([f"{INDEX_CACHE_VERSION}|{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}|{hhash}"])
+
+def load(path: str, st: os.stat_result, hhash: str, cache_dir: Optional[str] = None) -> Optional[ArchiveIndex]:
+    """Return the cached tables for path, or None when missing or stale."""
+    cache_path = _cache_file(path, cache_dir or default_cache_dir())
+    try:
+        with np.load(cache_path, allow_pickle=False) as z:
+            if z["stamp"][0] != _stamp(path, st, hhash)[0]:
+                return None
+            names_blob = z["names"].tobytes()
+            names = names_blob.decode("utf-8").split("\x00") if len(z["offsets"]) else []
+            hashes = z["hashes"] if "hashes" in z.files else None
+            types, types_version = (z["types"], int(z["types_version"][0])) if "types" in z.files else (None, 0)
+            return ArchiveIndex(names, z["offsets"], z["sizes"], z["chunks"], hashes, types, types_version)
+    except Exception:
+        return None
+
+def save(path: str, st: os.stat_result, hhash: str, index: ArchiveIndex, cache_dir: Optional[str] = None):
+    """Write the tables for path; failures are ignored, the cache is only an optimization."""
+    cache_dir = cache_dir or default_cache_dir()
+    tmp = None
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        names_blob = np.frombuffer("\x00".join(index.names).encode("utf-8"), dtype=np.uint8)
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            extra = dict(hashes=index.hashes) if index.hashes is not None else {}
+            if index.types is not None:
+                extra.update(types=index.types, types_version=np.array([index.types_version]))
+            np.savez(f, stamp=_stamp(path, st, hhash), names=names_blob,
+                     offsets=index.offsets, sizes=index.sizes, chunks=index.chunks, **extra)
+        os.replace(tmp, _cache_file(path, cache_dir))
+    except Exception:
+        if tmp:
+            try: os.unlink(tmp)
+            except Exception: pass
@@ -0,0 +1,82 @@
+import os
+from typing import List, Sequence
+
+from PySide6.QtCore import Qt
+from PySide6.QtWidgets import (
+    QAbstractItemView, QDialog, QDialogButtonBox, QFileDialog, QHBoxLayout, QLabel,
+    QListWidget, QListWidgetItem, QPushButton, QVBoxLayout,
+)
+
+from utilities import archiveMount
+from utilities import assetIndex
+
+# ----------------- Mount dialog -----------------
+# Picks the archives of an ArchiveMount and their override order (top wins)
+
+class MountDialog(QDialog):
+    def __init__(self, parent=None, paths: Sequence[str] = ()):
+        """paths: already mounted archives, top priority first."""
+        super().__init__(parent)
+        self.setWindowTitle("Mount Archives")
+        self.resize(620, 420)
+        self.wor_map = assetIndex.parse_wor_descriptors()
+
+        v = QVBoxLayout(self)
+        v.addWidget(QLabel("Archives higher up override the same paths in the ones below. Drag to reorder."))
+        self.list = QListWidget()
+        self.list.setDragDropMode(QAbstractItemView.InternalMove)
+        self.list.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        v.addWidget(self.list, 1)
+
+        h = QHBoxLayout()
+        for label, slot in (("Add…", self.on_add), ("Remove", self.on_remove),
+                            ("Up", lambda: self.move_selected(-1)), ("Down", lambda: self.move_selected(1)),
+                            ("Kits at Bottom", self.on_kits_at_bottom)):
+            btn = QPushButton(label); btn.clicked.connect(slot); h.addWidget(btn)
+        h.addStretch(1)
+        v.addLayout(h)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept); buttons.rejected.connect(self.reject)
+        v.addWidget(buttons)
+        self.add_paths(paths)
+
+    def _item(self, path: str) -> QListWidgetItem:
+        wor = assetIndex.wor_id_for(path)
+        source = self.wor_map.get(wor, "") if wor else ""
+        item = QListWidgetItem(f"{os.path.basename(path)}  {source}".strip())
+        item.setData(Qt.UserRole, path); item.setToolTip(path)
+        return item
+
+    def add_paths(self, paths: Sequence[str]):
+        have = {os.path.abspath(p) for p in self.paths()}
+        for path in paths:
+            if os.path.abspath(path) not in have:
+                have.add(os.path.abspath(path))
+                self.list.addItem(self._item(path))
+
+    def paths(self) -> List[str]:
+        """Top priority first."""
+        return [self.list.item(i).data(Qt.UserRole) for i in range(self.list.count())]
+
+    def on_add(self):
+        paths, _ = QFileDialog.getOpenFileNames(self, "Mount BFZ Archives", "", "BFZ Archives (*.bfz);;All Files (*)")
+        # New ones go on top, kits under the rest
+        top = list(reversed(archiveMount.kits_first(paths, self.wor_map)))
+        rest = self.paths()
+        self.list.clear(); self.add_paths(top + rest)
+
+    def on_remove(self):
+        for item in self.list.selectedItems():
+            self.list.takeItem(self.list.row(item))
+
+    def move_selected(self, step: int):
+        row = self.list.currentRow()
+        if row < 0 or not (0 <= row + step < self.list.count()):
+            return
+        item = self.list.takeItem(row)
+        self.list.insertItem(row + step, item); self.list.setCurrentRow(row + step)
+
+    def on_kits_at_bottom(self):
+        paths = list(reversed(archiveMount.kits_first(list(reversed(self.paths())), self.wor_map)))
+        self.list.clear(); self.add_paths(paths)
@@ -0,0 +1,269 @@
+import heapq
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, Executor, ThreadPoolExecutor, wait
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+
+from utilities import tracing
+
+try:
+    import lzo
+except Exception:
+    lzo = None
+
+# Compressed bytes handed to the pool per batch, in file-offset order
+DEFAULT_BATCH_BYTES = 8 * 1024 * 1024
+# Unused bytes we're willing to read between two chunks to keep one batch
+MAX_BATCH_GAP = 64 * 1024
+
+def default_workers() -> int:
+    return os.cpu_count() or 1
+
+def process_pool(workers: Optional[int] = None) -> Executor:
+    """
+    ProcessPoolExecutor, imported here: multiprocessing alone costs ~20ms of
+    every startup. Workers are spawned, forking a process that already runs
+    Qt or decompression threads can deadlock the children.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    return ProcessPoolExecutor(max_workers=workers or default_workers(), mp_context=multiprocessing.get_context("spawn"))
+
+# ----------------- Workers -----------------
+# python-lzo drops the GIL while decompressing, so threads scale across cores
+# and can write their result straight into the shared target buffer.
+# Process workers can't share it, they hand the bytes back instead.
+
+def _decompress_into(target: memoryview, comp: memoryview, new_offset: int, size: int, index: int):
+    with tracing.span("lzo chunk", "lzo", chunk=index, zsize=len(comp), size=size):
+        decomp = lzo.decompress(comp, False, size)
+    if len(decomp) != size:
+        raise RuntimeError(f"Chunk {index} decompressed size mismatch")
+    target[new_offset:new_offset+size] = decomp
+    tracing.count("lzo in", len(comp)); tracing.count("lzo out", size)
+
+def _decompress_bytes(comp: bytes, size: int, index: int) -> bytes:
+    decomp = lzo.decompress(comp, False, size)
+    if len(decomp) != size:
+        raise RuntimeError(f"Chunk {index} decompressed size mismatch")
+    return decomp
+
+# ----------------- Batching -----------------
+
+def _batches(offsets: List[int], zsizes: List[int], indices: Sequence[int], batch_bytes: int) -> List[List[int]]:
+    """Group chunk indices, in file-offset order, into runs of nearby compressed data."""
+    order = sorted(indices, key=lambda i: offsets[i])
+    batches, cur, cur_start, cur_end = [], [], 0, 0
+    for i in order:
+        off, zsize = offsets[i], zsizes[i]
+        contiguous = (cur and off - cur_end <= MAX_BATCH_GAP
+                      and off + zsize - cur_start <= batch_bytes)
+        if not contiguous:
+            if cur:
+                batches.append(cur)
+            cur, cur_start, cur_end = [], off, off
+        cur.append(i)
+        cur_end = max(cur_end, off + zsize)
+    if cur:
+        batches.append(cur)
+    return batches
+
+# ----------------- Engine -----------------
+
+def decompress_chunks(
+    source,
+    chunks: np.ndarray,
+    target: bytearray,
+    indices: Optional[Sequence[int]] = None,
+    workers: Optional[int] = None,
+    use_processes: bool = False,
+    batch_bytes: int = DEFAULT_BATCH_BYTES,
+    progress: Optional[Callable[[int, int], None]] = None,
+):
+    """
+    Decompress chunks (a CHUNK_ENTRY_DTYPE table) into target.
+    source is the whole .bfz as a buffer (normally an mmap), chunks are fed to
+    the decompressor as memoryviews into it, without copying.
+    progress(done, total) is called on the calling thread, raising from it cancels
+    the remaining work.
+    """
+    if lzo is None:
+        raise RuntimeError("Please install python-lzo to parse BFZ files")
+    if indices is None:
+        indices = range(len(chunks))
+    total = len(indices)
+    new_offsets = chunks["new_offset"].tolist()
+    offsets = chunks["offset"].tolist()
+    sizes = chunks["size"].tolist()
+    zsizes = chunks["zsize"].tolist()
+    workers = workers or default_workers()
+    view = memoryview(target)
+    src = memoryview(source)
+
+    pool: Executor
+    if use_processes:
+        pool = process_pool(workers)
+    else:
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bfz-lzo")
+
+    # Keep the compressed data in flight bounded
+    max_pending = workers * 4
+    pending = {}
+    done_count = 0
+
+    def drain(block_until: int):
+        nonlocal done_count
+        while len(pending) > block_until:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                i = pending.pop(fut)
+                result = fut.result()
+                if use_processes:
+                    view[new_offsets[i]:new_offsets[i]+sizes[i]] = result
+                    # Worker processes aren't traced, count their bytes here
+                    tracing.count("lzo in", zsizes[i]); tracing.count("lzo out", sizes[i])
+                done_count += 1
+            if progress:
+                progress(done_count, total)
+
+    try:
+        for batch in _batches(offsets, zsizes, indices, batch_bytes):
+            start = offsets[batch[0]]
+            end = max(offsets[i] + zsizes[i] for i in batch)
+            raw = src[start:end]
+            for i in batch:
+                comp = raw[offsets[i] - start:offsets[i] - start + zsizes[i]]
+                if use_processes:
+                    fut = pool.submit(_decompress_bytes, bytes(comp), sizes[i], i)
+                else:
+                    fut = pool.submit(_decompress_into, view, comp, new_offsets[i], sizes[i], i)
+                pending[fut] = i
+                drain(max_pending)
+        drain(0)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        view.release()
+        src.release()
+
+# ----------------- Background engine -----------------
+
+class BackgroundDecompressor:
+    """
+    Fills target on worker threads in file-offset order, while callers can
+    push the chunks they need right now to the front with wait_for().
+    progress(done, total) is called from the worker threads.
+    """
+    QUEUED, RUNNING, DONE = 0, 1, 2
+
+    def __init__(
+        self,
+        source,
+        chunks: np.ndarray,
+        target: bytearray,
+        workers: Optional[int] = None,
+        progress: Optional[Callable[[int, int], None]] = None,
+    ):
+        if lzo is None:
+            raise RuntimeError("Please install python-lzo to parse BFZ files")
+        self._src = memoryview(source)
+        self._view = memoryview(target)
+        self._new_offsets = chunks["new_offset"].tolist()
+        self._offsets = chunks["offset"].tolist()
+        self._sizes = chunks["size"].tolist()
+        self._zsizes = chunks["zsize"].tolist()
+        self.total = len(chunks)
+        self.done = 0
+        self.workers = workers or default_workers()
+        self.progress = progress
+        self._step = max(1, self.total // 200)
+        self._state = bytearray(self.total)
+        # (priority, sequence, chunk): urgent requests are priority 0
+        order = sorted(range(self.total), key=lambda i: self._offsets[i])
+        self._heap = [(1, seq, i) for seq, i in enumerate(order)]
+        self._seq = self.total
+        self._cond = threading.Condition()
+        self._error: Optional[BaseException] = None
+        self._canceled = False
+        self._threads: List[threading.Thread] = []
+
+    @property
+    def finished(self) -> bool:
+        return self.done == self.total
+
+    def start(self):
+        for n in range(min(self.workers, max(self.total, 1))):
+            t = threading.Thread(target=self._run, name=f"bfz-fill-{n}", daemon=True)
+            self._threads.append(t)
+            t.start()
+
+    def _next(self) -> Optional[int]:
+        with self._cond:
+            while self._heap and not self._canceled and self._error is None:
+                _prio, _seq, i = heapq.heappop(self._heap)
+                if self._state[i] == self.QUEUED:
+                    self._state[i] = self.RUNNING
+                    return i
+            return None
+
+    def _run(self):
+        while True:
+            i = self._next()
+            if i is None:
+                return
+            try:
+                comp = self._src[self._offsets[i]:self._offsets[i] + self._zsizes[i]]
+                _decompress_into(self._view, comp, self._new_offsets[i], self._sizes[i], i)
+                del comp
+            except BaseException as e:
+                with self._cond:
+                    self._error = e
+                    self._cond.notify_all()
+                return
+            with self._cond:
+                self._state[i] = self.DONE
+                self.done += 1
+                done = self.done
+                self._cond.notify_all()
+            if self.progress and (done % self._step == 0 or done == self.total):
+                self.progress(done, self.total)
+
+    def prioritize(self, ids: Sequence[int]):
+        with self._cond:
+            for i in ids:
+                if self._state[i] == self.QUEUED:
+                    self._seq += 1
+                    heapq.heappush(self._heap, (0, -self._seq, i))
+
+    def wait_for(self, ids: Sequence[int]):
+        """Block until the given chunks are decompressed, jumping the queue for them."""
+        self.prioritize(ids)
+        with self._cond, tracing.span("wait for chunks", "lzo", chunks=len(ids)):
+            self._cond.wait_for(lambda: self._error is not None or self._canceled
+                                or all(self._state[i] == self.DONE for i in ids))
+            if self._error is not None:
+                raise RuntimeError(f"Background decompression failed: {self._error}")
+            if self._canceled and not all(self._state[i] == self.DONE for i in ids):
+                raise RuntimeError("Background decompression was canceled")
+
+    def join(self):
+        for t in self._threads:
+            t.join()
+        self._release()
+        if self._error is not None:
+            raise RuntimeError(f"Background decompression failed: {self._error}")
+
+    def cancel(self):
+        with self._cond:
+            self._canceled = True
+            self._heap.clear()
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join()
+        self._release()
+
+    def _release(self):
+        # Lets the archive close its mmap afterwards
+        self._src.release()
+        self._view.release()
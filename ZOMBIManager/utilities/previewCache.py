@@ -0,0 +1,179 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Hashable, List, Optional, Tuple
+
+import numpy as np
+from PySide6.QtGui import QImage
+
+from utilities import formats
+from utilities import previewers
+from utilities import tracing
+
+# ----------------- Preview cache -----------------
+# Everything the preview pane shows for an entry (decoded image, embedded WAV
+# and its envelope, the text) is built once, off the GUI thread when it can be,
+# and kept in a byte-budgeted LRU keyed by BFZArchive.entry_key. Clicking back
+# to an entry, or arrowing onto a prefetched neighbour, is then just a lookup.
+
+DEFAULT_PREVIEW_CACHE_BYTES = 256 * 1024 * 1024
+# Per-entry bookkeeping, so thousands of text-only previews still count
+_OVERHEAD = 512
+# Characters of a text entry shown
+MAX_PREVIEW_TEXT = 16 * 1024
+
+@dataclass
+class Preview:
+    text: str
+    image: Optional[QImage] = None
+    wav: Optional[bytes] = None
+    envelope: Optional[np.ndarray] = None
+    # QPixmap of image, made on the GUI thread the first time it's shown
+    pixmap: object = None
+
+    @property
+    def nbytes(self) -> int:
+        n = _OVERHEAD + 2 * len(self.text)
+        if self.image is not None:
+            # The pixmap is about the same size again
+            n += 2 * self.image.sizeInBytes()
+        if self.wav is not None:
+            n += len(self.wav)
+        if self.envelope is not None:
+            n += self.envelope.nbytes
+        return n
+
+def _qimage(img) -> QImage:
+    rgba = np.ascontiguousarray(np.asarray(img.convert("RGBA")))
+    h, w = rgba.shape[:2]
+    # copy() so the QImage owns its pixels once rgba goes away
+    return QImage(rgba.data, w, h, 4 * w, QImage.Format_RGBA8888).copy()
+
+# ----------------- Handlers -----------------
+# Named by formats.FORMATS, only ever called through build_preview
+
+def preview_sound(data: previewers.BytesLike) -> Preview:
+    wav = previewers.extract_wav_from_son(data)
+    if not wav:
+        return Preview("No RIFF/WAVE found inside .son")
+    meta = previewers.get_wav_metadata(wav)
+    text = (f"WAV embedded: {meta['channels']} ch, {meta['sample_rate']} Hz, "
+            f"{meta['sampwidth']*8} bit, {meta['duration']:.2f}s\n"
+            f"Size: {len(wav)} bytes") if meta else f"Embedded WAV ({len(wav)} bytes)"
+    return Preview(text, wav=bytes(wav), envelope=previewers.waveform_envelope(wav))
+
+def preview_tdt(data: previewers.BytesLike) -> Preview:
+    # PIL and the decoders only get imported once a texture is looked at
+    from utilities import textureFile
+    try:
+        img = textureFile.decode_tdt(data)
+        if not img:
+            return Preview("Unsupported or failed TDT decode.")
+        hdr = textureFile.parse_tdt_header(data)
+        tex = textureFile.textureDecoders.FORMATS.get(hdr.format)
+        kind = f"{tex.name}, {hdr.mip_levels} mip levels" if tex else f"unknown format 0x{hdr.format:x}, guessed"
+        return Preview(f"TDT decoded: {img.width}x{img.height} ({kind})", image=_qimage(img))
+    except Exception as e:
+        return Preview(f"Failed to parse TDT:\n{e}")
+
+def preview_image(data: previewers.BytesLike) -> Preview:
+    """Whatever Qt's image plugins can read (PNG, JPEG, DDS with qt-imageformats)."""
+    image = QImage.fromData(bytes(data))
+    if image.isNull():
+        return Preview(f"Image Qt can't decode ({len(data):,} bytes)")
+    return Preview(f"Image: {image.width()}x{image.height()}", image=image)
+
+def preview_text(data: previewers.BytesLike) -> Preview:
+    text = bytes(data[:MAX_PREVIEW_TEXT]).decode("utf-8", "replace")
+    more = f"\n… {len(data) - MAX_PREVIEW_TEXT:,} more bytes" if len(data) > MAX_PREVIEW_TEXT else ""
+    return Preview(text + more)
+
+@tracing.traced("build_preview", "preview")
+def build_preview(name: str, data: previewers.BytesLike, fmt: Optional[formats.FileFormat] = None) -> Preview:
+    """Decode an entry for the preview pane, sniffing its format unless given. Safe to call from any thread."""
+    fmt = fmt or formats.sniff(name, data)
+    if fmt.preview:
+        return formats.handler(fmt.preview)(data)
+    kind = f"{fmt.label}, " if fmt.label else "Generic file, "
+    return Preview(f"{kind}{len(data):,} bytes")
+
+class PreviewCache:
+    """Bounded LRU of built previews, evicted by their approximate memory use."""
+    def __init__(self, max_bytes: int = DEFAULT_PREVIEW_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._items: "OrderedDict[Hashable, Tuple[Preview, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._items
+
+    def get(self, key: Hashable) -> Optional[Preview]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            self._items.move_to_end(key)
+            return item[0]
+
+    def put(self, key: Hashable, preview: Preview):
+        size = preview.nbytes
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            self._items[key] = (preview, size)
+            self.current_bytes += size
+            # Always keep the newest one, even if it alone is over budget
+            while self.current_bytes > self.max_bytes and len(self._items) > 1:
+                _, (_, evicted) = self._items.popitem(last=False)
+                self.current_bytes -= evicted
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.current_bytes = 0
+
+# (cache key, entry name, reads the entry's bytes)
+PrefetchJob = Tuple[Hashable, str, Callable[[], previewers.BytesLike]]
+
+class Prefetcher:
+    """
+    One background thread building previews into a PreviewCache. Each request
+    replaces whatever was still queued, the user has moved on from those.
+    """
+    def __init__(self, cache: PreviewCache):
+        self.cache = cache
+        self._jobs: List[PrefetchJob] = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="preview-prefetch", daemon=True)
+        self._thread.start()
+
+    def request(self, jobs: List[PrefetchJob]):
+        with self._cond:
+            self._jobs = [j for j in jobs if j[0] not in self.cache]
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._jobs and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                key, name, read = self._jobs.pop(0)
+            if key in self.cache:
+                continue
+            try:
+                self.cache.put(key, build_preview(name, read()))
+            except Exception:
+                # Shown (with the error) when the entry actually gets clicked
+                pass
+
+    def close(self):
+        with self._cond:
+            self._closed, self._jobs = True, []
+            self._cond.notify()
+        self._thread.join()
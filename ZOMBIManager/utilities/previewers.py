@@ -1,19 +1,57 @@
-from typing import List, Optional, Dict, Tuple
-from io import BytesIO
+from typing import List, Optional, Dict, Tuple, Union
+import io
+import re
+import struct
 import wave
 
-def find_riff_offset(data: bytes) -> Optional[int]:
-    idx = data.find(b'RIFF')
-    return idx if idx != -1 else None
+import numpy as np
 
-def extract_wav_from_son(data: bytes) -> Optional[bytes]:
+# Entry data is usually a read-only memoryview straight into the archive buffer
+BytesLike = Union[bytes, bytearray, memoryview]
+
+_RIFF = re.compile(b"RIFF")
+
+class MemoryviewReader(io.RawIOBase):
+    """Seekable file object over a buffer, so wave can read headers without copying the PCM."""
+    def __init__(self, data: BytesLike):
+        self._view = memoryview(data)
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        chunk = self._view[self._pos:self._pos + len(b)]
+        n = len(chunk)
+        b[:n] = chunk
+        self._pos += n
+        return n
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._pos = max(0, offset)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+def find_riff_offset(data: BytesLike) -> Optional[int]:
+    m = _RIFF.search(data)
+    return m.start() if m else None
+
+def extract_wav_from_son(data: BytesLike) -> Optional[BytesLike]:
     idx = find_riff_offset(data)
     return data[idx:] if idx is not None else None
 
-def get_wav_metadata(wav_bytes: bytes) -> Optional[dict]:
+def get_wav_metadata(wav_bytes: BytesLike) -> Optional[dict]:
     try:
-        bio = BytesIO(wav_bytes)
-        with wave.open(bio, "rb") as w:
+        with wave.open(MemoryviewReader(wav_bytes), "rb") as w:
             frames, rate = w.getnframes(), w.getframerate()
             channels, sampwidth = w.getnchannels(), w.getsampwidth()
             duration = frames / float(rate) if rate > 0 else 0.0
@@ -21,3 +59,75 @@ def get_wav_metadata(wav_bytes: bytes) -> Optional[dict]:
                         sampwidth=sampwidth, frames=frames, duration=duration)
     except Exception:
         return None
+
+# ----------------- Waveform overview -----------------
+
+# fmt tags whose frames numpy can read directly
+WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT, WAVE_FORMAT_EXTENSIBLE = 0x0001, 0x0003, 0xFFFE
+
+def riff_chunks(wav: BytesLike) -> Dict[bytes, Tuple[int, int]]:
+    """Chunk id -> (offset, size) of the first chunk of each id in a RIFF/WAVE buffer."""
+    found: Dict[bytes, Tuple[int, int]] = {}
+    if len(wav) < 12 or bytes(wav[0:4]) != b"RIFF" or bytes(wav[8:12]) != b"WAVE":
+        return found
+    pos = 12
+    while pos + 8 <= len(wav):
+        cid = bytes(wav[pos:pos+4])
+        size = struct.unpack_from("<I", wav, pos + 4)[0]
+        found.setdefault(cid, (pos + 8, min(size, len(wav) - pos - 8)))
+        pos += 8 + size + (size & 1)
+    return found
+
+def pcm_frames(wav: BytesLike) -> Optional[Tuple[np.ndarray, float, float]]:
+    """
+    (frames, channels) array over the data chunk in its stored sample type,
+    plus (bias, scale) mapping it to [-1, 1]. None for compressed formats.
+    """
+    chunks = riff_chunks(wav)
+    if b"fmt " not in chunks or b"data" not in chunks:
+        return None
+    fmt_off, fmt_size = chunks[b"fmt "]
+    if fmt_size < 16:
+        return None
+    tag, channels, _rate, _brate, align, bits = struct.unpack_from("<HHIIHH", wav, fmt_off)
+    if tag == WAVE_FORMAT_EXTENSIBLE and fmt_size >= 26:
+        tag = struct.unpack_from("<H", wav, fmt_off + 24)[0]  # first two bytes of the sub-format GUID
+    if channels == 0 or align == 0 or align % channels:
+        return None
+    data_off, data_size = chunks[b"data"]
+    frames = data_size // align
+    raw = np.frombuffer(wav, dtype=np.uint8, count=frames * align, offset=data_off)
+    width = align // channels
+    if tag == WAVE_FORMAT_IEEE_FLOAT and width == 4:
+        return raw.view("<f4").reshape(frames, channels), 0.0, 1.0
+    if tag != WAVE_FORMAT_PCM or bits > 8 * width:
+        return None
+    if width == 1:
+        return raw.reshape(frames, channels), 128.0, 1 / 128.0
+    if width == 2:
+        return raw.view("<i2").reshape(frames, channels), 0.0, 1 / 32768.0
+    if width == 3:
+        # Sign-extend by putting the 3 bytes at the top of an int32
+        b = np.zeros((frames, channels, 4), dtype=np.uint8)
+        b[..., 1:] = raw.reshape(frames, channels, 3)
+        return b.view("<i4").reshape(frames, channels), 0.0, 1 / 2147483648.0
+    if width == 4:
+        return raw.view("<i4").reshape(frames, channels), 0.0, 1 / 2147483648.0
+    return None
+
+def waveform_envelope(wav: BytesLike, buckets: int = 1024) -> Optional[np.ndarray]:
+    """
+    (n, 2) float32 min/max per bucket over all channels, n <= buckets. Reduces
+    the samples in their stored type, only the n x 2 result gets scaled.
+    """
+    pcm = pcm_frames(wav)
+    if pcm is None or len(pcm[0]) == 0:
+        return None
+    samples, bias, scale = pcm
+    frames, channels = samples.shape
+    n = min(buckets, frames)
+    per = frames // n
+    # Drop the remainder so every bucket covers the same number of frames
+    blocks = samples[:n * per].reshape(n, per * channels)
+    env = np.stack([blocks.min(axis=1), blocks.max(axis=1)], axis=1).astype(np.float32)
+    return (env - np.float32(bias)) * np.float32(scale)
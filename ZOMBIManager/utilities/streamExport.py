@@ -0,0 +1,277 @@
+import gzip
+import io
+import json
+import os
+import tarfile
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Deque, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from utilities import bfz
+from utilities import exporter
+from utilities import parallelDecompress
+from utilities import tracing
+
+try:
+    import lzo
+except Exception:
+    lzo = None
+
+try:
+    import zstandard
+except Exception:
+    zstandard = None
+
+# ----------------- Streaming export -----------------
+# Writes a whole archive into one .tar/.tar.gz/.tar.zst/.zip without ever
+# holding the decompressed stream: entries go out in offset order while chunks
+# are decompressed a few at a time ahead of them (python-lzo drops the GIL) and
+# dropped once no later entry can need them, so memory stays at a handful of
+# chunks however big the archive is. Same paths as exporter (~N suffixes for
+# same-named variants); identical payloads become hardlinks in tars and are
+# listed in exporter.MANIFEST_NAME in zips.
+
+# Extension -> format, longest first
+FORMATS = ((".tar.zst", "tar.zst"), (".tzst", "tar.zst"), (".tar.gz", "tar.gz"), (".tgz", "tar.gz"),
+           (".tar", "tar"), (".zip", "zip"))
+DEFAULT_ZSTD_LEVEL = 3
+# Gaps between chunks read as zeroes, handed out this many bytes at a time
+ZERO_PIECE = 1024 * 1024
+
+def stream_format(path: str) -> str:
+    lower = path.lower()
+    for ext, fmt in FORMATS:
+        if lower.endswith(ext):
+            return fmt
+    raise ValueError(f"Unsupported export file type: {os.path.basename(path)} (use .tar, .tar.gz, .tar.zst or .zip)")
+
+# ----------------- Chunk window -----------------
+
+class ChunkWindow:
+    """
+    Decompressed chunks in stream order, read ahead on a few threads and
+    released with release(); read() never needs chunks behind the last release.
+    """
+    def __init__(self, arch: bfz.BFZArchive, workers: Optional[int] = None, read_ahead: Optional[int] = None):
+        if lzo is None:
+            raise RuntimeError("Please install python-lzo to parse BFZ files")
+        chunks = arch.chunks[np.argsort(arch.chunks["new_offset"], kind="stable")]
+        self.rows: List[Tuple[int, int, int, int]] = list(zip(
+            chunks["new_offset"].tolist(), chunks["offset"].tolist(), chunks["size"].tolist(), chunks["zsize"].tolist()))
+        workers = workers or parallelDecompress.default_workers()
+        self.read_ahead = read_ahead or workers * 2
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bfz-stream")
+        self._f = open(arch.path, "rb")
+        self._next = 0  # next row to submit
+        self._pending: Deque = deque()              # (start, end, future) in stream order
+        self.window: Deque[Tuple[int, int, bytes]] = deque()  # (start, end, data)
+        self.buffered = 0   # decompressed bytes held, window and read-ahead
+        self.peak = 0
+
+    def _submit(self):
+        while len(self._pending) < self.read_ahead and self._next < len(self.rows):
+            new_offset, offset, size, zsize = self.rows[self._next]
+            self._f.seek(offset)
+            comp = self._f.read(zsize)
+            self._pending.append((new_offset, new_offset + size, self._pool.submit(lzo.decompress, comp, False, size)))
+            self.buffered += size
+            self._next += 1
+        self.peak = max(self.peak, self.buffered)
+
+    def _pull(self) -> bool:
+        """Move the next decompressed chunk into the window, False at the end of the stream."""
+        self._submit()
+        if not self._pending:
+            return False
+        start, end, fut = self._pending.popleft()
+        data = fut.result()
+        if len(data) != end - start:
+            raise RuntimeError(f"Chunk at 0x{start:X} decompressed size mismatch")
+        self.window.append((start, end, data))
+        tracing.count("lzo out", len(data))
+        self._submit()
+        return True
+
+    def release(self, before: int):
+        """Drop the chunks ending at or before this stream offset."""
+        while self.window and self.window[0][1] <= before:
+            self.buffered -= len(self.window.popleft()[2])
+
+    def read(self, start: int, end: int, keep_from: Optional[int] = None) -> Iterator[memoryview]:
+        """
+        Pieces of [start, end) of the stream. keep_from is the lowest offset
+        still needed afterwards (the next entry), chunks before both it and the
+        read position are released along the way.
+        """
+        pos = start
+        while pos < end:
+            while not self.window or self.window[-1][1] <= pos:
+                if not self._pull():
+                    raise RuntimeError("File references bytes beyond the decompressed stream.")
+            piece = None
+            for c_start, c_end, data in self.window:
+                if c_start <= pos < c_end:
+                    piece = memoryview(data)[pos - c_start:min(end, c_end) - c_start]
+                    break
+                if c_start > pos:
+                    # Gap between chunks
+                    piece = memoryview(bytes(min(end, c_start, pos + ZERO_PIECE) - pos))
+                    break
+            yield piece
+            pos += len(piece)
+            self.release(min(pos, keep_from if keep_from is not None else pos))
+
+    def close(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        self._f.close()
+        self.window.clear(); self._pending.clear()
+
+class _PieceReader(io.RawIOBase):
+    """File-like over an iterator of pieces, for tarfile.addfile (behind a BufferedReader, it wants full reads)."""
+    def __init__(self, pieces: Iterator[memoryview]):
+        self._pieces = pieces
+        self._cur = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not len(self._cur):
+            self._cur = next(self._pieces, None)
+            if self._cur is None:
+                self._cur = memoryview(b"")
+                return 0
+        n = min(len(b), len(self._cur))
+        b[:n] = self._cur[:n]
+        self._cur = self._cur[n:]
+        return n
+
+# ----------------- Writers -----------------
+
+class _TarSink:
+    def __init__(self, fh, fmt: str, level: Optional[int], mtime: float):
+        # Compressed by a wrapper around fh, tarfile itself only ever sees a plain stream
+        self._zw = None
+        if fmt == "tar.zst":
+            if zstandard is None:
+                raise RuntimeError("Please install zstandard to write .tar.zst files")
+            self._zw = zstandard.ZstdCompressor(level=level or DEFAULT_ZSTD_LEVEL, threads=-1).stream_writer(fh, closefd=False)
+        elif fmt == "tar.gz":
+            self._zw = gzip.GzipFile(fileobj=fh, mode="wb", compresslevel=level or 6, mtime=mtime)
+        self.tar = tarfile.open(fileobj=self._zw or fh, mode="w|", format=tarfile.PAX_FORMAT)
+        self.mtime = mtime
+
+    def _info(self, name: str, size: int) -> tarfile.TarInfo:
+        info = tarfile.TarInfo(name)
+        info.size, info.mtime, info.mode = size, self.mtime, 0o644
+        return info
+
+    def add(self, name: str, size: int, pieces: Iterator[memoryview]):
+        self.tar.addfile(self._info(name, size), io.BufferedReader(_PieceReader(pieces), 1024 * 1024))
+        # TarFile remembers every member, which only matters for reading
+        self.tar.members.clear()
+
+    def add_duplicate(self, name: str, target: str) -> bool:
+        info = self._info(name, 0)
+        info.type, info.linkname = tarfile.LNKTYPE, target
+        self.tar.addfile(info); self.tar.members.clear()
+        return True
+
+    def close(self):
+        self.tar.close()
+        if self._zw is not None:
+            self._zw.close()
+
+class _ZipSink:
+    def __init__(self, fh, level: Optional[int], mtime: float):
+        # Stored by default: the payloads are mostly compressed or noisy, and this is about speed
+        self.zip = zipfile.ZipFile(fh, "w", zipfile.ZIP_DEFLATED if level else zipfile.ZIP_STORED,
+                                   allowZip64=True, compresslevel=level)
+        self.date_time = time.localtime(mtime)[:6]
+        self.manifest = {}
+
+    def add(self, name: str, size: int, pieces: Iterator[memoryview]):
+        info = zipfile.ZipInfo(name, self.date_time)
+        info.compress_type, info.file_size = self.zip.compression, size
+        with self.zip.open(info, "w", force_zip64=size >= 0x7FFFFFFF) as w:
+            for piece in pieces:
+                w.write(piece)
+
+    def add_duplicate(self, name: str, target: str) -> bool:
+        self.manifest[name] = target
+        return False
+
+    def close(self):
+        if self.manifest:
+            self.zip.writestr(exporter.MANIFEST_NAME, json.dumps(self.manifest, indent=1, sort_keys=True))
+        self.zip.close()
+
+# ----------------- Running -----------------
+
+@tracing.traced("export_stream", "export")
+def export_stream(
+    arch: bfz.BFZArchive,
+    out_path: str,
+    entries: Optional[Sequence[bfz.BFZFileEntry]] = None,
+    fmt: Optional[str] = None,
+    level: Optional[int] = None,
+    dedupe: bool = True,
+    workers: Optional[int] = None,
+    read_ahead: Optional[int] = None,
+    progress: Optional[bfz.ProgressCallback] = None,
+) -> exporter.ExportResult:
+    """
+    Write entries (default: all) into one tar/zip at out_path, the format from
+    its extension unless fmt is given. The archive only needs its tables
+    (parse(lazy=True)); when it's fully in memory already that gets used instead
+    of decompressing again. level: gzip/zstd level, zips are deflated only if set.
+    """
+    fmt = fmt or stream_format(out_path)
+    items = exporter.plan_export(arch, "", entries, convert=False, dedupe="offset" if dedupe else None)
+    # Stream order, so chunks are only ever needed once, in a row. Primaries sort before their duplicates.
+    items.sort(key=lambda it: (it.entry.offset, it.duplicate_of is not None))
+    starts = [it.entry.offset for it in items]
+
+    result = exporter.ExportResult()
+    total, label = len(items), "Exporting files…"
+    if progress:
+        progress(0, total, label)
+    in_memory = arch.memory is not None and not arch.fill_pending
+    window = None if in_memory else ChunkWindow(arch, workers, read_ahead)
+    mtime = os.stat(arch.path).st_mtime
+    tmp = out_path + ".tmp"
+    try:
+        with open(tmp, "wb") as fh:
+            sink = _ZipSink(fh, level, mtime) if fmt == "zip" else _TarSink(fh, fmt, level, mtime)
+            for n, item in enumerate(items):
+                e = item.entry
+                if item.duplicate_of is not None:
+                    if sink.add_duplicate(item.out_path, item.duplicate_of):
+                        result.linked += 1
+                    else:
+                        result.manifest += 1
+                else:
+                    if window is None:
+                        pieces = iter([arch.read_range_view(e.offset, e.offset + e.size)])
+                    else:
+                        keep = starts[n + 1] if n + 1 < total else e.offset + e.size
+                        pieces = window.read(e.offset, e.offset + e.size, keep)
+                    sink.add(item.out_path, e.size, pieces)
+                    result.written += 1
+                    result.bytes_written += e.size
+                    tracing.count("export", e.size)
+                if progress and (n % 64 == 0 or n == total - 1):
+                    progress(n + 1, total, label)
+            sink.close()
+        os.replace(tmp, out_path)
+    finally:
+        if window is not None:
+            result.peak_buffered = window.peak
+            window.close()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return result
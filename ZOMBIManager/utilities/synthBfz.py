@@ -0,0 +1,206 @@
+import io
+import math
+import os
+import struct
+import wave
+from contextlib import closing
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+from utilities import bfz
+from utilities import bfzWriter
+from utilities import binaryHelpers
+
+# ----------------- Synthetic archives -----------------
+# Writes "ABE" archives shaped like the retail ones (file/name/chunk tables,
+# 16-byte aligned payloads, LZO chunks) filled with made-up .tdt/.son/.bin
+# entries, so parsing, decoding and export can be measured without the game
+# files. The same spec always gives the same bytes.
+
+ALIGNMENT = 16
+DEFAULT_CHUNK_SIZE = 0x20000
+TDT_HEADER_SIZE = 0x40
+SON_HEADER_SIZE = 0x20
+WAV_HEADER_SIZE = 44
+
+FOLDER_NAMES = ("data", "sound", "textures", "world", "ui", "fx")
+
+@dataclass
+class SynthSpec:
+    files: int = 1000
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+    # Payload sizes are log-uniform in [min_size, max_size]
+    min_size: int = 256
+    max_size: int = 256 * 1024
+    # Folder tree: up to depth levels, fanout folders per name
+    depth: int = 3
+    fanout: int = 6
+    # Share of entries reusing an earlier entry's name ("[Variant #n]" in the tree)
+    variants: float = 0.02
+    # Of those, the share that also point at its payload
+    identical_variants: float = 0.5
+    # Relative weights of the entry kinds
+    kinds: Dict[str, float] = field(default_factory=lambda: {".tdt": 0.3, ".son": 0.2, ".bin": 0.5})
+    level: int = bfzWriter.DEFAULT_LEVEL
+    seed: int = 1
+
+@dataclass
+class SynthPlan:
+    names: List[str]
+    kinds: List[str]
+    offsets: np.ndarray
+    sizes: np.ndarray
+    # Entries whose payload gets generated (the rest alias one of them), in stream order
+    payloads: List[int]
+    stream_size: int
+
+# ----------------- Payloads -----------------
+# Each generator makes exactly exact_size(kind, size) bytes
+
+def _tdt_side(size: int) -> int:
+    """Largest power-of-two side whose BC1 data (8 bytes per 4x4 block) fits in size."""
+    blocks = max(1, (size - TDT_HEADER_SIZE) // 8)
+    return 4 << max(0, int(math.log2(blocks)) // 2)
+
+def exact_size(kind: str, size: int) -> int:
+    if kind == ".tdt":
+        side = _tdt_side(size)
+        return TDT_HEADER_SIZE + (side // 4) ** 2 * 8
+    if kind == ".son":
+        frames = max(16, (size - SON_HEADER_SIZE - WAV_HEADER_SIZE) // 2)
+        return SON_HEADER_SIZE + WAV_HEADER_SIZE + 2 * frames
+    return size
+
+def _tdt(rng: np.random.Generator, size: int) -> bytes:
+    """BC1 texture (GX2 format 0x31, linear, one mip), blocks drawn from a small palette."""
+    side = _tdt_side(size)
+    palette = rng.integers(0, 256, (64, 8), dtype=np.uint8)
+    pixels = palette[rng.integers(0, len(palette), (side // 4) ** 2)].tobytes()
+    hdr = bytearray(TDT_HEADER_SIZE); hdr[0x10:0x14] = b"TDT_"
+    struct.pack_into("<I", hdr, 0x18, 0x31); struct.pack_into("<HH", hdr, 0x20, side, side)
+    return bytes(hdr) + pixels
+
+def _son(rng: np.random.Generator, size: int) -> bytes:
+    """Made-up SON header in front of a 16-bit mono WAV: a tone plus noise."""
+    frames = (exact_size(".son", size) - SON_HEADER_SIZE - WAV_HEADER_SIZE) // 2
+    t = np.arange(frames) / 22050.0
+    samples = np.sin(2 * np.pi * rng.uniform(80, 800) * t) * rng.uniform(2000, 20000) + rng.normal(0, 500, frames)
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1); w.setsampwidth(2); w.setframerate(22050)
+        w.writeframes(samples.astype("<i2").tobytes())
+    hdr = b"SON\x00" + struct.pack("<I", frames)
+    return hdr + bytes(SON_HEADER_SIZE - len(hdr)) + buf.getvalue()
+
+def _bin(rng: np.random.Generator, size: int) -> bytes:
+    """Record-like data: a repeated 32-byte structure with a counter and some noise."""
+    n = -(-size // 32)
+    data = np.tile(rng.integers(0, 256, 32, dtype=np.uint8), n)
+    data[::32] = np.arange(n).astype(np.uint8)
+    noisy = rng.random(len(data)) < 0.25
+    data[noisy] = rng.integers(0, 256, int(noisy.sum()), dtype=np.uint8)
+    return data[:size].tobytes()
+
+GENERATORS = {".tdt": _tdt, ".son": _son, ".bin": _bin}
+
+# ----------------- Layout -----------------
+
+def plan(spec: SynthSpec) -> SynthPlan:
+    rng = np.random.default_rng(spec.seed)
+    kind_names = list(spec.kinds)
+    weights = np.array([spec.kinds[k] for k in kind_names], dtype=np.float64)
+    picks = rng.choice(len(kind_names), spec.files, p=weights / weights.sum())
+    raw_sizes = np.exp(rng.uniform(math.log(spec.min_size), math.log(spec.max_size), spec.files))
+    variant = rng.random(spec.files) < spec.variants
+    identical = rng.random(spec.files) < spec.identical_variants
+
+    names: List[str] = []
+    kinds: List[str] = []
+    offsets = np.zeros(spec.files, dtype=np.uint64)
+    sizes = np.zeros(spec.files, dtype=np.uint64)
+    payloads: List[int] = []
+    pos = 0
+    for i in range(spec.files):
+        if variant[i] and i:
+            j = int(rng.integers(0, i))
+            names.append(names[j]); kinds.append(kinds[j])
+            if identical[i]:
+                offsets[i], sizes[i] = offsets[j], sizes[j]
+                continue
+        else:
+            depth = int(rng.integers(1, spec.depth + 1))
+            folders = [f"{FOLDER_NAMES[int(rng.integers(0, len(FOLDER_NAMES)))]}{int(rng.integers(0, spec.fanout))}"
+                       for _ in range(depth)]
+            kind = kind_names[picks[i]]
+            names.append("\\".join(folders + [f"asset_{i:06d}{kind}"])); kinds.append(kind)
+        size = exact_size(kinds[i], int(raw_sizes[i]))
+        offsets[i], sizes[i] = pos, size
+        payloads.append(i)
+        pos = -(-(pos + size) // ALIGNMENT) * ALIGNMENT
+    return SynthPlan(names, kinds, offsets, sizes, payloads, pos)
+
+def _stream(spec: SynthSpec, p: SynthPlan) -> Iterator[bytes]:
+    """The decompressed stream, chunk_size bytes at a time."""
+    rng = np.random.default_rng(spec.seed + 1)
+    buf = bytearray()
+    for i in p.payloads:
+        data = GENERATORS[p.kinds[i]](rng, int(p.sizes[i]))
+        buf += data
+        buf += bytes((-len(data)) % ALIGNMENT)
+        while len(buf) >= spec.chunk_size:
+            yield bytes(buf[:spec.chunk_size])
+            del buf[:spec.chunk_size]
+    if buf:
+        yield bytes(buf)
+
+def write_synthetic_bfz(
+    path: str,
+    spec: Optional[SynthSpec] = None,
+    workers: Optional[int] = None,
+    progress: Optional[bfz.ProgressCallback] = None,
+) -> SynthPlan:
+    """Write a synthetic archive to path, payloads generated and compressed as a stream."""
+    spec = spec or SynthSpec()
+    p = plan(spec)
+    n = len(p.names)
+    chunk_count = -(-p.stream_size // spec.chunk_size)
+
+    files = np.zeros(n, dtype=binaryHelpers.FILE_ENTRY_DTYPE)
+    files["offset"], files["size"] = p.offsets, p.sizes
+    names = np.zeros(n, dtype=binaryHelpers.NAME_ENTRY_DTYPE)
+    names["name"] = [name.encode("utf-8")[:63] for name in p.names]
+    names["size"], names["id"] = p.sizes, np.arange(n)
+    chunks = np.zeros(chunk_count, dtype=binaryHelpers.CHUNK_ENTRY_DTYPE)
+
+    files_off = bfz.HEADER_SIZE
+    chunks_off = files_off + bfz.TABLE_PREFIX_SIZE + files.nbytes + names.nbytes
+    data_off = chunks_off + bfz.TABLE_PREFIX_SIZE + chunks.nbytes
+    header = bytearray(bfz.HEADER_SIZE); header[:3] = b"ABE"
+    # No folder table: FOLDERS_OFF points at the chunk table with a count of 0
+    struct.pack_into("<QQQIIIIII", header, 0x28, files_off, chunks_off, chunks_off,
+                     n, 0, chunk_count, n, 0, chunk_count)
+
+    label = "Writing synthetic archive…"
+    if progress:
+        progress(0, chunk_count, label)
+    tmp = path + ".tmp"
+    try:
+        with open(tmp, "wb") as w, closing(bfzWriter.compress_in_order(_stream(spec, p), spec.level, workers)) as compressed:
+            w.write(header)
+            w.write(struct.pack("<IIQ", n, 0, 0)); w.write(files.tobytes()); w.write(names.tobytes())
+            w.seek(data_off)
+            for k, comp in enumerate(compressed):
+                size = min(spec.chunk_size, p.stream_size - k * spec.chunk_size)
+                chunks[k] = (k * spec.chunk_size, w.tell(), 0, size, len(comp))
+                w.write(comp)
+                if progress:
+                    progress(k + 1, chunk_count, label)
+            w.seek(chunks_off)
+            w.write(struct.pack("<IIQ", chunk_count, 0, 0)); w.write(chunks.tobytes())
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return p
@@ -0,0 +1,384 @@
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# ----------------- Texture decoders -----------------
+# Every decoder works on whole arrays: a surface is viewed as an (n, bytes per
+# element) array of blocks (or pixels), decoded to (n, block*block, 4) RGBA in
+# one go, then the blocks get transposed into the image. No per-pixel Python.
+
+@dataclass(frozen=True)
+class TextureFormat:
+    name: str
+    block: int            # block width/height in pixels, 1 for plain pixel formats
+    bytes_per_block: int  # bytes per element (block or pixel)
+    decode: Callable[[np.ndarray], np.ndarray]  # (n, bytes_per_block) uint8 -> (n, block*block, 4) uint8
+
+# Format field -> decoder. The codes are the Wii U GX2 surface formats
+FORMATS: Dict[int, TextureFormat] = {}
+
+def register(code: int, fmt: TextureFormat):
+    FORMATS[code] = fmt
+
+# ----------------- Plain pixel formats -----------------
+
+def _expand(v: np.ndarray, bits: int) -> np.ndarray:
+    """Scale a bits-wide channel to 0..255."""
+    return (v.astype(np.uint32) * 255 // ((1 << bits) - 1)).astype(np.uint8)
+
+def _rgba(r, g, b, a=None) -> np.ndarray:
+    if a is None:
+        a = np.full_like(r, 255)
+    return np.stack([r, g, b, a], axis=-1)[:, None, :]
+
+def _decode_rgba8(e: np.ndarray) -> np.ndarray:
+    return e[:, None, :]
+
+def _decode_bgra8(e: np.ndarray) -> np.ndarray:
+    return e[:, None, [2, 1, 0, 3]]
+
+def _decode_rgb565(e: np.ndarray) -> np.ndarray:
+    v = e.view("<u2")[:, 0]
+    return _rgba(_expand(v >> 11, 5), _expand((v >> 5) & 0x3F, 6), _expand(v & 0x1F, 5))
+
+def _decode_rgb5a1(e: np.ndarray) -> np.ndarray:
+    v = e.view("<u2")[:, 0]
+    return _rgba(_expand(v & 0x1F, 5), _expand((v >> 5) & 0x1F, 5), _expand((v >> 10) & 0x1F, 5),
+                 _expand(v >> 15, 1))
+
+def _decode_rgba4(e: np.ndarray) -> np.ndarray:
+    v = e.view("<u2")[:, 0]
+    return _rgba(_expand(v & 0xF, 4), _expand((v >> 4) & 0xF, 4), _expand((v >> 8) & 0xF, 4),
+                 _expand(v >> 12, 4))
+
+def _decode_r8(e: np.ndarray) -> np.ndarray:
+    r = e[:, 0]
+    return _rgba(r, r, r)
+
+def _decode_rg8(e: np.ndarray) -> np.ndarray:
+    return _rgba(e[:, 0], e[:, 1], np.zeros_like(e[:, 0]))
+
+# ----------------- Block compressed formats -----------------
+
+def _pack(r, g, b, a) -> np.ndarray:
+    """Channels (any int type, 0..255) -> RGBA packed in a little-endian uint32."""
+    return (r.astype(np.uint32) | (g.astype(np.uint32) << 8) | (b.astype(np.uint32) << 16)
+            | (a.astype(np.uint32) << 24))
+
+def _lookup(pal: np.ndarray, sel: np.ndarray) -> np.ndarray:
+    """Per-block palette (n, k) indexed by selectors (n, 16) -> (n, 16)."""
+    n, k = pal.shape
+    flat = sel.astype(np.intp) + (np.arange(n, dtype=np.intp) * k)[:, None]
+    return pal.ravel()[flat]
+
+def _bc1_packed(blocks: np.ndarray, four_color_only: bool) -> np.ndarray:
+    """(n, 8) BC1 color blocks -> (n, 16) packed RGBA."""
+    n = len(blocks)
+    c = blocks[:, :4].copy().view("<u2").astype(np.int32)  # (n, 2) endpoints
+    ends = np.stack([(c >> 11) * 255 // 31, ((c >> 5) & 0x3F) * 255 // 63, (c & 0x1F) * 255 // 31], axis=-1)
+    p0, p1 = ends[:, 0], ends[:, 1]  # (n, 3)
+    pal = np.empty((n, 4, 4), dtype=np.uint8)
+    pal[:, :2, :3] = ends
+    pal[:, :, 3] = 255
+    if four_color_only:
+        pal[:, 2, :3] = (2 * p0 + p1) // 3
+        pal[:, 3, :3] = (p0 + 2 * p1) // 3
+    else:
+        opaque = (c[:, 0] > c[:, 1])[:, None]
+        pal[:, 2, :3] = np.where(opaque, (2 * p0 + p1) // 3, (p0 + p1) // 2)
+        pal[:, 3, :3] = np.where(opaque, (p0 + 2 * p1) // 3, 0)
+        pal[:, 3, 3] = np.where(opaque[:, 0], 255, 0)
+    idx = blocks[:, 4:8].copy().view("<u4")
+    sel = (idx >> (2 * np.arange(16, dtype=np.uint32))) & 3
+    return _lookup(pal.view("<u4").reshape(n, 4), sel)
+
+def _bc1_colors(blocks: np.ndarray, four_color_only: bool) -> np.ndarray:
+    """(n, 8) BC1 color blocks -> (n, 16, 4)."""
+    return _bc1_packed(blocks, four_color_only).view(np.uint8).reshape(len(blocks), 16, 4)
+
+def _bc4_channel(blocks: np.ndarray) -> np.ndarray:
+    """(n, 8) BC4/BC3-alpha blocks -> (n, 16) values."""
+    a0, a1 = blocks[:, 0].astype(np.int32)[:, None], blocks[:, 1].astype(np.int32)[:, None]
+    i = np.arange(1, 7, dtype=np.int32)
+    eight = ((7 - i) * a0 + i * a1) // 7
+    j = np.arange(1, 5, dtype=np.int32)
+    six = np.concatenate([((5 - j) * a0 + j * a1) // 5,
+                          np.zeros_like(a0), np.full_like(a0, 255)], axis=1)
+    pal = np.concatenate([a0, a1, np.where(a0 > a1, eight, six)], axis=1).astype(np.uint8)
+    # 48 bits of 3-bit indices, little-endian, as two 24-bit halves
+    b = blocks[:, 2:8].astype(np.uint32)
+    halves = np.stack([b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16), b[:, 3] | (b[:, 4] << 8) | (b[:, 5] << 16)], axis=1)
+    sel = ((halves[:, :, None] >> (3 * np.arange(8, dtype=np.uint32))) & 7).reshape(len(blocks), 16)
+    return _lookup(pal, sel)
+
+def _decode_bc1(e: np.ndarray) -> np.ndarray:
+    return _bc1_colors(e, four_color_only=False)
+
+def _decode_bc2(e: np.ndarray) -> np.ndarray:
+    out = _bc1_colors(e[:, 8:16], four_color_only=True)
+    a = e[:, :8].copy().view("<u8")[:, 0]
+    nibbles = (a[:, None] >> (4 * np.arange(16, dtype=np.uint64))) & np.uint64(0xF)
+    out[:, :, 3] = (nibbles * np.uint64(17)).astype(np.uint8)
+    return out
+
+def _decode_bc3(e: np.ndarray) -> np.ndarray:
+    out = _bc1_colors(e[:, 8:16], four_color_only=True)
+    out[:, :, 3] = _bc4_channel(e[:, :8])
+    return out
+
+def _decode_bc4(e: np.ndarray) -> np.ndarray:
+    r = _bc4_channel(e)
+    return _pack(r, r, r, np.full_like(r, 255)).view(np.uint8).reshape(len(e), 16, 4)
+
+@lru_cache(maxsize=1)
+def _normal_z_lut() -> np.ndarray:
+    """Z for every (x, y) byte pair of a two-channel normal map, indexed x * 256 + y."""
+    v = np.arange(256) / 127.5 - 1.0
+    z = np.sqrt(np.clip(1.0 - v[:, None] ** 2 - v[None, :] ** 2, 0.0, 1.0))
+    return np.round((z + 1.0) * 127.5).astype(np.uint8).ravel()
+
+def _decode_bc5(e: np.ndarray) -> np.ndarray:
+    r, g = _bc4_channel(e[:, :8]), _bc4_channel(e[:, 8:16])
+    # Two-channel normal maps: rebuild Z so the preview looks like one
+    b = _normal_z_lut()[r.astype(np.intp) * 256 + g]
+    return _pack(r, g, b, np.full_like(r, 255)).view(np.uint8).reshape(len(e), 16, 4)
+
+# ----------------- Registry -----------------
+
+for _code, _fmt in (
+    (0x01, TextureFormat("R8", 1, 1, _decode_r8)),
+    (0x07, TextureFormat("R8G8", 1, 2, _decode_rg8)),
+    (0x08, TextureFormat("R5G6B5", 1, 2, _decode_rgb565)),
+    (0x0A, TextureFormat("R5G5B5A1", 1, 2, _decode_rgb5a1)),
+    (0x0B, TextureFormat("R4G4B4A4", 1, 2, _decode_rgba4)),
+    (0x1A, TextureFormat("R8G8B8A8", 1, 4, _decode_rgba8)),
+    (0x31, TextureFormat("BC1", 4, 8, _decode_bc1)),
+    (0x32, TextureFormat("BC2", 4, 16, _decode_bc2)),
+    (0x33, TextureFormat("BC3", 4, 16, _decode_bc3)),
+    (0x34, TextureFormat("BC4", 4, 8, _decode_bc4)),
+    (0x35, TextureFormat("BC5", 4, 16, _decode_bc5)),
+):
+    register(_code, _fmt)
+    # sRGB variants only differ in how the GPU samples them
+    if _code in (0x1A, 0x31, 0x32, 0x33):
+        register(0x400 | _code, _fmt)
+
+# The old guesses, for TDTs whose format field isn't known
+LEGACY_BGRA8 = TextureFormat("B8G8R8A8", 1, 4, _decode_bgra8)
+LEGACY_RGB565 = FORMATS[0x08]
+
+# ----------------- GX2 tiling -----------------
+# Port of the Wii U address library (2 pipes, 4 banks, 256 byte pipe
+# interleave), evaluated for every element at once.
+
+TILE_LINEAR_GENERAL, TILE_LINEAR_ALIGNED = 0, 1
+TILE_1D_THIN1, TILE_1D_THICK = 2, 3
+TILE_2D_THIN1, TILE_2D_THIN2, TILE_2D_THIN4, TILE_2D_THICK = 4, 5, 6, 7
+TILE_2B_THIN1, TILE_2B_THIN2, TILE_2B_THIN4, TILE_2B_THICK = 8, 9, 10, 11
+
+_PIPES, _BANKS, _GROUP_BITS, _PIPE_BITS, _BANK_BITS = 2, 4, 8, 1, 2
+_BANK_SWAP_ORDER = np.array([0, 1, 3, 2], dtype=np.int64)
+
+def _align_up(value: int, alignment: int) -> int:
+    return (value + alignment - 1) // alignment * alignment
+
+def _pixel_index_in_micro_tile(x: np.ndarray, y: np.ndarray, bpp: int) -> np.ndarray:
+    """Element index inside an 8x8 micro tile (thin modes), bit layout depends on bpp."""
+    b = lambda v, n: (v >> n) & 1
+    if bpp == 8:
+        bits = (b(x, 0), b(x, 1), b(x, 2), b(y, 1), b(y, 0), b(y, 2))
+    elif bpp == 16:
+        bits = (b(x, 0), b(x, 1), b(x, 2), b(y, 0), b(y, 1), b(y, 2))
+    elif bpp == 64:
+        bits = (b(x, 0), b(y, 0), b(x, 1), b(x, 2), b(y, 1), b(y, 2))
+    elif bpp == 128:
+        bits = (b(y, 0), b(x, 0), b(x, 1), b(x, 2), b(y, 1), b(y, 2))
+    else:  # 32 and 96
+        bits = (b(x, 0), b(x, 1), b(y, 0), b(x, 2), b(y, 1), b(y, 2))
+    return sum(v << n for n, v in enumerate(bits))
+
+def _macro_tile_dims(tile_mode: int) -> Tuple[int, int]:
+    pitch, height = 8 * _BANKS, 8 * _PIPES
+    if tile_mode in (TILE_2D_THIN2, TILE_2B_THIN2):
+        return pitch // 2, height * 2
+    if tile_mode in (TILE_2D_THIN4, TILE_2B_THIN4):
+        return pitch // 4, height * 4
+    return pitch, height
+
+def _pitch_alignment(tile_mode: int, bpp: int) -> int:
+    """Row alignment in elements: a (micro tile) row never covers less than one pipe interleave."""
+    interleave = 1 << _GROUP_BITS
+    if tile_mode == TILE_LINEAR_GENERAL:
+        return 1
+    if tile_mode == TILE_LINEAR_ALIGNED:
+        return max(64, interleave * 8 // bpp)
+    if tile_mode in (TILE_1D_THIN1, TILE_1D_THICK):
+        return max(8, interleave // bpp)
+    macro_pitch = _macro_tile_dims(tile_mode)[0]
+    return max(macro_pitch, macro_pitch * (interleave // bpp // 8))
+
+def surface_pitch(width: int, tile_mode: int, bpp: int) -> int:
+    """Pitch (in elements) the GPU pads a row of width elements of bpp bits to."""
+    return _align_up(width, _pitch_alignment(tile_mode, bpp))
+
+def surface_height(height: int, tile_mode: int) -> int:
+    if tile_mode in (TILE_LINEAR_GENERAL, TILE_LINEAR_ALIGNED):
+        return height
+    if tile_mode in (TILE_1D_THIN1, TILE_1D_THICK):
+        return _align_up(height, 8)
+    return _align_up(height, _macro_tile_dims(tile_mode)[1])
+
+def _is_macro(tile_mode: int) -> bool:
+    return tile_mode >= TILE_2D_THIN1
+
+def level_tile_mode(tile_mode: int, width: int, height: int, bpp: int) -> int:
+    """Tile mode a level (width x height elements) really uses: macro modes drop to 1D once it's smaller than a macro tile."""
+    if _is_macro(tile_mode):
+        if width < _pitch_alignment(tile_mode, bpp) or height < _macro_tile_dims(tile_mode)[1]:
+            return TILE_1D_THIN1
+    return tile_mode
+
+def surface_alignment(tile_mode: int, bpp: int) -> int:
+    """Byte alignment of a surface's base address."""
+    if tile_mode == TILE_LINEAR_GENERAL:
+        return 1
+    if not _is_macro(tile_mode):
+        return 1 << _GROUP_BITS  # pipe interleave
+    macro_pitch, macro_height = _macro_tile_dims(tile_mode)
+    return max(macro_pitch * macro_height * bpp // 8, _pitch_alignment(tile_mode, bpp) * macro_height * bpp // 8)
+
+@lru_cache(maxsize=32)
+def gx2_addresses(width: int, height: int, bpp: int, tile_mode: int,
+                  swizzle: int = 0, pitch: Optional[int] = None) -> np.ndarray:
+    """
+    (height, width) byte address of every element of a tiled surface (thin
+    modes, slice 0). Cached, textures of one size share their address map.
+    """
+    pitch = pitch or surface_pitch(width, tile_mode, bpp)
+    y, x = np.mgrid[0:height, 0:width].astype(np.int64)
+    if tile_mode in (TILE_LINEAR_GENERAL, TILE_LINEAR_ALIGNED):
+        return (y * pitch + x) * (bpp // 8)
+    pixel_index = _pixel_index_in_micro_tile(x, y, bpp)
+    if tile_mode in (TILE_1D_THIN1, TILE_1D_THICK):
+        micro_tile_bytes = 64 * bpp // 8
+        micro_offset = micro_tile_bytes * ((x >> 3) + (y >> 3) * (pitch >> 3))
+        return micro_offset + (bpp * pixel_index >> 3)
+
+    elem_offset = (bpp * pixel_index) >> 3
+    pipe = ((y >> 3) ^ (x >> 3)) & 1
+    bank = (((y // (16 * _PIPES)) ^ (x >> 3)) & 1) | (2 * (((y // (8 * _PIPES)) ^ (x >> 4)) & 1))
+    bank_pipe = pipe + _PIPES * bank
+    pipe_swizzle, bank_swizzle = (swizzle >> 8) & 1, (swizzle >> 9) & 3
+    bank_pipe = (bank_pipe ^ (pipe_swizzle + _PIPES * bank_swizzle)) % (_PIPES * _BANKS)
+    pipe, bank = bank_pipe % _PIPES, bank_pipe // _PIPES
+
+    macro_pitch, macro_height = _macro_tile_dims(tile_mode)
+    macro_tile_bytes = (bpp * macro_height * macro_pitch + 7) // 8
+    macro_x, macro_y = x // macro_pitch, y // macro_height
+    macro_offset = (macro_x + (pitch // macro_pitch) * macro_y) * macro_tile_bytes
+    if tile_mode in (TILE_2B_THIN1, TILE_2B_THIN2, TILE_2B_THIN4, TILE_2B_THICK):
+        swap_width = _bank_swapped_width(tile_mode, bpp, pitch)
+        bank = bank ^ _BANK_SWAP_ORDER[(macro_pitch * macro_x // swap_width) & (_BANKS - 1)]
+
+    group_mask = (1 << _GROUP_BITS) - 1
+    total = elem_offset + (macro_offset >> (_BANK_BITS + _PIPE_BITS))
+    high = (total & ~group_mask) << (_BANK_BITS + _PIPE_BITS)
+    addr = (bank << (_PIPE_BITS + _GROUP_BITS)) | (pipe << _GROUP_BITS) | (total & group_mask) | high
+    addr.flags.writeable = False
+    return addr
+
+def _bank_swapped_width(tile_mode: int, bpp: int, pitch: int) -> int:
+    swap_size, row_size, split_size, group_size = 256, 2048, 2048, 256
+    bytes_per_sample = 8 * bpp
+    samples_per_tile = split_size // bytes_per_sample
+    slices_per_tile = max(1, 1 // samples_per_tile) if samples_per_tile else 1
+    bytes_per_tile_slice = bytes_per_sample // slices_per_tile
+    factor = 2 if tile_mode == TILE_2B_THIN2 else 4 if tile_mode == TILE_2B_THIN4 else 1
+    swap_width = max(1, (swap_size >> 1) // bpp) * 8 * _BANKS
+    height_bytes = factor * _PIPES * bpp // slices_per_tile
+    swap_max = _PIPES * _BANKS * row_size // height_bytes
+    swap_min = group_size * 8 * _BANKS // bytes_per_tile_slice
+    width = min(swap_max, max(swap_min, swap_width))
+    while width >= 2 * pitch:
+        width >>= 1
+    return width
+
+# ----------------- Surfaces -----------------
+
+def level_size(fmt: TextureFormat, width: int, height: int) -> int:
+    bw, bh = -(-width // fmt.block), -(-height // fmt.block)
+    return bw * bh * fmt.bytes_per_block
+
+def mip_chain_size(fmt: TextureFormat, width: int, height: int, levels: int) -> int:
+    return sum(level_size(fmt, max(1, width >> n), max(1, height >> n)) for n in range(levels))
+
+def max_mip_levels(width: int, height: int) -> int:
+    return max(width, height).bit_length()
+
+@dataclass(frozen=True)
+class SurfaceLayout:
+    tile_mode: int   # after level_tile_mode
+    pitch: int       # padded row, in elements
+    height: int      # padded rows of elements
+    size: int        # bytes the level takes
+    alignment: int   # its base is aligned to this within the image or mip buffer
+
+def surface_layout(fmt: TextureFormat, width: int, height: int, tile_mode: int, level: int = 0) -> SurfaceLayout:
+    """
+    How a GX2 surface level (width x height pixels are the level's own) is
+    stored. Tiled levels after the first are padded to powers of two, rows and
+    heights to whole (micro or macro) tiles.
+    """
+    if tile_mode == TILE_LINEAR_GENERAL:
+        return SurfaceLayout(tile_mode, -(-width // fmt.block), -(-height // fmt.block),
+                             level_size(fmt, width, height), 1)
+    if level:
+        width, height = 1 << (width - 1).bit_length(), 1 << (height - 1).bit_length()
+    bw, bh = -(-width // fmt.block), -(-height // fmt.block)
+    bpp = fmt.bytes_per_block * 8
+    mode = level_tile_mode(tile_mode, bw, bh, bpp)
+    pitch, padded = surface_pitch(bw, mode, bpp), surface_height(bh, mode)
+    return SurfaceLayout(mode, pitch, padded, pitch * padded * bpp // 8, surface_alignment(mode, bpp))
+
+def decode_surface(data, fmt: TextureFormat, width: int, height: int,
+                   tile_mode: int = TILE_LINEAR_GENERAL, swizzle: int = 0, level: int = 0) -> np.ndarray:
+    """One mip level -> (height, width, 4) RGBA uint8."""
+    bs, bpb = fmt.block, fmt.bytes_per_block
+    bw, bh = -(-width // bs), -(-height // bs)
+    raw = np.frombuffer(data, dtype=np.uint8)
+    if tile_mode == TILE_LINEAR_GENERAL:
+        need = bw * bh * bpb
+        if len(raw) < need:
+            raise ValueError(f"{fmt.name} {width}x{height} needs {need} bytes, got {len(raw)}")
+        elems = raw[:need].reshape(bw * bh, bpb)
+    else:
+        layout = surface_layout(fmt, width, height, tile_mode, level)
+        if len(raw) < layout.size:
+            raise ValueError(f"Tiled {fmt.name} {width}x{height} needs {layout.size} bytes, got {len(raw)}")
+        addr = gx2_addresses(bw, bh, bpb * 8, layout.tile_mode, swizzle, layout.pitch).ravel()
+        # Elements are bpb-aligned, so gather whole elements through a wider view
+        whole = raw[:len(raw) // bpb * bpb].view(f"V{bpb}")
+        elems = whole[addr // bpb].view(np.uint8).reshape(-1, bpb)
+    px = fmt.decode(np.ascontiguousarray(elems))  # (n, bs*bs, 4)
+    img = px.reshape(bh, bw, bs, bs, 4).transpose(0, 2, 1, 3, 4).reshape(bh * bs, bw * bs, 4)
+    return img[:height, :width]
+
+def decode_mips(data, fmt: TextureFormat, width: int, height: int, levels: int,
+                tile_mode: int = TILE_LINEAR_GENERAL, swizzle: int = 0) -> List[np.ndarray]:
+    """
+    Every level of a mip chain: the image, then the mip buffer. Linear chains
+    are packed back to back, tiled levels are padded and aligned (surface_layout).
+    """
+    out, pos = [], 0
+    view = memoryview(data)
+    for n in range(levels):
+        w, h = max(1, width >> n), max(1, height >> n)
+        layout = surface_layout(fmt, w, h, tile_mode, n)
+        pos = _align_up(pos, layout.alignment)
+        if pos + layout.size > len(view):
+            break
+        out.append(decode_surface(view[pos:pos + layout.size], fmt, w, h, tile_mode, swizzle, n))
+        pos += layout.size
+    return out
@@ -0,0 +1,246 @@
+import hashlib
+import os
+import struct
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from utilities import bfz
+from utilities import exporter
+from utilities import formats
+from utilities import indexCache
+from utilities import parallelDecompress
+from utilities import textureDecoders
+from utilities import textureFile
+from utilities import tracing
+
+# ----------------- Batch texture export -----------------
+# Decoding, PNG encoding and thumbnailing all run on a process pool, fed a few
+# textures at a time so memory stays flat, results go straight to disk.
+# Thumbnails live in an on-disk cache keyed by content hash, so a texture that
+# shows up in several archives (or opens again tomorrow) is only rendered once.
+
+DEFAULT_THUMB_SIZE = 128
+
+def thumbnail_dir() -> str:
+    return os.path.join(indexCache.cache_root(), "thumbs")
+
+def thumbnail_path(digest: str, size: int = DEFAULT_THUMB_SIZE) -> str:
+    return os.path.join(thumbnail_dir(), digest[:2], f"{digest}_{size}.png")
+
+def content_digest(data) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def texture_entries(arch: bfz.BFZArchive, entries: Optional[Sequence[bfz.BFZFileEntry]] = None) -> List[bfz.BFZFileEntry]:
+    """The TDTs among entries (default: all), by sniffed format, not extension."""
+    codes = formats.sniff_archive(arch)
+    tdt = formats.CODES["tdt"]
+    return [e for e in (arch.file_entries if entries is None else entries) if codes[e.index] == tdt]
+
+# ----------------- DDS -----------------
+
+DDSD_CAPS, DDSD_HEIGHT, DDSD_WIDTH, DDSD_PITCH = 0x1, 0x2, 0x4, 0x8
+DDSD_PIXELFORMAT, DDSD_MIPMAPCOUNT, DDSD_LINEARSIZE = 0x1000, 0x20000, 0x80000
+DDPF_ALPHAPIXELS, DDPF_FOURCC, DDPF_RGB, DDPF_LUMINANCE = 0x1, 0x4, 0x40, 0x20000
+DDSCAPS_COMPLEX, DDSCAPS_TEXTURE, DDSCAPS_MIPMAP = 0x8, 0x1000, 0x400000
+
+# Format name -> (pixel format flags, fourcc, bits, r, g, b, a masks)
+DDS_PIXEL_FORMATS = {
+    "BC1": (DDPF_FOURCC, b"DXT1", 0, 0, 0, 0, 0),
+    "BC2": (DDPF_FOURCC, b"DXT3", 0, 0, 0, 0, 0),
+    "BC3": (DDPF_FOURCC, b"DXT5", 0, 0, 0, 0, 0),
+    "BC4": (DDPF_FOURCC, b"ATI1", 0, 0, 0, 0, 0),
+    "BC5": (DDPF_FOURCC, b"ATI2", 0, 0, 0, 0, 0),
+    "R8G8B8A8": (DDPF_RGB | DDPF_ALPHAPIXELS, b"\0\0\0\0", 32, 0xFF, 0xFF00, 0xFF0000, 0xFF000000),
+    "R5G6B5": (DDPF_RGB, b"\0\0\0\0", 16, 0xF800, 0x07E0, 0x001F, 0),
+    "R5G5B5A1": (DDPF_RGB | DDPF_ALPHAPIXELS, b"\0\0\0\0", 16, 0x001F, 0x03E0, 0x7C00, 0x8000),
+    "R4G4B4A4": (DDPF_RGB | DDPF_ALPHAPIXELS, b"\0\0\0\0", 16, 0x000F, 0x00F0, 0x0F00, 0xF000),
+    "R8G8": (DDPF_RGB, b"\0\0\0\0", 16, 0x00FF, 0xFF00, 0, 0),
+    "R8": (DDPF_LUMINANCE, b"\0\0\0\0", 8, 0xFF, 0, 0, 0),
+}
+
+def dds_header(fmt: textureDecoders.TextureFormat, width: int, height: int, levels: int) -> bytes:
+    pf_flags, fourcc, bits, r, g, b, a = DDS_PIXEL_FORMATS[fmt.name]
+    flags = DDSD_CAPS | DDSD_HEIGHT | DDSD_WIDTH | DDSD_PIXELFORMAT
+    caps = DDSCAPS_TEXTURE
+    if fmt.block > 1:
+        flags |= DDSD_LINEARSIZE
+        pitch = textureDecoders.level_size(fmt, width, height)
+    else:
+        flags |= DDSD_PITCH
+        pitch = width * fmt.bytes_per_block
+    if levels > 1:
+        flags |= DDSD_MIPMAPCOUNT
+        caps |= DDSCAPS_COMPLEX | DDSCAPS_MIPMAP
+    pixel_format = struct.pack("<II4sIIIII", 32, pf_flags, fourcc, bits, r, g, b, a)
+    header = struct.pack("<IIIIIII", 124, flags, height, width, pitch, 0, levels) + bytes(44)
+    return b"DDS " + header + pixel_format + struct.pack("<IIIII", caps, 0, 0, 0, 0)
+
+def tdt_to_dds(data: bytes) -> bytes:
+    """Known formats keep their (block compressed) data and mips as is, anything else becomes RGBA8."""
+    hdr = textureFile.parse_tdt_header(data)
+    fmt = textureDecoders.FORMATS.get(hdr.format)
+    if fmt is not None and fmt.name in DDS_PIXEL_FORMATS:
+        size = textureDecoders.mip_chain_size(fmt, hdr.width, hdr.height, hdr.mip_levels)
+        payload = data[hdr.data_offset:hdr.data_offset + size]
+        if len(payload) == size:
+            return dds_header(fmt, hdr.width, hdr.height, hdr.mip_levels) + bytes(payload)
+    img = textureFile.decode_tdt(data)
+    if img is None:
+        raise RuntimeError("Unsupported/unknown TDT format")
+    return dds_header(textureDecoders.FORMATS[0x1A], img.width, img.height, 1) + img.convert("RGBA").tobytes()
+
+# ----------------- Workers -----------------
+
+def _save_atomic(path: str, write):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+def _render_texture(data: bytes, out_path: Optional[str], kind: str,
+                    thumb_path: Optional[str], thumb_size: int) -> int:
+    """Runs in a worker process: write the PNG/DDS and/or the thumbnail, returns bytes written."""
+    written = 0
+    img = None
+    if out_path:
+        if kind == "dds":
+            dds = tdt_to_dds(data)
+            with open(out_path, "wb") as w: w.write(dds)
+            written = len(dds)
+        else:
+            img = textureFile.decode_tdt(data)
+            if img is None:
+                raise RuntimeError("Unsupported/unknown TDT format")
+            img.save(out_path, "PNG")
+            written = os.path.getsize(out_path)
+    if thumb_path:
+        if img is None:
+            img = textureFile.decode_tdt(data)
+            if img is None:
+                raise RuntimeError("Unsupported/unknown TDT format")
+        thumb = img.copy()
+        thumb.thumbnail((thumb_size, thumb_size))
+        _save_atomic(thumb_path, lambda p: thumb.save(p, "PNG"))
+    return written
+
+def _run_pool(tasks: Iterable[Tuple[object, tuple]], total: int, workers: Optional[int],
+              progress: Optional[bfz.ProgressCallback], label: str) -> Iterator[Tuple[object, object, Optional[Exception]]]:
+    """Run _render_texture over tasks with a bounded queue, yields (key, result, error) as they finish."""
+    workers = workers or exporter.default_workers()
+    done = 0
+    if progress:
+        progress(0, total, label)
+    pool = parallelDecompress.process_pool(workers)
+    pending: Dict[Future, object] = {}
+
+    def collect(block_until: int):
+        nonlocal done
+        while len(pending) > block_until:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                key = pending.pop(fut)
+                try:
+                    yield key, fut.result(), None
+                except Exception as e:
+                    yield key, None, e
+                done += 1
+            if progress:
+                progress(done, total, label)
+
+    try:
+        for key, args in tasks:
+            pending[pool.submit(_render_texture, *args)] = key
+            yield from collect(workers * 2)
+        yield from collect(0)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def _digests(arch: bfz.BFZArchive, entries: Sequence[bfz.BFZFileEntry]) -> List[str]:
+    if arch.hashes is not None:
+        # Same BLAKE2b-128 contentHash stored with the index
+        return [arch.hashes[e.index].tobytes().hex() for e in entries]
+    # hashlib drops the GIL on large buffers, threads are enough
+    with ThreadPoolExecutor(max_workers=exporter.default_workers()) as pool:
+        return list(pool.map(lambda e: content_digest(arch.read_file_view(e)), entries))
+
+# ----------------- Public API -----------------
+
+@tracing.traced("export_textures", "export")
+def export_textures(
+    arch: bfz.BFZArchive,
+    out_dir: str,
+    entries: Optional[Sequence[bfz.BFZFileEntry]] = None,
+    kind: str = "png",
+    thumbnails: bool = False,
+    thumb_size: int = DEFAULT_THUMB_SIZE,
+    workers: Optional[int] = None,
+    progress: Optional[bfz.ProgressCallback] = None,
+) -> exporter.ExportResult:
+    """
+    Export every texture in entries (default: all TDTs) as PNG or DDS under
+    out_dir, keeping the archive's folder layout. thumbnails also fills the
+    thumbnail cache on the way, since the texture is decoded anyway.
+    """
+    if kind not in ("png", "dds"):
+        raise ValueError(f"Unknown texture export format: {kind}")
+    entries = texture_entries(arch, entries)
+    items = exporter.plan_export(arch, out_dir, entries, convert=kind == "png", dedupe=None)
+    for d in sorted({os.path.dirname(it.out_path) for it in items}):
+        os.makedirs(d, exist_ok=True)
+    digests = _digests(arch, entries) if thumbnails else None
+
+    def tasks():
+        for n, item in enumerate(items):
+            out_path = item.out_path if kind == "png" else os.path.splitext(item.out_path)[0] + ".dds"
+            thumb = None
+            if digests is not None:
+                thumb = thumbnail_path(digests[n], thumb_size)
+                if os.path.exists(thumb):
+                    thumb = None
+            data = bytes(arch.read_file_view(item.entry))
+            yield item, (data, out_path, kind, thumb, thumb_size)
+
+    result = exporter.ExportResult()
+    for item, written, error in _run_pool(tasks(), len(items), workers, progress, "Exporting textures…"):
+        if error is not None:
+            result.errors.append(f"{item.entry.name}: {error}")
+        else:
+            result.written += 1
+            result.converted += 1
+            result.bytes_written += written
+            tracing.count("export", written)
+    return result
+
+@tracing.traced("make_thumbnails", "export")
+def make_thumbnails(
+    arch: bfz.BFZArchive,
+    entries: Optional[Sequence[bfz.BFZFileEntry]] = None,
+    size: int = DEFAULT_THUMB_SIZE,
+    workers: Optional[int] = None,
+    progress: Optional[bfz.ProgressCallback] = None,
+) -> Dict[int, str]:
+    """Entry index -> thumbnail PNG for every texture that decodes; only missing ones get rendered."""
+    entries = texture_entries(arch, entries)
+    found: Dict[int, str] = {}
+    missing: Dict[str, List[bfz.BFZFileEntry]] = {}
+    for entry, digest in zip(entries, _digests(arch, entries)):
+        path = thumbnail_path(digest, size)
+        if os.path.exists(path):
+            found[entry.index] = path
+        else:
+            missing.setdefault(digest, []).append(entry)
+
+    def tasks():
+        for digest, same in missing.items():
+            data = bytes(arch.read_file_view(same[0]))
+            yield digest, (data, None, "png", thumbnail_path(digest, size), size)
+
+    for digest, _written, error in _run_pool(tasks(), len(missing), workers, progress, "Rendering thumbnails…"):
+        if error is None:
+            for entry in missing[digest]:
+                found[entry.index] = thumbnail_path(digest, size)
+    return found
@@ -1,13 +1,9 @@
 from PIL import Image
-import numpy as np
-import os
-import traceback
 import struct
 from dataclasses import dataclass
 
 from typing import Optional
-from utilities import bfz
-from PySide6.QtWidgets import QFileDialog, QMessageBox
+from utilities import textureDecoders
 
 # TDTs
 # NOTE: This is currently bad, I am pretty sure different platforms use different textures, if you opened up the WiiU version you might be able to get textures
@@ -18,6 +14,22 @@ class TDTHeader:
     height: int
     format: int
     data_offset: int
+    mip_levels: int = 1
+
+# Nothing seen so far puts pixel data earlier than this
+MIN_DATA_OFFSET = 0x40
+
+def _find_data_offset(size: int, fmt: textureDecoders.TextureFormat, width: int, height: int):
+    """
+    (data_offset, mip_levels): the pixel data is taken to run to the end of the
+    file, so the longest mip chain ending exactly there, starting 16-byte
+    aligned past the header, wins. Falls back to the old 0x40 guess.
+    """
+    for levels in range(textureDecoders.max_mip_levels(width, height), 0, -1):
+        offset = size - textureDecoders.mip_chain_size(fmt, width, height, levels)
+        if offset >= MIN_DATA_OFFSET and offset % 16 == 0:
+            return offset, levels
+    return MIN_DATA_OFFSET, 1
 
 def parse_tdt_header(data: bytes) -> TDTHeader:
     if data[0x10:0x14] != b"TDT_":
@@ -27,49 +39,28 @@ def parse_tdt_header(data: bytes) -> TDTHeader:
     width = struct.unpack_from("<H", data, 0x20)[0]
     height = struct.unpack_from("<H", data, 0x22)[0]
     fmt = struct.unpack_from("<I", data, 0x18)[0]
-    data_offset = 0x40  # guess, refine later
-    return TDTHeader(width, height, fmt, data_offset)
+    tex = textureDecoders.FORMATS.get(fmt)
+    if tex is None or not width or not height:
+        return TDTHeader(width, height, fmt, MIN_DATA_OFFSET)
+    data_offset, levels = _find_data_offset(len(data), tex, width, height)
+    return TDTHeader(width, height, fmt, data_offset, levels)
 
 def decode_tdt(data: bytes) -> Optional[Image.Image]:
     hdr = parse_tdt_header(data)
-    pixels = data[hdr.data_offset:]
-
-    # try RGBA8888
-    try:
-        img = Image.frombytes("RGBA", (hdr.width, hdr.height), pixels, "raw", "BGRA")
-        return img
-    except Exception:
-        pass
+    pixels = memoryview(data)[hdr.data_offset:]
 
-    # try RGB565 fallback
-    try:
-        arr = np.frombuffer(pixels, dtype=np.uint16).reshape(hdr.height, hdr.width)
-        r = ((arr >> 11) & 0x1F) * 255 // 31
-        g = ((arr >> 5) & 0x3F) * 255 // 63
-        b = (arr & 0x1F) * 255 // 31
-        rgba = np.dstack((r, g, b, np.full_like(r, 255, dtype=np.uint8)))
-        return Image.fromarray(rgba.astype(np.uint8), "RGBA")
-    except Exception:
-        return None
+    # Known format field: decode it properly
+    tex = textureDecoders.FORMATS.get(hdr.format)
+    if tex is not None:
+        try:
+            return Image.fromarray(textureDecoders.decode_surface(pixels, tex, hdr.width, hdr.height), "RGBA")
+        except ValueError:
+            pass
 
-def export_tdt_as_png(self, entry: bfz.BFZFileEntry):
-    if not self.archive:
-        return
-    path, _ = QFileDialog.getSaveFileName(
-        self, "Export PNG", os.path.splitext(entry.name)[0] + ".png"
-    )
-    if not path:
-        return
-    try:
-        data = self.archive.read_file_bytes(entry)
-        img = decode_tdt(data)
-        if not img:
-            raise RuntimeError("Unsupported/unknown TDT format")
-        img.save(path)
-        QMessageBox.information(self, "Exported", f"Exported PNG:\n{path}")
-    except Exception as e:
-        QMessageBox.critical(
-            self,
-            "Export error",
-            f"Failed to export PNG:\n{e}\n\n{traceback.format_exc()}",
-        )
+    # Otherwise the old guesses: BGRA8888, then RGB565
+    for guess in (textureDecoders.LEGACY_BGRA8, textureDecoders.LEGACY_RGB565):
+        try:
+            return Image.fromarray(textureDecoders.decode_surface(pixels, guess, hdr.width, hdr.height), "RGBA")
+        except ValueError:
+            continue
+    return None
@@ -0,0 +1,62 @@
+from typing import Dict, Optional
+
+from PySide6.QtCore import QSize, Qt, Signal
+from PySide6.QtGui import QIcon, QPixmap
+from PySide6.QtWidgets import (
+    QDialog, QLabel, QLineEdit, QListView, QListWidget, QListWidgetItem, QVBoxLayout,
+)
+
+from utilities import bfz
+from utilities import textureExport
+
+# ----------------- Texture grid -----------------
+# Every texture of an archive as a thumbnail, from textureExport's on-disk
+# cache, so only textures never seen before have to be decoded.
+
+class TextureGridDialog(QDialog):
+    # entry name
+    entryActivated = Signal(str)
+
+    def __init__(self, parent=None, size: int = textureExport.DEFAULT_THUMB_SIZE):
+        super().__init__(parent)
+        self.setWindowTitle("Textures")
+        self.resize(900, 600)
+        self.thumb_size = size
+
+        v = QVBoxLayout(self)
+        self.filter_edit = QLineEdit(); self.filter_edit.setPlaceholderText("Filter by name")
+        self.filter_edit.setClearButtonEnabled(True)
+        self.filter_edit.textChanged.connect(self.apply_filter)
+        v.addWidget(self.filter_edit)
+
+        self.grid = QListWidget()
+        self.grid.setViewMode(QListView.IconMode)
+        self.grid.setResizeMode(QListView.Adjust)
+        self.grid.setMovement(QListView.Static)
+        self.grid.setUniformItemSizes(True)
+        self.grid.setIconSize(QSize(size, size))
+        self.grid.setGridSize(QSize(size + 24, size + 36))
+        self.grid.itemDoubleClicked.connect(lambda item: self.entryActivated.emit(item.data(Qt.UserRole)))
+        v.addWidget(self.grid, 1)
+        self.status = QLabel(""); v.addWidget(self.status)
+
+    def set_thumbnails(self, archive: bfz.BFZArchive, thumbs: Dict[int, str]):
+        """thumbs: entry index -> thumbnail path, as returned by textureExport.make_thumbnails."""
+        self.grid.clear()
+        self.grid.setUpdatesEnabled(False)
+        for index in sorted(thumbs, key=lambda i: archive.names[i].lower()):
+            name = archive.names[index]
+            item = QListWidgetItem(QIcon(QPixmap(thumbs[index])), name.replace("\\", "/").rsplit("/", 1)[-1])
+            item.setData(Qt.UserRole, name); item.setToolTip(name)
+            self.grid.addItem(item)
+        self.grid.setUpdatesEnabled(True)
+        self.apply_filter(self.filter_edit.text())
+
+    def apply_filter(self, text: Optional[str] = None):
+        text = (text or "").strip().lower()
+        shown = 0
+        for row in range(self.grid.count()):
+            item = self.grid.item(row)
+            hidden = bool(text) and text not in item.data(Qt.UserRole).lower()
+            item.setHidden(hidden); shown += not hidden
+        self.status.setText(f"{shown:,} textures")
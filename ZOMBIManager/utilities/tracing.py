@@ -0,0 +1,148 @@
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import nullcontext
+from typing import Dict, List, Optional
+
+# ----------------- Tracing -----------------
+# Named spans and byte counters around the hot paths, written out as Chrome
+# trace-event JSON (open it in chrome://tracing or ui.perfetto.dev).
+# Off by default: span() then hands back one shared no-op context manager and
+# count() returns after a single flag check, so the calls can stay in.
+# Set ZOMBI_TRACE=trace.json to record a whole run (written at exit).
+# Only this process is recorded, work done in process pools shows up as the
+# parent waiting on it.
+
+_enabled = False
+_lock = threading.Lock()
+_events: List[dict] = []
+_totals: Dict[str, float] = defaultdict(float)
+# Threads are usually gone by the time the trace is written
+_thread_names: Dict[int, str] = {}
+# Counter tracks get at most one sample per COUNTER_INTERVAL_US per name
+COUNTER_INTERVAL_US = 1000
+_counter_ts: Dict[str, float] = {}
+_t0 = time.perf_counter()
+_pid = os.getpid()
+_NULL = nullcontext()
+
+def enabled() -> bool:
+    return _enabled
+
+def enable():
+    """Start recording, dropping whatever was recorded before."""
+    global _enabled, _t0
+    with _lock:
+        _events.clear(); _totals.clear(); _thread_names.clear(); _counter_ts.clear()
+        _t0 = time.perf_counter()
+        _enabled = True
+
+def disable():
+    global _enabled
+    _enabled = False
+
+def _now_us() -> float:
+    return (time.perf_counter() - _t0) * 1e6
+
+class _Span:
+    __slots__ = ("name", "cat", "args", "start")
+
+    def __init__(self, name: str, cat: str, args: dict):
+        self.name, self.cat, self.args = name, cat, args
+
+    def __enter__(self):
+        self.start = _now_us()
+        return self
+
+    def __exit__(self, *exc):
+        end = _now_us()
+        tid = threading.get_ident()
+        event = dict(name=self.name, cat=self.cat, ph="X", ts=self.start, dur=end - self.start, pid=_pid, tid=tid)
+        if self.args:
+            event["args"] = self.args
+        with _lock:
+            _events.append(event)
+            if tid not in _thread_names:
+                _thread_names[tid] = threading.current_thread().name
+        return False
+
+def span(name: str, cat: str = "zombi", **args):
+    """with span("decode tables", "parse", files=n): ... records how long the block took."""
+    if not _enabled:
+        return _NULL
+    return _Span(name, cat, args)
+
+def traced(name: Optional[str] = None, cat: str = "zombi"):
+    """Decorator version of span(), named after the function by default."""
+    def wrap(fn):
+        label = name or fn.__qualname__
+        @functools.wraps(fn)
+        def run(*a, **kw):
+            if not _enabled:
+                return fn(*a, **kw)
+            with _Span(label, cat, {}):
+                return fn(*a, **kw)
+        return run
+    return wrap
+
+def count(name: str, value: float = 1):
+    """Add to a running total, also drawn as a counter track in the trace."""
+    if not _enabled:
+        return
+    ts = _now_us()
+    with _lock:
+        _totals[name] += value
+        if ts - _counter_ts.get(name, -COUNTER_INTERVAL_US) >= COUNTER_INTERVAL_US:
+            _counter_ts[name] = ts
+            _events.append(dict(name=name, ph="C", ts=ts, pid=_pid, args={name: _totals[name]}))
+
+def totals() -> Dict[str, float]:
+    with _lock:
+        return dict(_totals)
+
+# ----------------- Output -----------------
+
+def trace_events() -> List[dict]:
+    ts = _now_us()
+    with _lock:
+        events, names = list(_events), dict(_thread_names)
+        # Final value of every counter, the throttled samples may have skipped it
+        events += [dict(name=k, ph="C", ts=ts, pid=_pid, args={k: v}) for k, v in _totals.items()]
+    meta = [dict(name="thread_name", ph="M", pid=_pid, tid=tid, args=dict(name=name)) for tid, name in names.items()]
+    return meta + events
+
+def write_trace(path: str) -> int:
+    """Write the Chrome trace JSON, returns the number of events."""
+    events = trace_events()
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as w:
+        json.dump(dict(traceEvents=events, displayTimeUnit="ms",
+                       otherData=dict(totals=totals())), w)
+    os.replace(tmp, path)
+    return len(events)
+
+class Throughput:
+    """Rates of the running totals since the last sample(), for a live readout."""
+    def __init__(self):
+        self._last = totals()
+        self._time = time.perf_counter()
+
+    def sample(self) -> Dict[str, float]:
+        now, cur = time.perf_counter(), totals()
+        dt = max(now - self._time, 1e-6)
+        rates = {k: (v - self._last.get(k, 0)) / dt for k, v in cur.items()}
+        self._last, self._time = cur, now
+        return rates
+
+def _write_at_exit(path: str):
+    # Forked workers inherit the flag, only the process that started it writes
+    if _enabled and os.getpid() == _pid:
+        write_trace(path)
+
+if os.environ.get("ZOMBI_TRACE"):
+    enable()
+    atexit.register(_write_at_exit, os.environ["ZOMBI_TRACE"])
@@ -0,0 +1,287 @@
+from __future__ import annotations
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# ----------------- Utilities -----------------
+from utilities import bfz
+from utilities import contentHash
+from utilities import exporter
+from utilities import formats
+from utilities import previewers
+from utilities import synthBfz
+from utilities import textureFile
+from utilities import tracing
+
+# ----------------- Benchmarks -----------------
+# Times the hot paths on a synthetic archive (see synthBfz) and writes the
+# numbers as JSON. Give it --compare with an older JSON to fail on regressions.
+
+@dataclass
+class BenchResult:
+    name: str
+    seconds: float
+    bytes: int = 0
+    items: int = 0
+    peak_rss: int = 0  # bytes, for this step where the OS can reset the high-water mark
+
+    @property
+    def mb_per_s(self) -> float:
+        return self.bytes / self.seconds / 1e6 if self.seconds else 0.0
+
+    @property
+    def items_per_s(self) -> float:
+        return self.items / self.seconds if self.seconds else 0.0
+
+def _reset_peak_rss() -> bool:
+    # Linux: writing 5 resets VmHWM, so every step gets its own peak
+    try:
+        with open("/proc/self/clear_refs", "w") as f: f.write("5")
+        return True
+    except OSError:
+        return False
+
+def peak_rss() -> int:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss if sys.platform == "darwin" else rss * 1024
+
+def measure(name: str, fn: Callable[[], None], nbytes: int = 0, items: int = 0, repeat: int = 1) -> BenchResult:
+    """Best of repeat runs of fn."""
+    best = None
+    peak = 0
+    for _ in range(repeat):
+        _reset_peak_rss()
+        t = time.perf_counter()
+        with tracing.span(name, "bench"):
+            fn()
+        elapsed = time.perf_counter() - t
+        peak = max(peak, peak_rss())
+        best = elapsed if best is None else min(best, elapsed)
+    result = BenchResult(name, best, nbytes, items, peak)
+    print(f"{name:<22} {result.seconds:9.3f}s  {result.mb_per_s:9.1f} MB/s  "
+          f"{result.items_per_s:11.0f} items/s  peak {result.peak_rss / 2**20:7.0f} MB", flush=True)
+    return result
+
+# ----------------- Suite -----------------
+
+def run_suite(archive: str, workers: Optional[int], repeat: int, gui: bool) -> List[BenchResult]:
+    results: List[BenchResult] = []
+    probe = bfz.BFZArchive(archive, use_index_cache=False)
+    probe.parse(lazy=True)
+    entries = list(probe.file_entries)
+    total = sum(e.size for e in entries)
+    data_size = probe.data_size
+    probe.close()
+
+    def parse_tables():
+        a = bfz.BFZArchive(archive, use_index_cache=False); a.parse(lazy=True); a.close()
+    results.append(measure("parse_tables", parse_tables, items=len(entries), repeat=repeat))
+
+    def parse_cached():
+        a = bfz.BFZArchive(archive); a.parse(lazy=True); a.close()
+    parse_cached()  # fill the index cache
+    results.append(measure("parse_tables_cached", parse_cached, items=len(entries), repeat=repeat))
+
+    def parse_full():
+        a = bfz.BFZArchive(archive, workers=workers, use_index_cache=False); a.parse(); a.close()
+    results.append(measure("parse_decompress", parse_full, nbytes=data_size, repeat=repeat))
+
+    arch = bfz.BFZArchive(archive, workers=workers)
+    arch.parse()
+
+    def read_all():
+        for e in entries: arch.read_file_bytes(e)
+    results.append(measure("read_file_bytes", read_all, nbytes=total, items=len(entries), repeat=repeat))
+
+    def read_lazy():
+        a = bfz.BFZArchive(archive, workers=workers); a.parse(lazy=True)
+        for e in entries[::max(1, len(entries) // 500)]: a.read_file_bytes(e)
+        a.close()
+    results.append(measure("read_lazy_sample", read_lazy, items=len(entries[::max(1, len(entries) // 500)]), repeat=repeat))
+
+    out = tempfile.mkdtemp(prefix="zombi-bench-")
+    try:
+        def export_all():
+            exporter.export_entries(arch, out, workers=workers)
+        results.append(measure("export_all", export_all, nbytes=total, items=len(entries), repeat=repeat))
+    finally:
+        shutil.rmtree(out, ignore_errors=True)
+
+    def hash_all():
+        arch.hashes = None
+        contentHash.hash_archive(arch, workers=workers)
+    results.append(measure("hash_entries", hash_all, nbytes=total, items=len(entries), repeat=repeat))
+
+    def sniff_all():
+        arch.types = None
+        formats.sniff_archive(arch)
+    results.append(measure("sniff_types", sniff_all, items=len(entries), repeat=repeat))
+
+    codes = formats.sniff_archive(arch)
+    tdts = [e for e in entries if codes[e.index] == formats.CODES["tdt"]]
+    sons = [e for e in entries if codes[e.index] == formats.CODES["son"]]
+
+    def decode_tdts():
+        for e in tdts: textureFile.decode_tdt(arch.read_file_view(e))
+    results.append(measure("decode_tdt", decode_tdts, nbytes=sum(e.size for e in tdts), items=len(tdts), repeat=repeat))
+
+    def decode_sons():
+        for e in sons:
+            wav = previewers.extract_wav_from_son(arch.read_file_view(e))
+            if wav: previewers.get_wav_metadata(wav); previewers.waveform_envelope(wav)
+    results.append(measure("decode_son", decode_sons, nbytes=sum(e.size for e in sons), items=len(sons), repeat=repeat))
+
+    results.extend(run_startup(repeat, gui))
+    if gui:
+        results.extend(run_gui(arch, repeat))
+    arch.close()
+    return results
+
+def run_startup(repeat: int, gui: bool) -> List[BenchResult]:
+    """Cold import of the CLI (and the GUI) in a fresh interpreter."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = []
+    for name, module in [("import_cli", "zombiCli")] + ([("import_gui", "zombiManager")] if gui else []):
+        def cold_import():
+            subprocess.run([sys.executable, "-c", f"import {module}"], cwd=here, check=True,
+                           env=dict(os.environ, QT_QPA_PLATFORM="offscreen"), capture_output=True)
+        try:
+            results.append(measure(name, cold_import, repeat=repeat))
+        except subprocess.CalledProcessError as e:
+            print(f"{name} skipped: {e.stderr.decode(errors='replace').strip().splitlines()[-1:]}")
+    return results
+
+def run_gui(arch: bfz.BFZArchive, repeat: int) -> List[BenchResult]:
+    """populate_tree with Qt offscreen. Skipped when PySide6 isn't there."""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    try:
+        from PySide6.QtWidgets import QApplication, QTreeView
+        from utilities import archiveModel
+    except ImportError as e:
+        print(f"populate_tree skipped: {e}")
+        return []
+    app = QApplication.instance() or QApplication([])
+    model = archiveModel.ArchiveTreeModel()
+    tree = QTreeView(); tree.setModel(model); tree.setUniformRowHeights(True); tree.resize(800, 600)
+
+    def populate():
+        # Same steps as ZombiManager.populate_tree
+        model.set_archive(arch)
+        tree.expandToDepth(2 if len(model.index_.paths) <= 20000 else 0)
+        app.processEvents()
+    result = measure("populate_tree", populate, items=len(arch.names), repeat=repeat)
+    model.clear()
+    return [result]
+
+# ----------------- Comparing -----------------
+
+def compare(results: Dict, baseline: Dict, threshold: float, min_delta: float = 0.01) -> List[str]:
+    """Steps that got slower than baseline by more than threshold (0.2 = 20%) and min_delta seconds."""
+    old = {r["name"]: r for r in baseline.get("results", [])}
+    slower = []
+    for r in results["results"]:
+        b = old.get(r["name"])
+        if not b or not b["seconds"]:
+            continue
+        ratio = r["seconds"] / b["seconds"]
+        # Millisecond steps jitter by more than any sane threshold
+        if ratio > 1 + threshold and r["seconds"] - b["seconds"] >= min_delta:
+            slower.append(f"{r['name']}: {b['seconds']:.3f}s -> {r['seconds']:.3f}s ({ratio - 1:+.0%})")
+    return slower
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+# ----------------- Main -----------------
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="zombiBench", description="Benchmarks on a synthetic .bfz")
+    parser.add_argument("--archive", default=None, help="benchmark this .bfz instead of generating one")
+    parser.add_argument("--files", type=int, default=5000, help="entries in the generated archive")
+    parser.add_argument("--max-size", type=int, default=256 * 1024, help="largest generated payload")
+    parser.add_argument("--chunk-size", type=int, default=synthBfz.DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per step, the best one counts")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker threads/processes (default: cores)")
+    parser.add_argument("--no-gui", action="store_true", help="skip populate_tree")
+    parser.add_argument("-o", "--output", default=None, help="write results JSON here")
+    parser.add_argument("--compare", default=None, help="baseline results JSON")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown vs the baseline")
+    parser.add_argument("--trace", default=None, metavar="JSON", help="also record a Chrome trace of the suite")
+    return parser
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    # Keep the index cache out of the user's real one
+    cache_dir = tempfile.mkdtemp(prefix="zombi-bench-cache-")
+    os.environ["ZOMBI_CACHE_DIR"] = cache_dir
+    workdir = None
+    try:
+        spec = None
+        archive = args.archive
+        if archive is None:
+            workdir = tempfile.mkdtemp(prefix="zombi-bench-")
+            archive = os.path.join(workdir, "synthetic.bfz")
+            spec = synthBfz.SynthSpec(files=args.files, max_size=args.max_size, chunk_size=args.chunk_size, seed=args.seed)
+            t = time.perf_counter()
+            p = synthBfz.write_synthetic_bfz(archive, spec, workers=args.jobs)
+            print(f"generated {archive}: {len(p.names)} files, {p.stream_size:,} bytes "
+                  f"({time.perf_counter() - t:.1f}s)")
+        if args.trace:
+            tracing.enable()
+        results = run_suite(archive, args.jobs, args.repeat, gui=not args.no_gui)
+        if args.trace:
+            tracing.disable(); tracing.write_trace(args.trace)
+        report = dict(
+            revision=_git_revision(),
+            python=platform.python_version(),
+            platform=platform.platform(),
+            cpus=os.cpu_count(),
+            archive=args.archive,
+            spec=asdict(spec) if spec else None,
+            results=[dict(asdict(r), mb_per_s=r.mb_per_s, items_per_s=r.items_per_s) for r in results],
+        )
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as w:
+                json.dump(report, w, indent=2)
+        if args.compare:
+            with open(args.compare, encoding="utf-8") as f:
+                slower = compare(report, json.load(f), args.threshold)
+            for line in slower:
+                print(f"REGRESSION {line}")
+            return 1 if slower else 0
+        return 0
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,503 @@
+from __future__ import annotations
+import argparse
+import fnmatch
+import json
+import os
+import sys
+import traceback
+from typing import Dict, Iterable, List, Optional
+
+# ----------------- Utilities -----------------
+# Nothing in here may import Qt, this runs on headless build boxes
+from utilities import archiveMount
+from utilities import assetIndex
+from utilities import bfz
+from utilities import bfzWriter
+from utilities import contentHash
+from utilities import contentSearch
+from utilities import exporter
+from utilities import formats
+from utilities import parallelDecompress
+from utilities import synthBfz
+from utilities import tracing
+
+# ----------------- Inputs -----------------
+
+def find_archives(inputs: Iterable[str]) -> List[str]:
+    """Expand files and directories (e.g. the game's Data folder) into .bfz paths."""
+    found = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for root, _dirs, files in os.walk(path):
+                found.extend(os.path.join(root, n) for n in sorted(files) if n.lower().endswith(".bfz"))
+        else:
+            found.append(path)
+    return found
+
+def normalize_name(name: str) -> str:
+    return name.replace("\\", "/").strip("/")
+
+def matches(name: str, include: List[str], exclude: List[str]) -> bool:
+    """Case-insensitive glob filter on the normalized entry name."""
+    n = normalize_name(name).lower()
+    if include and not any(fnmatch.fnmatchcase(n, p.lower()) for p in include):
+        return False
+    return not any(fnmatch.fnmatchcase(n, p.lower()) for p in exclude)
+
+def selected_entries(arch: bfz.BFZArchive, opts: Dict) -> List[bfz.BFZFileEntry]:
+    return [e for e in arch.file_entries if matches(e.name, opts["include"], opts["exclude"])]
+
+# ----------------- Commands -----------------
+# Each runs on one archive in a worker process and returns a JSON-able dict
+
+def cmd_list(path: str, opts: Dict) -> Dict:
+    arch = bfz.BFZArchive(path)
+    arch.parse(lazy=True)
+    # Sniffed types once the GUI or an extract has seen the contents, extensions until then
+    types = formats.sniff_archive(arch)
+    entries = [dict(name=e.name, offset=e.offset, size=e.size,
+                    type=formats.type_label(formats.FORMATS[types[e.index]], e.name))
+               for e in selected_entries(arch, opts)]
+    arch.close()
+    return dict(entries=entries)
+
+def cmd_extract(path: str, opts: Dict) -> Dict:
+    arch = bfz.BFZArchive(path, workers=opts["workers"])
+    # Pulling a few files out of a big archive shouldn't decompress all of it
+    lazy = bool(opts["include"] or opts["exclude"]) or bool(opts["format"])
+    arch.parse(lazy=lazy)
+    entries = selected_entries(arch, opts)
+    out_root = os.path.join(opts["output"], os.path.splitext(os.path.basename(path))[0])
+    if opts["format"]:
+        # One file per archive, streamed: only a few chunks in memory at a time
+        from utilities import streamExport
+        out_path = f"{out_root}.{opts['format']}"
+        os.makedirs(opts["output"], exist_ok=True)
+        result = streamExport.export_stream(arch, out_path, entries, fmt=opts["format"],
+                                            dedupe=opts["dedupe"] != "none", workers=opts["workers"])
+        arch.close()
+        return dict(output=out_path, files=len(entries),
+                    bytes=result.bytes_written, converted=0, duplicates=result.linked + result.manifest,
+                    errors=result.errors)
+    result = exporter.export_entries(
+        arch, out_root, entries,
+        convert=opts["convert"],
+        dedupe=None if opts["dedupe"] == "none" else opts["dedupe"],
+        workers=opts["workers"],
+    )
+    arch.close()
+    return dict(output=out_root, files=len(entries), bytes=result.bytes_written,
+                converted=result.converted, duplicates=result.linked + result.manifest,
+                errors=result.errors)
+
+def cmd_verify(path: str, opts: Dict) -> Dict:
+    errors = []
+    arch = bfz.BFZArchive(path, workers=opts["workers"], use_index_cache=False)
+    try:
+        arch.parse()
+    except Exception as e:
+        return dict(ok=False, errors=[f"parse: {e}"])
+    file_size = os.path.getsize(path)
+    for i in range(len(arch.chunks)):
+        c = arch.chunk(i)
+        if c.offset + c.zsize > file_size:
+            errors.append(f"chunk {i}: compressed data past end of file")
+    for entry in arch.file_entries:
+        if entry.offset + entry.size > arch.data_size:
+            errors.append(f"{entry.name}: references bytes beyond the decompressed data")
+    return dict(ok=not errors, errors=errors)
+
+def cmd_stat(path: str, opts: Dict) -> Dict:
+    arch = bfz.BFZArchive(path)
+    arch.parse(lazy=True)
+    exts: Dict[str, int] = {}
+    for name in arch.names:
+        ext = os.path.splitext(name)[1].lower() or "-"
+        exts[ext] = exts.get(ext, 0) + 1
+    kinds: Dict[str, int] = {}
+    for name, code in zip(arch.names, formats.sniff_archive(arch).tolist()):
+        kind = formats.type_label(formats.FORMATS[code], name)
+        kinds[kind] = kinds.get(kind, 0) + 1
+    compressed = int(arch.chunks["zsize"].sum())
+    arch.close()
+    return dict(
+        files=len(arch.names),
+        chunks=len(arch.chunks),
+        file_size=os.path.getsize(path),
+        decompressed_size=arch.data_size,
+        compressed_size=compressed,
+        ratio=(compressed / arch.data_size) if arch.data_size else 0.0,
+        extensions=dict(sorted(exts.items())),
+        types=dict(sorted(kinds.items())),
+    )
+
+def cmd_hash(path: str, opts: Dict) -> Dict:
+    arch = bfz.BFZArchive(path, workers=opts["workers"])
+    arch.parse(lazy=True)
+    if arch.hashes is None:
+        # Not in the index cache yet: whole archive, decompress it in one go
+        arch.parse()
+    hashes = contentHash.hash_archive(arch, workers=opts["workers"])
+    keep = {e.index for e in selected_entries(arch, opts)}
+    entries = [dict(name=name, offset=off, size=size, hash=h)
+               for i, (_a, name, off, size, h) in enumerate(contentHash.archive_rows(path, arch, hashes)) if i in keep]
+    arch.close()
+    return dict(entries=entries)
+
+COMMANDS = {
+    "list": cmd_list,
+    "extract": cmd_extract,
+    "verify": cmd_verify,
+    "stat": cmd_stat,
+    "hash": cmd_hash,
+}
+
+def _run_job(command: str, path: str, opts: Dict) -> Dict:
+    result = dict(archive=path)
+    try:
+        result.update(COMMANDS[command](path, opts))
+    except Exception as e:
+        result.update(error=str(e), traceback=traceback.format_exc())
+    return result
+
+# ----------------- Output -----------------
+
+def print_human(command: str, result: Dict, out=sys.stdout):
+    path = result["archive"]
+    if "error" in result:
+        print(f"{path}: ERROR {result['error']}", file=out)
+        return
+    if command == "list":
+        for e in result["entries"]:
+            print(f"{path}\t{e['name']}\t{e['size']}\t0x{e['offset']:x}\t{e['type']}", file=out)
+    elif command == "extract":
+        print(f"{path}: {result['files']} files ({result['converted']} converted, "
+              f"{result['duplicates']} duplicates), {result['bytes']:,} bytes -> {result['output']}", file=out)
+        for err in result["errors"]:
+            print(f"  {err}", file=out)
+    elif command == "verify":
+        print(f"{path}: {'OK' if result['ok'] else 'FAILED'}", file=out)
+        for err in result["errors"]:
+            print(f"  {err}", file=out)
+    elif command == "hash":
+        for e in result["entries"]:
+            print(f"{e['hash']}\t{path}\t{e['name']}\t{e['size']}", file=out)
+    elif command == "stat":
+        print(f"{path}: {result['files']} files, {result['chunks']} chunks, "
+              f"{result['decompressed_size']:,} bytes unpacked, "
+              f"{result['compressed_size']:,} packed ({result['ratio']:.1%})", file=out)
+        print("  " + ", ".join(f"{kind} {n}" for kind, n in result["types"].items()), file=out)
+
+# ----------------- Main -----------------
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="zombiCli", description="Headless tools for ZOMBI .bfz archives")
+    parser.add_argument("--trace", default=None, metavar="JSON",
+                        help="record a Chrome trace (chrome://tracing) of this run")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, help_ in (("list", "list entries"), ("extract", "extract entries"),
+                        ("verify", "decompress and check archives"), ("stat", "archive statistics"),
+                        ("hash", "content hash (BLAKE2b-128) of every entry")):
+        p = sub.add_parser(name, help=help_)
+        p.add_argument("inputs", nargs="+", help=".bfz files or folders to scan for them")
+        p.add_argument("-i", "--include", action="append", default=[], help="glob on entry names (repeatable)")
+        p.add_argument("-x", "--exclude", action="append", default=[], help="glob on entry names to skip (repeatable)")
+        p.add_argument("-j", "--jobs", type=int, default=None, help="archives processed in parallel (default: cores)")
+        p.add_argument("--json", action="store_true", help="machine-readable output")
+        if name == "extract":
+            p.add_argument("-o", "--output", required=True, help="output directory")
+            p.add_argument("--convert", action="store_true", help="write .son as .wav and .tdt as .png")
+            p.add_argument("--dedupe", choices=("offset", "hash", "none"), default="offset",
+                           help="write identical payloads once and hardlink the rest")
+            p.add_argument("--format", choices=("tar", "tar.gz", "tar.zst", "zip"), default=None,
+                           help="write each archive as one <output>/<name>.<format> instead of loose files (no --convert)")
+
+    # Global asset database over a whole Data folder
+    p = sub.add_parser("index", help="build/update the global asset database for a Data folder")
+    p.add_argument("data_dir")
+    p.add_argument("--db", default=None, help="database path (default: in the cache folder)")
+    p.add_argument("--descriptors", default=assetIndex.DEFAULT_DESCRIPTORS, help="'Wor Descriptors.txt' path")
+    p.add_argument("--no-hash", action="store_true", help="skip content hashes (no decompression)")
+    p.add_argument("-j", "--jobs", type=int, default=None)
+    p.add_argument("--json", action="store_true")
+    p = sub.add_parser("find", help="search the global asset database by entry name")
+    p.add_argument("query", help="substring, or glob with * and ?")
+    p.add_argument("--db", default=None)
+    p.add_argument("--limit", type=int, default=1000)
+    p.add_argument("--json", action="store_true")
+
+    p = sub.add_parser("dupes", help="report payloads stored more than once, within and across archives")
+    p.add_argument("inputs", nargs="*", help=".bfz files or folders (default: everything in the asset database)")
+    p.add_argument("--db", default=None, help="asset database to read when no inputs are given")
+    p.add_argument("--min-size", type=int, default=1, help="ignore payloads smaller than this")
+    p.add_argument("--top", type=int, default=50, help="groups listed in the text report")
+    p.add_argument("-j", "--jobs", type=int, default=None)
+    p.add_argument("--json", action="store_true")
+
+    # Rebuild an archive with entries replaced from a folder
+    p = sub.add_parser("pack", help="write a .bfz from a base archive with entries replaced from a folder")
+    p.add_argument("base", help="archive providing the tables and untouched entries")
+    p.add_argument("folder", help="replacement files, laid out like extract writes them")
+    p.add_argument("-o", "--output", required=True, help="new .bfz (may be the base itself)")
+    p.add_argument("--level", type=int, default=bfzWriter.DEFAULT_LEVEL, help="lzo level, 1 (fast) or 9 (small)")
+    p.add_argument("--incremental", action="store_true",
+                   help="only recompress the chunks that changed, everything else stays byte-identical")
+    p.add_argument("-j", "--jobs", type=int, default=None, help="compression processes (default: cores)")
+    p.add_argument("--json", action="store_true")
+
+    # Search inside the entries
+    p = sub.add_parser("grep", help="search entry contents for a string, hex bytes, regex or wor ID")
+    p.add_argument("pattern", help="UTF-8/UTF-16 text by default")
+    p.add_argument("inputs", nargs="+", help=".bfz files or folders to scan for them")
+    mode = p.add_mutually_exclusive_group()
+    mode.add_argument("--hex", dest="mode", action="store_const", const="hex", help="pattern is hex bytes")
+    mode.add_argument("--regex", dest="mode", action="store_const", const="regex", help="pattern is a regex")
+    mode.add_argument("--wor", dest="mode", action="store_const", const="wor",
+                      help="pattern is a wor ID, or part of a source path from 'Wor Descriptors.txt'")
+    p.add_argument("-i", "--ignore-case", action="store_true")
+    p.add_argument("--max-hits", type=int, default=contentSearch.DEFAULT_MAX_HITS, help="per archive")
+    p.add_argument("-j", "--jobs", type=int, default=None, help="search processes (default: cores)")
+    p.add_argument("--json", action="store_true")
+
+    # Several archives as one namespace (see archiveMount)
+    p = sub.add_parser("overlay", help="mount several archives as one namespace, later ones override earlier ones")
+    p.add_argument("inputs", nargs="+", help=".bfz files or folders, lowest priority first")
+    p.add_argument("--kits-first", action="store_true", help="put _kit_ wors under everything else (Wor Descriptors.txt)")
+    p.add_argument("--first-wins", action="store_true", help="earlier archives override later ones instead")
+    p.add_argument("--overridden", action="store_true", help="only list paths found in more than one archive")
+    p.add_argument("-i", "--include", action="append", default=[], help="glob on entry names (repeatable)")
+    p.add_argument("-x", "--exclude", action="append", default=[], help="glob on entry names to skip (repeatable)")
+    p.add_argument("-o", "--output", default=None, help="extract the merged tree here instead of listing it")
+    p.add_argument("--convert", action="store_true", help="write .son as .wav and .tdt as .png")
+    p.add_argument("-j", "--jobs", type=int, default=None, help="worker threads (default: cores)")
+    p.add_argument("--json", action="store_true")
+
+    # Made-up archive for benchmarks (see zombiBench)
+    p = sub.add_parser("synth", help="write a synthetic .bfz with generated .tdt/.son/.bin entries")
+    p.add_argument("output")
+    p.add_argument("--files", type=int, default=1000)
+    p.add_argument("--min-size", type=int, default=256)
+    p.add_argument("--max-size", type=int, default=256 * 1024)
+    p.add_argument("--chunk-size", type=int, default=synthBfz.DEFAULT_CHUNK_SIZE)
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("-j", "--jobs", type=int, default=None, help="compression processes (default: cores)")
+    return parser
+
+def run_index(args) -> int:
+    stats = assetIndex.build_index(
+        args.data_dir, args.db, args.descriptors,
+        hash_contents=not args.no_hash, jobs=args.jobs,
+    )
+    if args.json:
+        json.dump(stats, sys.stdout, indent=2); print()
+    else:
+        print(f"{stats['archives']} archives, {stats['updated']} (re)indexed, "
+              f"{stats['removed']} removed, {stats['errors']} errors")
+    return 1 if stats["errors"] else 0
+
+def run_find(args) -> int:
+    hits = assetIndex.search(args.query, args.db, limit=args.limit)
+    if args.json:
+        json.dump([h.__dict__ for h in hits], sys.stdout, indent=2); print()
+    else:
+        for h in hits:
+            src = f"\t{h.source_path}" if h.source_path else ""
+            print(f"{h.archive}\t{h.name}\t{h.size}{src}")
+    return 0 if hits else 1
+
+def run_dupes(args) -> int:
+    if args.inputs:
+        archives = find_archives(args.inputs)
+        cores = os.cpu_count() or 1
+        jobs = max(1, min(args.jobs or cores, len(archives) or 1))
+        opts = dict(include=[], exclude=[], workers=max(1, cores // jobs))
+        rows: List[contentHash.HashRow] = []
+        with parallelDecompress.process_pool(jobs) as pool:
+            for r in pool.map(_run_job, ["hash"] * len(archives), archives, [opts] * len(archives)):
+                if "error" in r:
+                    print(f"{r['archive']}: ERROR {r['error']}", file=sys.stderr); continue
+                rows.extend((r["archive"], e["name"], e["offset"], e["size"], e["hash"]) for e in r["entries"])
+    else:
+        rows = assetIndex.duplicate_rows(args.db)
+    groups = contentHash.duplicate_groups(rows, min_size=args.min_size)
+    if args.json:
+        json.dump(dict(summary=contentHash.summarize(groups),
+                       groups=[dict(hash=g.digest, size=g.size, copies=g.copies, wasted=g.wasted,
+                                    members=[dict(archive=a, name=n) for a, n in g.members]) for g in groups]),
+                  sys.stdout, indent=2)
+        print()
+    else:
+        print(contentHash.format_report(groups, top=args.top))
+    return 0
+
+def run_pack(args) -> int:
+    result = bfzWriter.build_bfz_from_folder(
+        args.base, args.folder, args.output, level=args.level, workers=args.jobs,
+        incremental=args.incremental,
+    )
+    if args.json:
+        json.dump(result.__dict__, sys.stdout, indent=2); print()
+    else:
+        copied = f" ({result.chunks_copied} copied as is)" if args.incremental else ""
+        print(f"{args.output}: {result.replaced} entries replaced, {result.chunks} chunks compressed{copied}, "
+              f"{result.bytes_written:,} bytes")
+        for name in result.skipped:
+            print(f"  skipped (no such entry): {name}")
+    return 0
+
+def run_grep(args) -> int:
+    try:
+        query = contentSearch.build_query(args.pattern, args.mode or "text", args.ignore_case)
+    except ValueError as e:
+        print(e, file=sys.stderr); return 2
+    archives = find_archives(args.inputs)
+    results, matched, failed = [], 0, False
+    for path in archives:
+        try:
+            arch = bfz.BFZArchive(path, workers=args.jobs)
+            # Lazy: the search decompresses its own chunk ranges
+            arch.parse(lazy=True)
+            try:
+                by_entry = contentSearch.search_entries(arch, query, workers=args.jobs, max_hits=args.max_hits)
+            finally:
+                arch.close()
+        except Exception as e:
+            print(f"{path}: ERROR {e}", file=sys.stderr); failed = True; continue
+        for entry, hits in sorted(by_entry.items(), key=lambda kv: arch.names[kv[0]]):
+            matched += 1
+            if args.json:
+                results.append(dict(archive=path, name=arch.names[entry], offsets=[h.offset for h in hits]))
+            else:
+                shown = ", ".join(f"0x{h.offset:X}" for h in hits[:8]) + (", …" if len(hits) > 8 else "")
+                print(f"{path}: {arch.names[entry]} ({len(hits)} hits at {shown})")
+    if args.json:
+        json.dump(results, sys.stdout, indent=2); print()
+    return 1 if failed or not matched else 0
+
+def run_overlay(args) -> int:
+    archives = find_archives(args.inputs)
+    if args.kits_first:
+        archives = archiveMount.kits_first(archives)
+    if args.first_wins:
+        archives.reverse()
+    mount = archiveMount.ArchiveMount(workers=args.jobs)
+    try:
+        mount.mount_all(archives)
+    except Exception as e:
+        print(f"ERROR {e}", file=sys.stderr); mount.close(); return 1
+    try:
+        entries = [e for e in mount.file_entries if matches(e.name, args.include, args.exclude)]
+        if args.overridden:
+            shadowed = mount.overridden()
+            entries = [e for e in entries if shadowed[e.index]]
+        if args.output:
+            result = exporter.export_entries(mount, args.output, entries, convert=args.convert, workers=args.jobs)
+            summary = dict(output=args.output, files=len(entries), bytes=result.bytes_written,
+                           converted=result.converted, errors=result.errors)
+            if args.json:
+                json.dump(summary, sys.stdout, indent=2); print()
+            else:
+                print(f"{len(archives)} archives: {len(entries)} files ({result.converted} converted), "
+                      f"{result.bytes_written:,} bytes -> {args.output}")
+                for err in result.errors:
+                    print(f"  {err}")
+            return 1 if result.errors else 0
+        rows = []
+        for e in entries:
+            prov = mount.provenance(e.index)
+            rows.append(dict(name=e.name, size=e.size,
+                             type=formats.type_label(formats.FORMATS[mount.types[e.index]], e.name),
+                             archive=prov[0][0].path, overrides=[mp.path for mp, _ in prov[1:]]))
+        if args.json:
+            json.dump(rows, sys.stdout, indent=2); print()
+        else:
+            for r in rows:
+                over = f"\toverrides {', '.join(os.path.basename(p) for p in r['overrides'])}" if r["overrides"] else ""
+                print(f"{r['name']}\t{r['size']}\t{r['type']}\t{os.path.basename(r['archive'])}{over}")
+        return 0
+    finally:
+        mount.close()
+
+def run_synth(args) -> int:
+    spec = synthBfz.SynthSpec(files=args.files, min_size=args.min_size, max_size=args.max_size,
+                              chunk_size=args.chunk_size, seed=args.seed)
+    p = synthBfz.write_synthetic_bfz(args.output, spec, workers=args.jobs)
+    print(f"{args.output}: {len(p.names)} files, {p.stream_size:,} bytes unpacked, "
+          f"{os.path.getsize(args.output):,} packed")
+    return 0
+
+def run_traced(args) -> int:
+    if not args.trace:
+        return run(args)
+    tracing.enable()
+    try:
+        with tracing.span(args.command, "cli"):
+            return run(args)
+    finally:
+        tracing.disable()
+        print(f"Trace written: {args.trace} ({tracing.write_trace(args.trace):,} events)", file=sys.stderr)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        return run_traced(args)
+    except BrokenPipeError:
+        # Piped into head or the like, which stopped reading: not an error. Whatever
+        # is still buffered goes to devnull, or the flush at exit fails all over again.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+
+def run(args) -> int:
+    if args.command == "index":
+        return run_index(args)
+    if args.command == "find":
+        return run_find(args)
+    if args.command == "pack":
+        return run_pack(args)
+    if args.command == "dupes":
+        return run_dupes(args)
+    if args.command == "synth":
+        return run_synth(args)
+    if args.command == "grep":
+        return run_grep(args)
+    if args.command == "overlay":
+        return run_overlay(args)
+    archives = find_archives(args.inputs)
+    if not archives:
+        print("No .bfz archives found", file=sys.stderr)
+        return 1
+
+    cores = os.cpu_count() or 1
+    jobs = max(1, min(args.jobs or cores, len(archives)))
+    opts = dict(
+        include=args.include,
+        exclude=args.exclude,
+        output=getattr(args, "output", None),
+        convert=getattr(args, "convert", False),
+        dedupe=getattr(args, "dedupe", "offset"),
+        format=getattr(args, "format", None),
+        # Split the cores between archives so nested decompression doesn't oversubscribe
+        workers=max(1, cores // jobs),
+    )
+
+    results = []
+    if jobs == 1:
+        results = [_run_job(args.command, path, opts) for path in archives]
+        if not args.json:
+            for r in results: print_human(args.command, r)
+    else:
+        with parallelDecompress.process_pool(jobs) as pool:
+            futures = [pool.submit(_run_job, args.command, path, opts) for path in archives]
+            for fut in futures:
+                r = fut.result()
+                results.append(r)
+                if not args.json: print_human(args.command, r)
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    failed = any("error" in r or (args.command == "verify" and not r["ok"]) for r in results)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,25 +2,80 @@ from __future__ import annotations
 import os
 import sys
 import traceback
-import tempfile
 
-from typing import Optional, Dict
+from typing import TYPE_CHECKING, Optional
 
-from PySide6.QtCore import Qt, QSize, QUrl
+import numpy as np
+
+from PySide6.QtCore import Qt, QSize, QUrl, QModelIndex, QTimer, QBuffer, QByteArray, QIODevice, QLineF
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-    QTreeWidget, QTreeWidgetItem, QFileDialog, QPushButton, QMessageBox,
-    QMenuBar, QStatusBar, QProgressDialog, QLabel, QTextEdit, QSplitter, QMenu,
+    QTreeView, QFileDialog, QPushButton, QMessageBox, QLineEdit,
+    QMenuBar, QStatusBar, QProgressDialog, QProgressBar, QLabel, QTextEdit, QSplitter, QMenu,
 )
-from PySide6.QtGui import QAction, QPixmap, QImage, QPalette, QColor
-from PySide6.QtMultimedia import QMediaPlayer, QAudioOutput
+from PySide6.QtGui import QAction, QPixmap, QPalette, QColor, QPainter, QPen
 
 # ----------------- Utilities -----------------
+# QtMultimedia, PIL and the texture/tar tools are imported on first use, they
+# would otherwise make up a good part of the startup time
+from utilities import archiveLoader
+from utilities import archiveModel
+from utilities import archiveMount
+from utilities import assetIndex
 from utilities import bfz
+from utilities import bfzWriter
+from utilities import contentHash
+from utilities import contentSearchDialog
+from utilities import exporter
+from utilities import formats
+from utilities import globalSearch
+from utilities import hexView
+from utilities import mountDialog
+from utilities import previewCache
 from utilities import previewers
-from utilities import textureFile
+from utilities import tracing
+
+if TYPE_CHECKING:
+    from utilities import textureGrid
 # ----------------- Main UI -----------------
 
+class WaveformView(QWidget):
+    """Min/max envelope of a sound with the playback position on top."""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setFixedHeight(90)
+        self.envelope = None
+        self.position = 0.0  # 0..1
+
+    def set_envelope(self, envelope):
+        self.envelope, self.position = envelope, 0.0
+        self.setVisible(envelope is not None)
+        self.update()
+
+    def set_position(self, position: float):
+        self.position = position
+        self.update()
+
+    def paintEvent(self, event):
+        p = QPainter(self)
+        p.fillRect(self.rect(), QColor(30, 30, 30))
+        env = self.envelope
+        if env is not None and len(env):
+            w, h = self.width(), self.height()
+            mid = h / 2
+            # One vertical line per pixel column, from the buckets that fall in it
+            cols = min(w, len(env))
+            edges = (np.arange(cols + 1) * len(env)) // cols
+            lo = np.minimum.reduceat(env[:, 0], edges[:-1])
+            hi = np.maximum.reduceat(env[:, 1], edges[:-1])
+            xs = np.arange(cols) * (w / cols)
+            p.setPen(QPen(QColor(120, 180, 240)))
+            p.drawLines([QLineF(x, mid - a * mid, x, mid - b * mid) for x, a, b in zip(xs.tolist(), lo.tolist(), hi.tolist())])
+            p.setPen(QPen(QColor(240, 200, 80)))
+            x = self.position * w
+            p.drawLine(QLineF(x, 0, x, h))
+        p.end()
+
 class PreviewPane(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -30,79 +85,121 @@ class PreviewPane(QWidget):
         self.image_label = QLabel()
         self.image_label.setFixedSize(400, 400)
         self.image_label.setScaledContents(True)
+        self.waveform = WaveformView(); self.waveform.hide()
         self.meta = QTextEdit()
         self.meta.setReadOnly(True)
-        self.meta.setFixedHeight(140)
+        self.meta.setFixedHeight(70)
+
+        # Raw bytes of whatever is selected, paged from the entry's memoryview
+        self.hex_view = hexView.HexView()
+        self.offset_edit = QLineEdit(); self.offset_edit.setPlaceholderText("Go to offset (hex)")
+        self.offset_edit.returnPressed.connect(self.on_goto_offset)
+        self.find_edit = QLineEdit(); self.find_edit.setPlaceholderText('Find bytes: DE AD BE EF or "text"')
+        self.find_edit.returnPressed.connect(self.on_find_next)
+        find_btn = QPushButton("Find Next"); find_btn.clicked.connect(self.on_find_next)
+        self.hex_status = QLabel("")
+        self.hex_view.offsetChanged.connect(lambda off: self.hex_status.setText(f"0x{off:X}"))
+        hex_bar = QHBoxLayout(); hex_bar.addWidget(self.offset_edit); hex_bar.addWidget(self.find_edit, 1)
+        hex_bar.addWidget(find_btn); hex_bar.addWidget(self.hex_status)
 
         self.play_btn, self.pause_btn = QPushButton("Play"), QPushButton("Pause")
         self.play_btn.setEnabled(False)
         self.pause_btn.setEnabled(False)
         self.play_btn.clicked.connect(lambda: self.player.play())
         self.pause_btn.clicked.connect(lambda: self.player.pause())
+        # Made for the first sound, see _ensure_player
         h = QHBoxLayout(); h.addWidget(self.play_btn); h.addWidget(self.pause_btn); h.addStretch(1)
 
         v.addWidget(self.title)
         v.addWidget(self.image_label, 1)
+        v.addWidget(self.waveform)
         v.addLayout(h)
         v.addWidget(self.meta)
+        v.addLayout(hex_bar)
+        v.addWidget(self.hex_view, 1)
+
+        self.player = None
+        self.audio_output = None
+        # Sounds play straight from memory, no temp files
+        self.audio_buffer: Optional[QBuffer] = None
 
+    def _ensure_player(self):
+        if self.player is not None:
+            return
+        from PySide6.QtMultimedia import QMediaPlayer, QAudioOutput
         self.player = QMediaPlayer(self)
         self.audio_output = QAudioOutput(self)
         self.player.setAudioOutput(self.audio_output)
-        self.current_temp_audio = None
+        self.player.positionChanged.connect(self.on_position)
 
     def clear(self):
         self.title.setText("No file selected")
-        self.image_label.clear()
+        self.image_label.clear(); self.image_label.hide()
+        self.hex_view.clear(); self.hex_status.clear()
+        self.waveform.set_envelope(None)
         self.meta.clear()
         self.play_btn.setEnabled(False)
         self.pause_btn.setEnabled(False)
-        if self.current_temp_audio:
-            try: os.unlink(self.current_temp_audio)
-            except Exception: pass
-            self.current_temp_audio = None
-        self.player.stop()
+        if self.player is not None:
+            self.player.stop()
+        if self.audio_buffer is not None:
+            self.player.setSource(QUrl())
+            self.audio_buffer.close(); self.audio_buffer = None
 
-    def preview_bytes(self, name: str, data: bytes):
-        self.clear()
-        self.title.setText(name)
-        lower = name.lower()
-        if lower.endswith(".son"):
-            wav = previewers.extract_wav_from_son(data)
-            if wav:
-                meta = previewers.get_wav_metadata(wav)
-                txt = (f"WAV embedded: {meta['channels']} ch, {meta['sample_rate']} Hz, "
-                       f"{meta['sampwidth']*8} bit, {meta['duration']:.2f}s\n"
-                       f"Size: {len(wav)} bytes") if meta else f"Embedded WAV ({len(wav)} bytes)"
-                self.meta.setPlainText(txt)
-                tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".wav")
-                tmp.write(wav); tmp.close()
-                self.current_temp_audio = tmp.name
-                self.player.setSource(QUrl.fromLocalFile(tmp.name))
-                self.play_btn.setEnabled(True); self.pause_btn.setEnabled(True)
-                return
-            self.meta.setPlainText("No RIFF/WAVE found inside .son\n\n" + bytes_preview(data))
-            return
-        elif lower.endswith(".tdt"):
-            try:
-                img = textureFile.decode_tdt(data)
-                if img:
-                    pix = QPixmap.fromImage(QImage(img))
-                    self.image_label.setPixmap(pix)
-                    self.meta.setPlainText(f"TDT decoded: {img.width}x{img.height}")
-                else:
-                    self.meta.setPlainText("Unsupported or failed TDT decode.\n\n" + bytes_preview(data))
-            except Exception as e:
-                self.meta.setPlainText(f"Failed to parse TDT:\n{e}\n\n" + bytes_preview(data))
-            return
+    def on_position(self, ms: int):
+        duration = self.player.duration()
+        if duration > 0: self.waveform.set_position(ms / duration)
 
-        self.meta.setPlainText(f"Generic file ({len(data)} bytes)\n\n" + bytes_preview(data))
+    def on_goto_offset(self):
+        try:
+            self.hex_view.goto(int(self.offset_edit.text().strip(), 16))
+        except ValueError as e:
+            self.hex_status.setText(str(e) if "outside" in str(e) else "Bad offset")
 
-def bytes_preview(data: bytes, n: int = 256) -> str:
-    s = data[:n]
-    hexs = ' '.join(f"{b:02x}" for b in s)
-    ascii_rep = ''.join((chr(b) if 32 <= b < 127 else '.') for b in s)
-    return f"Hex (first {min(len(data), n)} bytes):\n{hexs}\n\nASCII:\n{ascii_rep}"
+    def on_find_next(self):
+        try:
+            pattern = hexView.parse_pattern(self.find_edit.text())
+        except ValueError as e:
+            self.hex_status.setText(str(e)); return
+        if self.hex_view.find_next(pattern) < 0:
+            self.hex_status.setText("Not found")
+
+    def preview_bytes(self, name: str, data: previewers.BytesLike):
+        with tracing.span("preview_bytes", "preview", name=name, size=len(data)):
+            self.show_preview(name, previewCache.build_preview(name, data), data)
+
+    @tracing.traced("show_preview", "preview")
+    def show_preview(self, name: str, preview: previewCache.Preview, data: Optional[previewers.BytesLike] = None):
+        self.clear()
+        self.title.setText(name)
+        self.meta.setPlainText(preview.text)
+        self.hex_view.set_data(data)
+        if preview.image is not None:
+            if preview.pixmap is None:
+                preview.pixmap = QPixmap.fromImage(preview.image)
+            self.image_label.setPixmap(preview.pixmap); self.image_label.show()
+        if preview.wav is not None:
+            self._ensure_player()
+            self.waveform.set_envelope(preview.envelope)
+            self.audio_buffer = QBuffer(self)
+            self.audio_buffer.setData(QByteArray(preview.wav))
+            self.audio_buffer.open(QIODevice.ReadOnly)
+            # The URL is only a hint for the format
+            self.player.setSourceDevice(self.audio_buffer, QUrl("memory.wav"))
+            self.play_btn.setEnabled(True); self.pause_btn.setEnabled(True)
+
+def qt_progress(dialog: QProgressDialog) -> bfz.ProgressCallback:
+    """Adapt a QProgressDialog to the bfz progress callback."""
+    def callback(done: int, total: int, label: str):
+        if dialog.labelText() != label:
+            dialog.setLabelText(label)
+        if dialog.maximum() != total:
+            dialog.setRange(0, total)
+        dialog.setValue(done)
+        QApplication.processEvents()
+        if dialog.wasCanceled():
+            raise bfz.OperationCanceled()
+    return callback
 
 # ----------------- Main Window -----------------
 
@@ -112,25 +209,45 @@ class ZombiManager(QMainWindow):
         self.setWindowTitle("ZOMBI Manager")
         self.setMinimumSize(QSize(1000, 700))
         self._apply_gray_theme()
-        self.archive: Optional[bfz.BFZArchive] = None
+        # A single archive, or several merged into one (see archiveMount)
+        self.archive: Optional[bfz.BFZArchive | archiveMount.ArchiveMount] = None
+        # Decompressed chunks kept in memory when loading on demand, one budget for every open archive
+        self.chunk_cache = bfz.shared_chunk_cache()
+        # LZO decompression threads, None uses every core
+        self.decompress_workers: Optional[int] = None
         self.current_archive_path: Optional[str] = None
+        self.search_dialog: Optional[globalSearch.GlobalSearchDialog] = None
+        # Background open in progress, if any
+        self.loader: Optional[archiveLoader.ArchiveLoader] = None
+        self.texture_grid: Optional[textureGrid.TextureGridDialog] = None
+        self.content_search: Optional[contentSearchDialog.ContentSearchDialog] = None
+        # Built previews, plus a thread filling it with the neighbours of the current item
+        self.preview_cache = previewCache.PreviewCache(previewCache.DEFAULT_PREVIEW_CACHE_BYTES)
+        self.prefetcher = previewCache.Prefetcher(self.preview_cache)
 
         central = QWidget(self); self.setCentralWidget(central)
         main_layout = QVBoxLayout(central); splitter = QSplitter(Qt.Horizontal)
 
-        #self.tree = QTreeWidget(); self.tree.setHeaderHidden(True)
-        #self.tree.setColumnCount(1)
-        self.tree = QTreeWidget()
-        self.tree.setColumnCount(3)
-        self.tree.setHeaderLabels(["Name", "Size", "Type"])
+        # Lazily populated model, filtered through a name index
+        self.tree_model = archiveModel.ArchiveTreeModel(self)
+        self.tree = QTreeView()
+        self.tree.setModel(self.tree_model)
+        self.tree.setUniformRowHeights(True)
         self.tree.setSortingEnabled(True)
         self.tree.sortByColumn(0, Qt.AscendingOrder)
-        
-        self.tree.itemClicked.connect(self.on_item_clicked)
+        # Follows the current item, so arrow keys preview too
+        self.tree.selectionModel().currentChanged.connect(lambda current, _previous: self.on_item_clicked(current))
         self.tree.setContextMenuPolicy(Qt.CustomContextMenu)
         self.tree.customContextMenuRequested.connect(self.on_context_menu)
 
+        self.filter_edit = QLineEdit(); self.filter_edit.setPlaceholderText("Filter (substring, or glob with * and ?)")
+        self.filter_edit.setClearButtonEnabled(True)
+        self._filter_timer = QTimer(self); self._filter_timer.setSingleShot(True); self._filter_timer.setInterval(120)
+        self._filter_timer.timeout.connect(self.apply_filter)
+        self.filter_edit.textChanged.connect(lambda _t: self._filter_timer.start())
+
         left_widget = QWidget(); left_layout = QVBoxLayout(left_widget)
+        left_layout.addWidget(self.filter_edit)
         left_layout.addWidget(self.tree)
         self.export_all_btn = QPushButton("Export All"); self.export_all_btn.setEnabled(False)
         self.export_all_btn.clicked.connect(self.export_all)
@@ -142,6 +259,18 @@ class ZombiManager(QMainWindow):
         main_layout.addWidget(splitter)
 
         self.setMenuBar(self._make_menu()); self.setStatusBar(QStatusBar())
+        self.load_bar = QProgressBar(); self.load_bar.setMaximumWidth(220); self.load_bar.setFormat("%v/%m chunks")
+        self.load_bar.hide(); self.statusBar().addPermanentWidget(self.load_bar)
+
+        # Live throughput while a trace is being recorded
+        self.throughput_label = QLabel(); self.throughput_label.hide()
+        self.statusBar().addPermanentWidget(self.throughput_label)
+        self.throughput = None
+        self._throughput_timer = QTimer(self); self._throughput_timer.setInterval(1000)
+        self._throughput_timer.timeout.connect(self.update_throughput)
+        if tracing.enabled():
+            # ZOMBI_TRACE is set, the trace gets written at exit
+            self.act_trace.setChecked(True); self.start_throughput()
 
     def _apply_gray_theme(self):
         pal = self.palette()
@@ -162,10 +291,53 @@ class ZombiManager(QMainWindow):
         act_open.triggered.connect(self.on_open)
         file_menu.addAction(act_open)
 
+        act_open_lazy = QAction("Load File (On Demand)", self)
+        act_open_lazy.triggered.connect(lambda: self.on_open(lazy=True))
+        file_menu.addAction(act_open_lazy)
+
+        act_mount = QAction("Mount Archives…", self)
+        act_mount.setShortcut("Ctrl+Shift+M")
+        act_mount.triggered.connect(self.on_mount)
+        file_menu.addAction(act_mount)
+
         act_import = QAction("Import Folder → BFZ", self)
         act_import.triggered.connect(self.on_import_folder)
         file_menu.addAction(act_import)
 
+        file_menu.addSeparator()
+        act_search = QAction("Search Data Folder…", self)
+        act_search.setShortcut("Ctrl+Shift+F")
+        act_search.triggered.connect(self.on_global_search)
+        file_menu.addAction(act_search)
+
+        act_content_search = QAction("Search Contents…", self)
+        act_content_search.setShortcut("Ctrl+Shift+G")
+        act_content_search.triggered.connect(self.on_content_search)
+        file_menu.addAction(act_content_search)
+
+        file_menu.addSeparator()
+        act_export_stream = QAction("Export All to Tar/Zip…", self)
+        act_export_stream.triggered.connect(self.export_all_stream)
+        file_menu.addAction(act_export_stream)
+
+        act_export_textures = QAction("Export Textures…", self)
+        act_export_textures.triggered.connect(self.export_textures)
+        file_menu.addAction(act_export_textures)
+
+        act_texture_grid = QAction("Texture Grid…", self)
+        act_texture_grid.triggered.connect(self.on_texture_grid)
+        file_menu.addAction(act_texture_grid)
+
+        act_dupes = QAction("Duplicate Report…", self)
+        act_dupes.triggered.connect(self.on_duplicate_report)
+        file_menu.addAction(act_dupes)
+
+        file_menu.addSeparator()
+        self.act_trace = QAction("Record Performance Trace", self)
+        self.act_trace.setCheckable(True)
+        self.act_trace.toggled.connect(self.on_toggle_trace)
+        file_menu.addAction(self.act_trace)
+
         file_menu.addSeparator()
         act_exit = QAction("Exit", self)
         act_exit.triggered.connect(self.close)
@@ -174,112 +346,336 @@ class ZombiManager(QMainWindow):
         return menubar
         
     def on_import_folder(self):
-        folder = QFileDialog.getExistingDirectory(self, "Select folder to import")
+        # The folder only overrides entries, everything else comes from a base archive
+        base_path, _ = QFileDialog.getOpenFileName(self, "Select base BFZ", self.current_archive_path or "",
+                                                   "BFZ Archives (*.bfz);;All Files (*)")
+        if not base_path:
+            return
+        folder = QFileDialog.getExistingDirectory(self, "Select folder to import (laid out like Export All)")
         if not folder:
             return
         out_path, _ = QFileDialog.getSaveFileName(self, "Save BFZ as...", "", "BFZ Archive (*.bfz);;All Files (*)")
         if not out_path:
             return
+        incremental = QMessageBox.question(
+            self, "Import Folder",
+            "Only rewrite the chunks that changed?\n\n"
+            "Yes is much faster and leaves everything else byte-identical, but the archive can only grow. "
+            "No rebuilds and compacts the whole archive."
+        ) == QMessageBox.Yes
+        # Writing over the open archive: let go of it first, reopen afterwards
+        reopen = self.current_archive_path and os.path.abspath(out_path) == os.path.abspath(self.current_archive_path)
+        if reopen:
+            self.cancel_loading()
+            self.preview.clear()
+            if self.archive: self.archive.close(); self.archive = None
+            self.tree_model.clear()
         try:
             progress = QProgressDialog("Building BFZ…", "Cancel", 0, 0, self)
             progress.setWindowModality(Qt.WindowModal)
             progress.show()
             QApplication.processEvents()
-            #build_bfz_from_folder(folder, out_path)
+            result = bfzWriter.build_bfz_from_folder(
+                base_path, folder, out_path, workers=self.decompress_workers,
+                incremental=incremental, progress=qt_progress(progress)
+            )
             progress.close()
-            QMessageBox.information(self, "Done", f"Built BFZ:\n{out_path}")
+            msg = f"Built BFZ:\n{out_path}\n\n{result.replaced} entries replaced, {result.chunks} chunks compressed"
+            if incremental:
+                msg += f", {result.chunks_copied} copied as is"
+            if result.skipped:
+                msg += (f"\n\n{len(result.skipped)} files match no entry in the base archive and were skipped:\n"
+                        + "\n".join(result.skipped[:20]))
+            QMessageBox.information(self, "Done", msg)
+        except bfz.OperationCanceled:
+            QMessageBox.information(self, "Import", "Import canceled")
         except Exception as e:
             QMessageBox.critical(self, "Import error", f"Failed to build BFZ:\n{e}\n\n{traceback.format_exc()}")
-    
-    def on_open(self):
+        if reopen:
+            self.open_archive(out_path)
+
+    def on_open(self, lazy: bool = False):
         path, _ = QFileDialog.getOpenFileName(self, "Open BFZ Archive", "", "BFZ Archives (*.bfz);;All Files (*)")
         if not path: return
+        self.open_archive(path, lazy=lazy)
+
+    def open_archive(self, path: str, lazy: bool = False) -> bool:
+        self.cancel_loading()
+        if not lazy:
+            return self.open_archive_background(path)
         try:
             self.statusBar().showMessage("Parsing archive…")
             progress = QProgressDialog("Parsing…", "Cancel", 0, 0, self)
             progress.setWindowModality(Qt.WindowModal); progress.setAutoClose(True); progress.show()
             QApplication.processEvents()
-            arch = bfz.BFZArchive(path); arch.parse(progress=progress)
-            self.archive, self.current_archive_path = arch, path
-            self.populate_tree(); self.export_all_btn.setEnabled(True)
-            self.statusBar().showMessage(f"Loaded: {os.path.basename(path)} ({len(arch.file_entries)} files)")
-            self.setWindowTitle(f"ZOMBI Manager: {os.path.basename(path)} ({len(arch.file_entries)} files)")
+            self.preview.clear()
+            if self.archive: self.archive.close()
+            arch = bfz.BFZArchive(path, cache=self.chunk_cache, workers=self.decompress_workers); arch.parse(progress=qt_progress(progress), lazy=lazy)
+            progress.close()
+            self.on_tables_ready(arch, path)
+            return True
         except Exception as e:
-            self.statusBar().clearMessage(); self.export_all_btn.setEnabled(False); self.tree.clear()
-            QMessageBox.critical(self, "Error", f"Failed to load archive:\n\n{e}\n\n{traceback.format_exc()}")
-            self.setWindowTitle("ZOMBI Manager")
+            self.on_load_failed(f"{e}\n\n{traceback.format_exc()}")
+            return False
+
+    def open_archive_background(self, path: str) -> bool:
+        """Tables are parsed off the GUI thread, the tree shows up while chunks still decompress."""
+        self.preview.clear()
+        if self.archive: self.archive.close(); self.archive = None
+        self.tree_model.clear(); self.export_all_btn.setEnabled(False)
+        self.statusBar().showMessage(f"Parsing {os.path.basename(path)}…")
+        loader = archiveLoader.ArchiveLoader(path, cache=self.chunk_cache, workers=self.decompress_workers, parent=self)
+        # Signals already queued by a loader that got canceled are dropped here
+        current = lambda fn: (lambda *args: fn(*args) if self.loader is loader else None)
+        loader.tablesReady.connect(current(lambda arch: self.on_tables_ready(arch, path)))
+        loader.progress.connect(current(self.on_load_progress))
+        loader.loaded.connect(current(self.on_loaded))
+        loader.failed.connect(current(self.on_load_failed))
+        self.loader = loader
+        loader.start()
+        return True
+
+    def on_mount(self):
+        if isinstance(self.archive, archiveMount.ArchiveMount):
+            current = [mp.path for mp in self.archive.order]
+        else:
+            current = [self.current_archive_path] if self.current_archive_path else []
+        dialog = mountDialog.MountDialog(self, current)
+        if not current: dialog.on_add()  # nothing open yet, straight to picking archives
+        if dialog.exec() != mountDialog.MountDialog.Accepted or not dialog.paths(): return
+        self.mount_archives(dialog.paths())
+
+    def mount_archives(self, paths) -> bool:
+        """Open several archives as one tree, paths top priority first. Nothing is decompressed up front."""
+        self.cancel_loading()
+        self.preview.clear()
+        if self.archive: self.archive.close(); self.archive = None
+        self.tree_model.clear()
+        mount = archiveMount.ArchiveMount(cache=self.chunk_cache, workers=self.decompress_workers)
+        try:
+            progress = QProgressDialog("Mounting archives…", "Cancel", 0, len(paths), self)
+            progress.setWindowModality(Qt.WindowModal); progress.setMinimumDuration(300)
+            mount.mount_all(list(reversed(paths)), progress=qt_progress(progress))
+            progress.close()
+        except bfz.OperationCanceled:
+            mount.close(); self.export_all_btn.setEnabled(False); self.setWindowTitle("ZOMBI Manager")
+            return False
+        except Exception as e:
+            mount.close()
+            self.on_load_failed(f"{e}\n\n{traceback.format_exc()}")
+            return False
+        self.archive, self.current_archive_path = mount, None
+        self.populate_tree(); self.export_all_btn.setEnabled(True)
+        if self.texture_grid is not None: self.texture_grid.hide()
+        if self.content_search is not None: self.content_search.hide(); self.content_search.set_archive(None)
+        n = len(mount.file_entries)
+        self.statusBar().showMessage(f"Mounted {len(paths)} archives ({n} files, "
+                                     f"{int(mount.overridden().astype(bool).sum())} overridden)")
+        self.setWindowTitle(f"ZOMBI Manager: {len(paths)} archives mounted ({n} files)")
+        return True
+
+    def single_archive_only(self, what: str) -> bool:
+        """Tools that work on one archive's chunks directly, not on a mount."""
+        if isinstance(self.archive, archiveMount.ArchiveMount):
+            QMessageBox.information(self, what, f"{what} works on a single archive, open one with File -> Load File.")
+            return True
+        return False
+
+    def cancel_loading(self):
+        # Queued prefetches would read from the archive that's about to go
+        self.prefetcher.request([])
+        if self.loader is None: return
+        loader, self.loader = self.loader, None
+        loader.cancel(); loader.archive.close(); loader.deleteLater()
+        self.load_bar.hide()
+
+    def on_tables_ready(self, arch: bfz.BFZArchive, path: str):
+        self.archive, self.current_archive_path = arch, path
+        self.populate_tree(); self.export_all_btn.setEnabled(True)
+        if self.texture_grid is not None: self.texture_grid.hide()
+        if self.content_search is not None: self.content_search.set_archive(arch)
+        cached = " [cached index]" if arch.index_cache_hit else ""
+        state = "Decompressing" if arch.fill_pending else "Loaded"
+        self.statusBar().showMessage(f"{state}: {os.path.basename(path)} ({len(arch.file_entries)} files){cached}")
+        self.setWindowTitle(f"ZOMBI Manager: {os.path.basename(path)} ({len(arch.file_entries)} files)")
+
+    def on_load_progress(self, done: int, total: int):
+        self.load_bar.setRange(0, total); self.load_bar.setValue(done); self.load_bar.show()
+
+    def on_loaded(self, arch: bfz.BFZArchive):
+        self.load_bar.hide(); self.tree_model.refresh_hashes(); self.tree_model.refresh_types()
+        if self.loader is not None: self.loader.deleteLater(); self.loader = None
+        self.statusBar().showMessage(f"Loaded: {os.path.basename(arch.path)} ({len(arch.file_entries)} files)", 5000)
+
+    def on_load_failed(self, message: str):
+        self.load_bar.hide()
+        if self.loader is not None: self.loader.deleteLater(); self.loader = None
+        self.statusBar().clearMessage(); self.export_all_btn.setEnabled(False); self.tree_model.clear()
+        QMessageBox.critical(self, "Error", f"Failed to load archive:\n\n{message}")
+        self.setWindowTitle("ZOMBI Manager")
 
-    def populate_tree(self):
-        self.tree.clear()
-        if not self.archive:
+    # ----- tracing -----
+    def on_toggle_trace(self, on: bool):
+        if on:
+            tracing.enable(); self.start_throughput()
+            self.statusBar().showMessage("Recording performance trace…", 3000)
             return
-
-        root_map: Dict[str, QTreeWidgetItem] = {}
-        grouped: Dict[str, list] = {}
-
-        # Normalize the path
-        for entry in self.archive.file_entries:
-            path = entry.name.replace("\\", "/").strip("/")
-            grouped.setdefault(path, []).append(entry)
-
-        for path, entries in grouped.items():
-            parts = [p for p in path.split("/") if p]
-            if not parts:
-                continue
-
-            parent_item, cur_map = None, root_map
-            for i, part in enumerate(parts):
-                is_leaf = (i == len(parts) - 1)
-                key = (id(parent_item), part)
-                if key not in cur_map:
-                    if is_leaf:
-                        # This will be the base entry, if theres multiple, it will be the parent
-                        size_str = f"{entries[0].size:,}"
-                        ext = os.path.splitext(entries[0].name)[1].lower() or "-"
-                        cols = [part, size_str, ext]
-                    else:
-                        cols = [part, "", ""]
-                    item = QTreeWidgetItem(cols)
-                    (self.tree.addTopLevelItem if parent_item is None else parent_item.addChild)(item)
-                    cur_map[key] = item
-
-                item = cur_map[key]
-                parent_item = item
-
-                # Make sub items for duplicates
-                if is_leaf:
-                    if len(entries) == 1:
-                        item.setData(0, Qt.UserRole, entries[0])
-                    else:
-                        for idx, dup_entry in enumerate(entries):
-                            sub = QTreeWidgetItem([
-                                f"[Variant #{idx+1}]",
-                                f"{dup_entry.size:,}",
-                                os.path.splitext(dup_entry.name)[1].lower() or "-"
-                            ])
-                            sub.setData(0, Qt.UserRole, dup_entry)
-                            item.addChild(sub)
+        if not tracing.enabled():
+            return
+        tracing.disable(); self._throughput_timer.stop(); self.throughput_label.hide()
+        path, _ = QFileDialog.getSaveFileName(self, "Save trace", "zombi-trace.json", "Chrome trace (*.json)")
+        if not path: return
+        try:
+            n = tracing.write_trace(path)
+        except OSError as e:
+            QMessageBox.critical(self, "Error", f"Failed to write trace:\n{e}"); return
+        self.statusBar().showMessage(f"Trace written: {path} ({n:,} events), open it in chrome://tracing", 8000)
+
+    def start_throughput(self):
+        self.throughput = tracing.Throughput()
+        self.throughput_label.setText("idle"); self.throughput_label.show()
+        self._throughput_timer.start()
+
+    def update_throughput(self):
+        rates = self.throughput.sample()
+        parts = [f"{label} {rates[key] / 1e6:,.0f} MB/s" for key, label in
+                 (("lzo out", "LZO"), ("read", "read"), ("export", "export")) if rates.get(key)]
+        self.throughput_label.setText(" · ".join(parts) or "idle")
+
+    def closeEvent(self, event):
+        if self.content_search is not None: self.content_search.stop()
+        self.cancel_loading(); self.prefetcher.close()
+        if self.archive: self.archive.close()
+        super().closeEvent(event)
+
+    def on_global_search(self):
+        if self.search_dialog is None:
+            data_dir = os.path.dirname(self.current_archive_path) if self.current_archive_path else ""
+            self.search_dialog = globalSearch.GlobalSearchDialog(self, data_dir)
+            self.search_dialog.openRequested.connect(self.on_search_result)
+        self.search_dialog.show(); self.search_dialog.raise_()
+
+    def on_search_result(self, archive_path: str, name: str):
+        if os.path.abspath(archive_path) != os.path.abspath(self.current_archive_path or ""):
+            # Only the one entry is wanted, don't unpack the whole archive for it
+            if not self.open_archive(archive_path, lazy=True): return
+        self.select_entry(name)
+
+    def select_entry(self, name: str):
+        if self.tree_model.matched_paths is not None:
+            self.filter_edit.clear(); self.apply_filter()
+        index = self.tree_model.index_for_path(name)
+        if not index.isValid(): return
+        if index == self.tree.currentIndex(): self.on_item_clicked(index)
+        else: self.tree.setCurrentIndex(index)
+        self.tree.scrollTo(index)
+
+    @tracing.traced("populate_tree", "gui")
+    def populate_tree(self):
+        self.tree_model.set_archive(self.archive)
+        self.apply_filter()
 
         # Size it
         self.tree.setColumnWidth(0, 400)
         self.tree.setColumnWidth(1, 100)
         self.tree.setColumnWidth(2, 100)
-        self.tree.sortItems(0, Qt.AscendingOrder)
-        self.tree.expandToDepth(2)
-        
-    def on_item_clicked(self, item: QTreeWidgetItem, col: int):
-        entry = item.data(0, Qt.UserRole)
+        if self.tree_model.columnCount() > archiveModel.COL_SOURCE:
+            self.tree.setColumnWidth(archiveModel.COL_SOURCE, 140)
+        # Expanding loads the nodes, keep it to the top level on big archives
+        self.tree.expandToDepth(2 if len(self.tree_model.index_.paths) <= 20000 else 0)
+
+    def apply_filter(self):
+        count = self.tree_model.set_pattern(self.filter_edit.text())
+        if count < 0:
+            return
+        # Open up the matches, as long as that doesn't mean loading half the archive
+        if count <= 2000:
+            self.tree.expandAll()
+        self.statusBar().showMessage(f"{count:,} matching files")
+
+    def on_content_search(self):
+        if self.single_archive_only("Search Contents"): return
+        if self.content_search is None:
+            self.content_search = contentSearchDialog.ContentSearchDialog(self)
+            self.content_search.matchesChanged.connect(self.apply_content_filter)
+            self.content_search.hitActivated.connect(self.on_content_hit)
+            self.content_search.set_archive(self.archive)
+        self.content_search.show(); self.content_search.raise_()
+
+    def apply_content_filter(self, entries):
+        # The model gets reset, keep the current entry selected if it still matches
+        current = self.tree_model.entry_for(self.tree.currentIndex())
+        count = self.tree_model.set_content_filter(entries)
+        if 0 <= count <= 2000:
+            self.tree.expandAll()
+        if current is not None:
+            index = self.tree_model.index_for_entry(current.index)
+            if index.isValid():
+                self.tree.selectionModel().blockSignals(True)
+                self.tree.setCurrentIndex(index)
+                self.tree.selectionModel().blockSignals(False)
+        if count >= 0:
+            self.statusBar().showMessage(f"{count:,} files with matching contents")
+
+    def on_content_hit(self, entry: int, offset: int, length: int):
+        if not self.archive: return
+        index = self.tree_model.index_for_entry(entry)
+        if not index.isValid(): return
+        if index == self.tree.currentIndex(): self.on_item_clicked(index)
+        else: self.tree.setCurrentIndex(index)
+        self.tree.scrollTo(index)
+        try:
+            self.preview.hex_view.goto(offset, length)
+        except ValueError:
+            pass
+
+    def preview_key(self, entry: bfz.BFZFileEntry):
+        return (self.archive.entry_key(entry), os.path.splitext(entry.name)[1].lower())
+
+    def on_item_clicked(self, index: QModelIndex):
+        entry = self.tree_model.entry_for(index)
         if not entry or not self.archive: self.preview.clear(); return
         try:
-            data = self.archive.read_file_bytes(entry)
-            self.preview.preview_bytes(entry.name, data)
+            key, data = self.preview_key(entry), self.archive.read_file_view(entry)
+            preview = self.preview_cache.get(key)
+            if preview is None:
+                preview = previewCache.build_preview(entry.name, data)
+                self.preview_cache.put(key, preview)
+            self.preview.show_preview(entry.name, preview, data)
+        except Exception as e:
+            QMessageBox.critical(self, "Preview error", f"Failed to read file bytes:\n{e}")
+            return
+        if isinstance(self.archive, archiveMount.ArchiveMount):
+            prov = self.archive.provenance(entry.index)
+            over = f", overrides {', '.join(mp.name for mp, _ in prov[1:])}" if len(prov) > 1 else ""
+            self.statusBar().showMessage(f"From {prov[0][0].name}{over}")
+        self.prefetch_around(index)
+
+    def preview_from(self, mp: archiveMount.MountPoint, local: int):
+        """Show the copy of an entry that one mounted archive has, overridden or not."""
+        entry = mp.entry(local)
+        try:
+            data = mp.archive.read_file_view(entry)
+            self.preview.show_preview(f"{entry.name} ({mp.name})", previewCache.build_preview(entry.name, data), data)
         except Exception as e:
             QMessageBox.critical(self, "Preview error", f"Failed to read file bytes:\n{e}")
 
+    def prefetch_around(self, index: QModelIndex, count: int = 4):
+        """Build the previews of the rows just below and above in the background, nearest first."""
+        below, above, jobs = index, index, []
+        for _ in range(count):
+            below, above = self.tree.indexBelow(below), self.tree.indexAbove(above)
+            for i in (below, above):
+                entry = self.tree_model.entry_for(i)
+                if entry is not None:
+                    jobs.append((self.preview_key(entry), entry.name,
+                                 lambda arch=self.archive, e=entry: arch.read_file_view(e)))
+        self.prefetcher.request(jobs)
+
     def on_context_menu(self, pos):
-        item = self.tree.itemAt(pos)
-        if not item: return
-        entry = item.data(0, Qt.UserRole)
+        index = self.tree.indexAt(pos)
+        if not index.isValid(): return
+        entry = self.tree_model.entry_for(index)
         if not entry: return
         menu = QMenu()
         act_export = QAction("Export File...", self)
@@ -287,26 +683,34 @@ class ZombiManager(QMainWindow):
         act_export_raw = QAction("Export Raw File...", self)
         act_export_raw.triggered.connect(lambda: self.export_single(entry, raw=True))
         menu.addAction(act_export); menu.addAction(act_export_raw)
-        if entry.name.lower().endswith(".tdt"):
-            act_export_png = QAction("Export as PNG...", self)
-            act_export_png.triggered.connect(lambda: textureFile.export_tdt_as_png(entry))
-            menu.addAction(act_export_png)
+        fmt = formats.entry_format(self.archive, entry.index)
+        if fmt.convert:
+            act_export.setText(f"Export as {fmt.convert_ext[1:].upper()}...")
+        if isinstance(self.archive, archiveMount.ArchiveMount):
+            prov = self.archive.provenance(entry.index)
+            if len(prov) > 1:
+                sub = menu.addMenu("Preview From")
+                for n, (mp, locals_) in enumerate(prov):
+                    act = sub.addAction(mp.name + (" (used)" if n == 0 else ""))
+                    act.triggered.connect(lambda _checked=False, mp=mp, local=locals_[0]: self.preview_from(mp, local))
         menu.exec(self.tree.mapToGlobal(pos))
 
     def export_single(self, entry: bfz.BFZFileEntry, raw: bool = False):
         if not self.archive: return
+        fmt = formats.UNKNOWN if raw else formats.entry_format(self.archive, entry.index)
         default_name = os.path.basename(entry.name) or "file.bin"
+        if fmt.convert:
+            default_name = os.path.splitext(default_name)[0] + fmt.convert_ext
         path, _ = QFileDialog.getSaveFileName(self, "Export file", default_name)
         if not path: return
         try:
-            data = self.archive.read_file_bytes(entry)
-            if (not raw) and entry.name.lower().endswith(".son"):
-                wav = previewers.extract_wav_from_son(data)
-                if wav:
-                    out_path = path if path.lower().endswith(".wav") else path + ".wav"
-                    with open(out_path, "wb") as w: w.write(wav)
-                    QMessageBox.information(self, "Exported", f"Exported embedded WAV to:\n{out_path}")
-                    return
+            data = self.archive.read_file_view(entry)
+            converted = formats.convert(fmt, data)
+            if converted:
+                out_path = path if path.lower().endswith(fmt.convert_ext) else path + fmt.convert_ext
+                with open(out_path, "wb") as w: w.write(converted)
+                QMessageBox.information(self, "Exported", f"Exported {fmt.label} as {fmt.convert_ext[1:].upper()}:\n{out_path}")
+                return
             with open(path, "wb") as w: w.write(data)
             QMessageBox.information(self, "Exported", f"Exported to:\n{path}")
         except Exception as e:
@@ -316,21 +720,135 @@ class ZombiManager(QMainWindow):
         if not self.archive: return
         dir_ = QFileDialog.getExistingDirectory(self, "Select output directory")
         if not dir_: return
+        convert = QMessageBox.question(
+            self, "Export All", "Convert .son to .wav and .tdt to .png while exporting?"
+        ) == QMessageBox.Yes
         try:
             progress = QProgressDialog("Exporting all…", "Cancel", 0, len(self.archive.file_entries), self)
             progress.setWindowModality(Qt.WindowModal); progress.show()
             QApplication.processEvents()
-            for i, entry in enumerate(self.archive.file_entries):
-                data = self.archive.read_file_bytes(entry)
-                out_path = os.path.join(dir_, entry.name.replace("\\", "/"))
-                os.makedirs(os.path.dirname(out_path), exist_ok=True)
-                with open(out_path, "wb") as w: w.write(data)
-                progress.setValue(i+1); QApplication.processEvents()
-                if progress.wasCanceled(): break
-            progress.close(); QMessageBox.information(self, "Done", f"Exported {len(self.archive.file_entries)} files")
+            result = exporter.export_entries(
+                self.archive, dir_, convert=convert, progress=qt_progress(progress)
+            )
+            progress.close()
+            msg = (f"Exported {result.written} files ({result.converted} converted), "
+                   f"{result.linked + result.manifest} duplicates")
+            if result.manifest:
+                msg += f"\n{result.manifest} duplicates listed in {exporter.MANIFEST_NAME}"
+            if result.errors:
+                msg += f"\n\n{len(result.errors)} errors:\n" + "\n".join(result.errors[:20])
+            QMessageBox.information(self, "Done", msg)
+        except bfz.OperationCanceled:
+            QMessageBox.information(self, "Export", "Export canceled")
         except Exception as e:
             QMessageBox.critical(self, "Export error", f"Failed to export all:\n{e}\n\n{traceback.format_exc()}")
 
+    def export_all_stream(self):
+        if not self.archive or self.single_archive_only("Export All to Tar/Zip"): return
+        from utilities import streamExport
+        stem = os.path.splitext(os.path.basename(self.archive.path))[0]
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Export all to", f"{stem}.tar",
+            "Tar (*.tar);;Zstandard tar (*.tar.zst);;Gzip tar (*.tar.gz);;Zip (*.zip)")
+        if not path: return
+        try:
+            streamExport.stream_format(path)
+        except ValueError as e:
+            QMessageBox.warning(self, "Export", str(e)); return
+        try:
+            progress = QProgressDialog("Exporting all…", "Cancel", 0, len(self.archive.file_entries), self)
+            progress.setWindowModality(Qt.WindowModal); progress.show()
+            QApplication.processEvents()
+            result = streamExport.export_stream(self.archive, path, progress=qt_progress(progress))
+            progress.close()
+            msg = f"Wrote {result.written} files ({result.bytes_written:,} bytes) to {os.path.basename(path)}"
+            if result.linked:
+                msg += f"\n{result.linked} duplicates stored as hardlinks"
+            if result.manifest:
+                msg += f"\n{result.manifest} duplicates listed in {exporter.MANIFEST_NAME}"
+            QMessageBox.information(self, "Done", msg)
+        except bfz.OperationCanceled:
+            QMessageBox.information(self, "Export", "Export canceled")
+        except Exception as e:
+            QMessageBox.critical(self, "Export error", f"Failed to export:\n{e}\n\n{traceback.format_exc()}")
+
+    def export_textures(self):
+        if not self.archive: return
+        from utilities import textureExport
+        dir_ = QFileDialog.getExistingDirectory(self, "Select output directory")
+        if not dir_: return
+        box = QMessageBox(QMessageBox.Question, "Export Textures", "Export every .tdt as:", parent=self)
+        png_btn = box.addButton("PNG", QMessageBox.AcceptRole); dds_btn = box.addButton("DDS", QMessageBox.AcceptRole)
+        box.addButton(QMessageBox.Cancel); box.exec()
+        if box.clickedButton() not in (png_btn, dds_btn): return
+        kind = "png" if box.clickedButton() is png_btn else "dds"
+        try:
+            progress = QProgressDialog("Exporting textures…", "Cancel", 0, 0, self)
+            progress.setWindowModality(Qt.WindowModal); progress.show()
+            QApplication.processEvents()
+            result = textureExport.export_textures(
+                self.archive, dir_, kind=kind, thumbnails=True, progress=qt_progress(progress)
+            )
+            progress.close()
+            msg = f"Exported {result.written} textures as {kind.upper()}"
+            if result.errors:
+                msg += f"\n\n{len(result.errors)} errors:\n" + "\n".join(result.errors[:20])
+            QMessageBox.information(self, "Done", msg)
+        except bfz.OperationCanceled:
+            QMessageBox.information(self, "Export", "Export canceled")
+        except Exception as e:
+            QMessageBox.critical(self, "Export error", f"Failed to export textures:\n{e}\n\n{traceback.format_exc()}")
+
+    def on_texture_grid(self):
+        if not self.archive: return
+        from utilities import textureExport
+        from utilities import textureGrid
+        try:
+            progress = QProgressDialog("Rendering thumbnails…", "Cancel", 0, 0, self)
+            progress.setWindowModality(Qt.WindowModal); progress.setMinimumDuration(500)
+            thumbs = textureExport.make_thumbnails(self.archive, progress=qt_progress(progress))
+            progress.close()
+        except bfz.OperationCanceled:
+            return
+        except Exception as e:
+            QMessageBox.critical(self, "Texture error", f"Failed to render thumbnails:\n{e}\n\n{traceback.format_exc()}")
+            return
+        if self.texture_grid is None:
+            self.texture_grid = textureGrid.TextureGridDialog(self)
+            self.texture_grid.entryActivated.connect(self.select_entry)
+        self.texture_grid.set_thumbnails(self.archive, thumbs)
+        self.texture_grid.show(); self.texture_grid.raise_()
+
+    def on_duplicate_report(self):
+        if not self.archive: return
+        try:
+            progress = QProgressDialog("Hashing entries…", "Cancel", 0, 0, self)
+            progress.setWindowModality(Qt.WindowModal); progress.setMinimumDuration(500)
+            hashes = contentHash.hash_archive(self.archive, progress=qt_progress(progress))
+            progress.close()
+        except bfz.OperationCanceled:
+            return
+        except Exception as e:
+            QMessageBox.critical(self, "Hash error", f"Failed to hash entries:\n{e}\n\n{traceback.format_exc()}")
+            return
+        self.tree_model.refresh_hashes()
+        if isinstance(self.archive, archiveMount.ArchiveMount):
+            # Listed under the archive each entry really comes from
+            paths = {os.path.abspath(mp.path) for mp in self.archive.mounts}
+            rows = self.archive.hash_rows(hashes)
+        else:
+            path = self.current_archive_path or self.archive.path
+            paths = {os.path.abspath(path)}
+            rows = contentHash.archive_rows(path, self.archive, hashes)
+        # Other archives from the Data folder index, if one was built (Search Data Folder)
+        db_path = assetIndex.default_db_path()
+        if os.path.exists(db_path):
+            rows += [r for r in assetIndex.duplicate_rows(db_path) if os.path.abspath(r[0]) not in paths]
+        groups = contentHash.duplicate_groups(rows)
+        report = contentHash.format_report(groups, top=200)
+        box = QMessageBox(QMessageBox.Information, "Duplicate Report", report.split("\n", 1)[0], parent=self)
+        box.setDetailedText(report); box.exec()
+
 # ----------------- Main -----------------
 
 def main():